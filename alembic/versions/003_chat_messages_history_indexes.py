@@ -0,0 +1,39 @@
+"""index chat_messages for history paging and content search
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "003"
+down_revision: Union[str, None] = "002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Covers lookups by session_id too, so the single-column index goes
+    op.create_index(
+        "ix_chat_messages_session_id_timestamp",
+        "chat_messages",
+        ["session_id", "timestamp", "id"],
+    )
+    op.drop_index("ix_chat_messages_session_id", table_name="chat_messages")
+    op.create_index(
+        "ix_chat_messages_content_tsv",
+        "chat_messages",
+        [sa.text("to_tsvector('simple', content)")],
+        postgresql_using="gin",
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_chat_messages_content_tsv", table_name="chat_messages")
+    op.create_index("ix_chat_messages_session_id", "chat_messages", ["session_id"])
+    op.drop_index("ix_chat_messages_session_id_timestamp", table_name="chat_messages")
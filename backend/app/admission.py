@@ -0,0 +1,267 @@
+"""
+Admission control for the AI endpoints
+
+Every AI request holds a slot of its route class (chat, stream) and of the
+shared upstream limiter for as long as it runs, streamed bodies included.
+Requests beyond the limit wait in a bounded FIFO queue; when the queue is
+full, or the wait takes too long, they are turned away with 503 and a
+Retry-After estimate instead of piling up upstream connections. A token
+bucket per client IP answers 429 to clients sending too fast.
+"""
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+
+from fastapi import HTTPException, Request
+
+from backend.app.config import EnvSettings
+
+
+class AdmissionSettings(EnvSettings):
+    """Admission control and rate limiting"""
+
+    # AI接口并发与限流配置
+    ai_max_concurrent_chat: int = 32
+    ai_max_concurrent_stream: int = 32
+    ai_max_concurrent_batch: int = 4
+    # Shared by both route classes, bounds the connections opened to the provider
+    ai_max_concurrent_upstream: int = 48
+    ai_admission_queue_size: int = 64
+    ai_admission_queue_timeout: float = 10.0
+
+    rate_limit_enabled: bool = True
+    rate_limit_per_minute: float = 30.0
+    rate_limit_burst: int = 10
+    rate_limit_max_keys: int = 10000
+
+
+admission_settings = AdmissionSettings()
+
+# Recent waits kept per limiter for the percentile in the stats
+WAIT_SAMPLES = 1000
+
+
+def _rejection(status_code: int, detail: str, retry_after: float) -> HTTPException:
+    return HTTPException(
+        status_code=status_code,
+        detail=detail,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+class ConcurrencyLimiter:
+    """Semaphore with a bounded FIFO wait queue and wait-time statistics"""
+
+    def __init__(self, name: str, limit: int, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.max_queue_depth = 0
+        self.waits_ms: Deque[float] = deque(maxlen=WAIT_SAMPLES)
+        # Moving average of how long a slot is held, used for Retry-After
+        self.hold_seconds = 1.0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> float:
+        """Seconds until the current queue has likely drained"""
+        return self.hold_seconds * (self.queue_depth + 1) / max(self.limit, 1)
+
+    async def acquire(self) -> None:
+        started = time.perf_counter()
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+        else:
+            if len(self._waiters) >= self.max_queue:
+                self.rejected += 1
+                raise _rejection(503, f"{self.name} is at capacity", self.retry_after())
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            self.max_queue_depth = max(self.max_queue_depth, len(self._waiters))
+            try:
+                # The releasing request hands its slot over by resolving the future
+                await asyncio.wait_for(waiter, self.queue_timeout)
+            except asyncio.TimeoutError:
+                self._abandon(waiter)
+                self.timed_out += 1
+                raise _rejection(503, f"Timed out waiting for {self.name}", self.retry_after())
+            except asyncio.CancelledError:
+                self._abandon(waiter)
+                raise
+        self.admitted += 1
+        self.waits_ms.append((time.perf_counter() - started) * 1000)
+
+    def _abandon(self, waiter: asyncio.Future) -> None:
+        if waiter.done() and not waiter.cancelled():
+            # The slot was handed over just as the waiter gave up
+            self.release()
+        else:
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                pass
+
+    def release(self, held_seconds: Optional[float] = None) -> None:
+        if held_seconds is not None:
+            self.hold_seconds += 0.2 * (held_seconds - self.hold_seconds)
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        await self.acquire()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(time.perf_counter() - started)
+
+    def stats(self) -> Dict[str, Any]:
+        waits = sorted(self.waits_ms)
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "wait_ms_p50": round(waits[len(waits) // 2], 1) if waits else 0.0,
+            "wait_ms_p95": round(waits[int(len(waits) * 0.95)], 1) if waits else 0.0,
+            "wait_ms_max": round(waits[-1], 1) if waits else 0.0,
+        }
+
+
+@dataclass
+class _Bucket:
+    tokens: float
+    updated: float
+
+
+class TokenBucketLimiter:
+    """Token bucket per key (client IP), least recently seen keys evicted"""
+
+    def __init__(self, rate_per_minute: float, burst: int, max_keys: int):
+        self.rate = rate_per_minute / 60
+        self.burst = burst
+        self.max_keys = max_keys
+        self.buckets: "OrderedDict[str, _Bucket]" = OrderedDict()
+        self.allowed = 0
+        self.limited = 0
+
+    def check(self, key: str) -> None:
+        """Take one token for ``key`` or raise 429 with the time until the next one"""
+        now = time.monotonic()
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = _Bucket(tokens=self.burst, updated=now)
+            self.buckets[key] = bucket
+            if len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(key)
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+            bucket.updated = now
+
+        if bucket.tokens < 1:
+            self.limited += 1
+            raise _rejection(429, "Too many requests", (1 - bucket.tokens) / self.rate)
+        bucket.tokens -= 1
+        self.allowed += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": admission_settings.rate_limit_enabled,
+            "keys": len(self.buckets),
+            "allowed": self.allowed,
+            "limited": self.limited,
+        }
+
+
+route_limiters = {
+    "chat": ConcurrencyLimiter(
+        "chat",
+        admission_settings.ai_max_concurrent_chat,
+        admission_settings.ai_admission_queue_size,
+        admission_settings.ai_admission_queue_timeout,
+    ),
+    "stream": ConcurrencyLimiter(
+        "stream",
+        admission_settings.ai_max_concurrent_stream,
+        admission_settings.ai_admission_queue_size,
+        admission_settings.ai_admission_queue_timeout,
+    ),
+    "batch": ConcurrencyLimiter(
+        "batch",
+        admission_settings.ai_max_concurrent_batch,
+        admission_settings.ai_admission_queue_size,
+        admission_settings.ai_admission_queue_timeout,
+    ),
+}
+upstream_limiter = ConcurrencyLimiter(
+    "upstream",
+    admission_settings.ai_max_concurrent_upstream,
+    admission_settings.ai_admission_queue_size,
+    admission_settings.ai_admission_queue_timeout,
+)
+client_rate_limiter = TokenBucketLimiter(
+    admission_settings.rate_limit_per_minute,
+    admission_settings.rate_limit_burst,
+    admission_settings.rate_limit_max_keys,
+)
+
+
+def rate_limit_key(request: Request) -> str:
+    """The client IP of a request
+
+    Not the session ID: clients choose it, so a new one per request would get a
+    fresh bucket every time. Behind a reverse proxy, run uvicorn with
+    ``--proxy-headers`` so the IP is the client's and not the proxy's.
+    """
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+
+def admission(route_class: str, upstream: bool = True):
+    """Dependency factory admitting a request to an AI route class
+
+    The slots are held until the response is complete, since FastAPI runs the
+    code after ``yield`` only once a streamed body has been sent. Routes making
+    several upstream calls per request pass ``upstream=False`` and take an
+    upstream slot per call instead.
+    """
+
+    async def admit(request: Request) -> AsyncIterator[None]:
+        if admission_settings.rate_limit_enabled:
+            client_rate_limiter.check(rate_limit_key(request))
+        async with route_limiters[route_class].slot():
+            if not upstream:
+                yield
+                return
+            async with upstream_limiter.slot():
+                yield
+
+    return admit
+
+
+def admission_stats() -> Dict[str, Any]:
+    return {
+        "routes": {name: limiter.stats() for name, limiter in route_limiters.items()},
+        "upstream": upstream_limiter.stats(),
+        "rate_limit": client_rate_limiter.stats(),
+    }
@@ -0,0 +1,59 @@
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, Iterable, TypeVar
+
+from backend.app.config import EnvSettings
+
+
+class BatchSettings(EnvSettings):
+    """Batch chat endpoint"""
+
+    # 批量对话配置
+    # Upstream calls in flight per batch request, by default and at most
+    chat_batch_concurrency: int = 8
+    chat_batch_max_concurrency: int = 32
+    chat_batch_max_items: int = 500
+
+
+batch_settings = BatchSettings()
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+_WORKER_DONE = object()
+
+
+async def map_unordered(
+    items: Iterable[T], fn: Callable[[T], Awaitable[R]], concurrency: int
+) -> AsyncIterator[R]:
+    """Run ``fn`` over ``items`` with at most ``concurrency`` calls in flight
+
+    Results are yielded in completion order. Workers pull the next item only
+    after handing over their result, so a slow consumer pauses the batch
+    instead of buffering it; closing the iterator cancels the workers.
+    """
+    iterator = iter(items)
+    results: asyncio.Queue = asyncio.Queue(maxsize=concurrency)
+
+    async def worker() -> None:
+        try:
+            for item in iterator:
+                await results.put(await fn(item))
+        except Exception as e:
+            await results.put(e)
+        await results.put(_WORKER_DONE)
+
+    workers = [asyncio.create_task(worker()) for _ in range(max(1, concurrency))]
+    try:
+        running = len(workers)
+        while running:
+            result = await results.get()
+            if result is _WORKER_DONE:
+                running -= 1
+            elif isinstance(result, Exception):
+                raise result
+            else:
+                yield result
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
@@ -0,0 +1,264 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert
+
+from backend.app.config import EnvSettings
+from backend.app.db import async_session_maker
+from backend.app.models import ChatResponseCache
+
+logger = logging.getLogger(__name__)
+
+
+class ChatCacheSettings(EnvSettings):
+    """Response cache of /chat"""
+
+    # /chat 响应缓存配置
+    chat_cache_enabled: bool = True
+    chat_cache_ttl_seconds: float = 3600.0
+    chat_cache_max_entries: int = 1000
+    chat_cache_max_bytes: int = 16 * 1024 * 1024
+    # Shared PostgreSQL tier so that all workers and pods see each other's entries
+    chat_cache_db_enabled: bool = False
+    chat_cache_db_max_rows: int = 100000
+    chat_cache_maintenance_interval: float = 300.0
+
+
+chat_cache_settings = ChatCacheSettings()
+
+# Chunk size used when replaying a cached answer on /chat/stream
+REPLAY_CHUNK_CHARS = 64
+
+
+def cache_key(model: str, messages: List[Dict[str, Any]], max_tokens: int) -> str:
+    """Canonical hash of everything that determines an upstream completion"""
+    canonical = json.dumps(
+        {"model": model, "messages": messages, "max_tokens": max_tokens},
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def replay_chunks(text: str, size: int = REPLAY_CHUNK_CHARS) -> List[str]:
+    """Split a cached answer into stream-sized chunks"""
+    return [text[i : i + size] for i in range(0, len(text), size)] or [""]
+
+
+class LRUCache:
+    """In-process LRU with per-entry TTL, bounded by entry count and total bytes"""
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.entries: "OrderedDict[str, Tuple[str, float, int]]" = OrderedDict()
+        self.bytes = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at, _ = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key: str, value: str, ttl_seconds: Optional[float] = None) -> None:
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        if key in self.entries:
+            self._remove(key)
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        self.entries[key] = (value, time.monotonic() + ttl, size)
+        self.bytes += size
+        while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+            oldest = next(iter(self.entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        _, _, size = self.entries.pop(key)
+        self.bytes -= size
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.bytes = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+class ResponseCache:
+    """Two-tier exact-match cache for chat completions: memory LRU, then PostgreSQL"""
+
+    def __init__(
+        self,
+        *,
+        max_entries: int = chat_cache_settings.chat_cache_max_entries,
+        max_bytes: int = chat_cache_settings.chat_cache_max_bytes,
+        ttl_seconds: float = chat_cache_settings.chat_cache_ttl_seconds,
+        db_enabled: bool = chat_cache_settings.chat_cache_db_enabled,
+        db_max_rows: int = chat_cache_settings.chat_cache_db_max_rows,
+        session_factory=async_session_maker,
+    ):
+        self.memory = LRUCache(max_entries, max_bytes, ttl_seconds)
+        self.ttl_seconds = ttl_seconds
+        self.db_enabled = db_enabled
+        self.db_max_rows = db_max_rows
+        self.session_factory = session_factory
+        self.hits = {"memory": 0, "db": 0}
+        self.misses = 0
+        self._pending_writes: set = set()
+
+    async def get(self, key: str) -> Optional[str]:
+        value, tier = await self._lookup(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits[tier] += 1
+        return value
+
+    async def peek(self, key: str) -> Optional[str]:
+        """Like get(), without counting a hit or miss, for lookups that are not requests"""
+        value, _ = await self._lookup(key)
+        return value
+
+    async def _lookup(self, key: str) -> Tuple[Optional[str], Optional[str]]:
+        """The cached value and the tier it was found in"""
+        value = self.memory.get(key)
+        if value is not None:
+            return value, "memory"
+
+        if self.db_enabled:
+            entry = await self._db_get(key)
+            if entry is not None:
+                value, expires_at = entry
+                # Promote into the local tier for the remaining lifetime only
+                remaining = (expires_at - datetime.utcnow()).total_seconds()
+                self.memory.put(key, value, ttl_seconds=remaining)
+                return value, "db"
+
+        return None, None
+
+    async def put(self, key: str, model: str, value: str) -> None:
+        self.memory.put(key, value)
+        if self.db_enabled:
+            # Shared-tier writes stay off the response path
+            task = asyncio.create_task(self._db_put(key, model, value))
+            self._pending_writes.add(task)
+            task.add_done_callback(self._pending_writes.discard)
+
+    async def _db_get(self, key: str) -> Optional[Tuple[str, datetime]]:
+        try:
+            async with self.session_factory() as session:
+                result = await session.execute(
+                    select(ChatResponseCache.response, ChatResponseCache.expires_at).where(
+                        ChatResponseCache.key == key,
+                        ChatResponseCache.expires_at > datetime.utcnow(),
+                    )
+                )
+                row = result.first()
+        except Exception as e:
+            logger.warning(f"Response cache lookup failed: {type(e).__name__}: {e}")
+            return None
+        return (row.response, row.expires_at) if row else None
+
+    async def _db_put(self, key: str, model: str, value: str) -> None:
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=self.ttl_seconds)
+        statement = insert(ChatResponseCache).values(
+            key=key, model=model, response=value, created_at=now, expires_at=expires_at
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=[ChatResponseCache.key],
+            set_={"response": value, "created_at": now, "expires_at": expires_at},
+        )
+        try:
+            async with self.session_factory() as session:
+                await session.execute(statement)
+                await session.commit()
+        except Exception as e:
+            logger.warning(f"Response cache write failed: {type(e).__name__}: {e}")
+
+    async def purge(self) -> int:
+        """Delete expired rows and trim the shared tier to its row limit"""
+        async with self.session_factory() as session:
+            result = await session.execute(
+                delete(ChatResponseCache).where(ChatResponseCache.expires_at <= datetime.utcnow())
+            )
+            removed = result.rowcount or 0
+            total = await session.scalar(select(func.count()).select_from(ChatResponseCache))
+            if total > self.db_max_rows:
+                # Rows closest to expiry go first
+                oldest = (
+                    select(ChatResponseCache.key)
+                    .order_by(ChatResponseCache.expires_at)
+                    .limit(total - self.db_max_rows)
+                )
+                result = await session.execute(
+                    delete(ChatResponseCache).where(ChatResponseCache.key.in_(oldest))
+                )
+                removed += result.rowcount or 0
+            await session.commit()
+        return removed
+
+    async def run_maintenance(self, interval: float) -> None:
+        """Purge the shared tier on an interval until cancelled"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                removed = await self.purge()
+                if removed:
+                    logger.info(f"Response cache purged {removed} rows")
+            except Exception as e:
+                logger.warning(f"Response cache maintenance failed: {type(e).__name__}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits["memory"] + self.hits["db"] + self.misses
+        return {
+            "entries": len(self.memory),
+            "bytes": self.memory.bytes,
+            "evictions": self.memory.evictions,
+            "hits": dict(self.hits),
+            "misses": self.misses,
+            "hit_rate": round((lookups - self.misses) / lookups, 4) if lookups else 0.0,
+            "db_enabled": self.db_enabled,
+        }
+
+
+response_cache = ResponseCache()
+
+_maintenance_task: Optional[asyncio.Task] = None
+
+
+def start_cache_maintenance() -> None:
+    """Start purging the shared tier, called from the application lifespan"""
+    global _maintenance_task
+    if response_cache.db_enabled and (_maintenance_task is None or _maintenance_task.done()):
+        _maintenance_task = asyncio.create_task(
+            response_cache.run_maintenance(chat_cache_settings.chat_cache_maintenance_interval)
+        )
+
+
+async def stop_cache_maintenance() -> None:
+    global _maintenance_task
+    if _maintenance_task is not None:
+        _maintenance_task.cancel()
+        try:
+            await _maintenance_task
+        except asyncio.CancelledError:
+            pass
+        _maintenance_task = None
@@ -0,0 +1,120 @@
+import math
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from backend.app.config import EnvSettings
+
+
+class ContextSettings(EnvSettings):
+    """Token budget of the model context"""
+
+    # 上下文token预算（本地估算，不调用任何外部服务）
+    context_token_budget: int = 4000
+    # Per-model overrides, e.g. "qwen/qwen2.5-vl-32b-instruct=8000,anthropic/claude-3-haiku=16000"
+    context_model_budgets: str = ""
+    # An older message is shortened instead of dropped when at least this much budget is left
+    context_min_collapsed_tokens: int = 64
+
+
+context_settings = ContextSettings()
+
+# Chat formats add a few tokens per message for role and separators
+MESSAGE_OVERHEAD_TOKENS = 4
+REPLY_PRIMING_TOKENS = 3
+# Latin text averages ~4 characters per token; CJK is closer to one token per character
+CHARS_PER_TOKEN = 4
+COLLAPSED_MARKER = " …"
+
+_CJK = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]")
+
+
+def parse_model_budgets(value: str) -> Dict[str, int]:
+    budgets = {}
+    for entry in value.split(","):
+        model, sep, tokens = entry.strip().rpartition("=")
+        if sep and model and tokens.strip().isdigit():
+            budgets[model.strip()] = int(tokens)
+    return budgets
+
+
+MODEL_BUDGETS = parse_model_budgets(context_settings.context_model_budgets)
+
+
+def budget_for_model(model: str) -> int:
+    return MODEL_BUDGETS.get(model, context_settings.context_token_budget)
+
+
+def estimate_tokens(text: str) -> int:
+    """Fast token estimate: one per CJK character, one per four other characters"""
+    cjk = len(_CJK.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / CHARS_PER_TOKEN)
+
+
+def estimate_message_tokens(message: Dict[str, str]) -> int:
+    return MESSAGE_OVERHEAD_TOKENS + estimate_tokens(str(message.get("content") or ""))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Longest prefix of text whose estimate fits max_tokens, marked as shortened"""
+    budget = max_tokens * CHARS_PER_TOKEN
+    for end, char in enumerate(text):
+        budget -= CHARS_PER_TOKEN if _CJK.match(char) else 1
+        if budget < 0:
+            return text[:end] + COLLAPSED_MARKER
+    return text
+
+
+@dataclass
+class BuiltContext:
+    messages: List[Dict[str, str]]
+    estimated_tokens: int
+    dropped: int = 0
+    collapsed: int = 0
+    budget: Optional[int] = None
+
+
+def build_context(messages: List[Dict[str, str]], budget: int) -> BuiltContext:
+    """Fit a conversation into a prompt token budget
+
+    System messages and the latest message are always kept. Earlier turns are
+    added newest first while they fit; the first one that does not fit is
+    shortened if enough budget remains, everything older is dropped.
+    """
+    if not messages:
+        return BuiltContext([], REPLY_PRIMING_TOKENS, budget=budget)
+
+    *history, latest = messages
+    system = [message for message in history if message.get("role") == "system"]
+    turns = [message for message in history if message.get("role") != "system"]
+
+    used = REPLY_PRIMING_TOKENS + estimate_message_tokens(latest)
+    used += sum(estimate_message_tokens(message) for message in system)
+
+    kept: List[Dict[str, str]] = []
+    collapsed = 0
+    for index in range(len(turns) - 1, -1, -1):
+        message = turns[index]
+        cost = estimate_message_tokens(message)
+        if used + cost <= budget:
+            kept.append(message)
+            used += cost
+            continue
+
+        # One token of slack for the marker appended to the shortened text
+        remaining = budget - used - MESSAGE_OVERHEAD_TOKENS - 1
+        if remaining >= context_settings.context_min_collapsed_tokens:
+            content = truncate_to_tokens(str(message.get("content") or ""), remaining)
+            shortened = {**message, "content": content}
+            kept.append(shortened)
+            used += estimate_message_tokens(shortened)
+            collapsed = 1
+        return BuiltContext(
+            system + kept[::-1] + [latest],
+            used,
+            dropped=index if collapsed else index + 1,
+            collapsed=collapsed,
+            budget=budget,
+        )
+
+    return BuiltContext(system + kept[::-1] + [latest], used, budget=budget)
@@ -0,0 +1,178 @@
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+from uuid import UUID
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.app.config import EnvSettings
+from backend.app.models import ChatMessage
+from backend.app.streaming import StreamError
+from backend.app.write_behind import chat_write_behind, turn_rows, write_behind_settings
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationSettings(EnvSettings):
+    """Server-side conversation history"""
+
+    # 服务端会话历史配置
+    # Sessions kept in memory; older ones are reloaded from chat_messages on demand
+    conversation_cache_sessions: int = 1000
+    # Most recent messages of a session used as model context
+    conversation_max_messages: int = 50
+    # Seconds a session's history is served from memory before it is reloaded, so turns
+    # written by other workers are picked up; 0 always reloads
+    conversation_cache_ttl_seconds: float = 30.0
+
+
+conversation_settings = ConversationSettings()
+
+# is_user flag of the summary rows written by backend.app.summarizer
+SUMMARY_FLAG = "S"
+ROLE_BY_FLAG = {"Y": "user", "N": "assistant", SUMMARY_FLAG: "system"}
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+
+def as_chat_message(row: Dict[str, Any]) -> Dict[str, str]:
+    """A chat_messages row in OpenAI chat format; summaries become a system message"""
+    if row["is_user"] == SUMMARY_FLAG:
+        return {"role": "system", "content": SUMMARY_PREFIX + row["content"]}
+    return {"role": ROLE_BY_FLAG.get(row["is_user"], "user"), "content": row["content"]}
+
+
+def since_last_summary(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Rows from the newest summary on (everything when there is none), oldest first"""
+    for index in range(len(rows) - 1, -1, -1):
+        if rows[index]["is_user"] == SUMMARY_FLAG:
+            return rows[index:]
+    return rows
+
+
+class ConversationStore:
+    """Chat history per session: a hot in-memory LRU in front of the chat_messages table"""
+
+    def __init__(
+        self,
+        max_sessions: int = conversation_settings.conversation_cache_sessions,
+        max_messages: int = conversation_settings.conversation_max_messages,
+        ttl_seconds: float = conversation_settings.conversation_cache_ttl_seconds,
+    ):
+        self.max_sessions = max_sessions
+        self.max_messages = max_messages
+        self.ttl_seconds = ttl_seconds
+        self.sessions: "OrderedDict[UUID, List[Dict[str, str]]]" = OrderedDict()
+        # When each cached history was last read from the database
+        self.loaded_at: Dict[UUID, float] = {}
+        self.hits = 0
+        self.loads = 0
+
+    def _remember(self, session_id: UUID, messages: List[Dict[str, str]]) -> None:
+        self.sessions[session_id] = messages[-self.max_messages :]
+        self.sessions.move_to_end(session_id)
+        while len(self.sessions) > self.max_sessions:
+            evicted, _ = self.sessions.popitem(last=False)
+            self.loaded_at.pop(evicted, None)
+
+    async def history(self, db: AsyncSession, session_id: UUID) -> List[Dict[str, str]]:
+        """Recent messages of a session in OpenAI chat format, oldest first"""
+        cached = self.sessions.get(session_id)
+        loaded_at = self.loaded_at.get(session_id, 0.0)
+        if cached is not None and time.monotonic() - loaded_at < self.ttl_seconds:
+            self.hits += 1
+            self.sessions.move_to_end(session_id)
+            return list(cached)
+
+        self.loads += 1
+        # Taken before the query, so rows flushed meanwhile are found in one or the other
+        unflushed = chat_write_behind.pending_for(session_id)
+        try:
+            result = await db.execute(
+                select(
+                    ChatMessage.id, ChatMessage.is_user, ChatMessage.content, ChatMessage.timestamp
+                )
+                .where(ChatMessage.session_id == session_id)
+                .order_by(ChatMessage.timestamp.desc())
+                .limit(self.max_messages)
+            )
+            rows = result.all()
+            # Release the connection before the slow upstream call
+            await db.commit()
+        except Exception as e:
+            logger.warning(f"Failed to load history of session {session_id}: {e}")
+            await db.rollback()
+            return []
+
+        loaded = [row._asdict() for row in reversed(rows)]
+        loaded_ids = {row["id"] for row in loaded}
+        rows = loaded + [row for row in unflushed if row["id"] not in loaded_ids]
+        rows.sort(key=lambda row: (row["timestamp"], row["id"]))
+        # A summary replaces every message before it
+        messages = [as_chat_message(row) for row in since_last_summary(rows[-self.max_messages :])]
+        self._remember(session_id, messages)
+        self.loaded_at[session_id] = time.monotonic()
+        return list(messages)
+
+    async def append_turn(
+        self, db: AsyncSession, session_id: UUID, user_message: str, ai_message: str
+    ) -> None:
+        """Persist one user/assistant exchange and extend the in-memory history"""
+        rows = turn_rows(session_id, user_message, ai_message)
+        if write_behind_settings.chat_write_behind_enabled:
+            # Written by the background flusher; history() sees the rows meanwhile
+            chat_write_behind.enqueue(rows)
+        else:
+            try:
+                db.add_all([ChatMessage(**row) for row in rows])
+                await db.commit()
+            except Exception as e:
+                # The answer was already produced; losing the turn must not fail the request
+                logger.warning(f"Failed to persist turn of session {session_id}: {e}")
+                await db.rollback()
+                self.forget(session_id)
+                return
+
+        messages = self.sessions.get(session_id)
+        if messages is not None:
+            messages.append({"role": "user", "content": user_message})
+            messages.append({"role": "assistant", "content": ai_message})
+            self._remember(session_id, messages)
+
+    async def record_stream(
+        self,
+        db: AsyncSession,
+        session_id: UUID,
+        user_message: str,
+        chunks: AsyncIterator[Any],
+        on_recorded: Optional[Callable[[], None]] = None,
+    ) -> AsyncIterator[Any]:
+        """Pass a streamed answer through and persist the turn once it completed
+
+        Non-text items (errors and usage reported by the producer) are passed
+        through too, but a failed answer is not stored as part of the conversation.
+        ``on_recorded`` is called after a completed turn was stored.
+        """
+        parts = []
+        failed = False
+        async for chunk in chunks:
+            if isinstance(chunk, str):
+                parts.append(chunk)
+            elif isinstance(chunk, StreamError):
+                failed = True
+            yield chunk
+        if not failed:
+            await self.append_turn(db, session_id, user_message, "".join(parts))
+            if on_recorded is not None:
+                on_recorded()
+
+    def forget(self, session_id: UUID) -> None:
+        self.sessions.pop(session_id, None)
+        self.loaded_at.pop(session_id, None)
+
+    def stats(self) -> Dict[str, Optional[int]]:
+        return {"sessions": len(self.sessions), "hits": self.hits, "loads": self.loads}
+
+
+conversation_store = ConversationStore()
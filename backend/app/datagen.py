@@ -0,0 +1,280 @@
+"""
+Synthetic data generator for load and scale testing
+
+Bulk-loads realistic volumes of ``items`` and ``chat_messages`` rows through
+PostgreSQL COPY, split across several worker processes. The tables must
+already exist (``alembic upgrade head`` or starting the backend once).
+
+    python -m backend.app.datagen --items 1000000 --sessions 100000 --workers 4
+"""
+import argparse
+import asyncio
+import itertools
+import math
+import os
+import random
+import sys
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from typing import Iterator, List, Optional, Tuple
+
+import asyncpg
+from sqlalchemy.engine import make_url
+
+from backend.app.config import get_settings
+
+ITEM_COLUMNS = ["id", "name", "description", "created_at", "updated_at"]
+CHAT_COLUMNS = ["id", "session_id", "user_id", "is_user", "content", "timestamp"]
+
+# Vocabulary for the synthetic corpus; mixes English and Chinese like real traffic
+WORDS = (
+    "the a of to and in is for on with as by this that it be are from at or an "
+    "data model query index table user item order price stock report service "
+    "request response latency cache error retry timeout session message stream "
+    "token context prompt summary analysis result value update create delete "
+    "customer product shipment invoice account payment region warehouse metric "
+    "python fastapi postgres docker kubernetes streamlit openrouter claude qwen "
+    "请 帮我 总结 一下 这个 数据 分析 报告 问题 如何 为什么 可以 需要 系统 用户 "
+    "订单 价格 库存 模型 接口 性能 优化 查询 缓存 错误 超时 会话 消息"
+).split()
+ADJECTIVES = (
+    "Red Blue Smart Compact Premium Basic Wireless Portable "
+    "Heavy Eco Classic Digital Modular Industrial Mini Pro"
+).split()
+NOUNS = (
+    "Widget Sensor Adapter Controller Cable Panel Module Router "
+    "Bracket Valve Battery Display Pump Filter Gateway Drive"
+).split()
+
+# Lognormal text lengths (characters): (median, sigma, max)
+ITEM_DESCRIPTION_LENGTH = (180, 0.9, 4000)
+USER_MESSAGE_LENGTH = (60, 1.0, 2000)
+ASSISTANT_MESSAGE_LENGTH = (600, 0.8, 6000)
+
+# Share of items without a description and of items never updated
+NULL_DESCRIPTION_RATE = 0.1
+NEVER_UPDATED_RATE = 0.7
+
+# Mean number of user/assistant exchanges per conversation
+MEAN_TURNS_PER_SESSION = 6
+
+# Relative traffic per hour of day (UTC), peaks during working hours
+# fmt: off
+HOURLY_WEIGHTS = [
+    1, 1, 1, 1, 1, 2, 3, 5, 8, 10, 10, 9,
+    8, 9, 10, 10, 9, 8, 6, 5, 4, 3, 2, 1,
+]
+# fmt: on
+
+
+def asyncpg_dsn(database_url: str) -> str:
+    """Convert a SQLAlchemy URL (postgresql+asyncpg://...) to a plain asyncpg DSN"""
+    url = make_url(database_url).set(drivername="postgresql")
+    return url.render_as_string(hide_password=False)
+
+
+class TextSource:
+    """Cheap realistic text: random slices of a pre-generated Zipf-weighted corpus"""
+
+    def __init__(self, rng: random.Random, size: int = 1_000_000):
+        weights = [1 / (rank + 1) for rank in range(len(WORDS))]
+        words = rng.choices(WORDS, weights=weights, k=size // 5)
+        self.corpus = " ".join(words)
+        self.rng = rng
+
+    def text(self, median: float, sigma: float, max_length: int) -> str:
+        length = min(int(self.rng.lognormvariate(math.log(median), sigma)) + 1, max_length)
+        start = self.rng.randrange(0, len(self.corpus) - max_length)
+        return self.corpus[start : start + length].strip() or "ok"
+
+
+class TimestampSource:
+    """Timestamps over the last N days following a daily traffic curve"""
+
+    def __init__(self, rng: random.Random, days: int):
+        self.rng = rng
+        self.days = days
+        self.end = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+        self.hours = list(range(24))
+        self.cum_weights = list(itertools.accumulate(HOURLY_WEIGHTS))
+
+    def sample(self) -> datetime:
+        day = self.rng.randrange(self.days)
+        hour = self.rng.choices(self.hours, cum_weights=self.cum_weights)[0]
+        seconds = self.rng.randrange(3600)
+        return self.end - timedelta(days=day + 1) + timedelta(hours=hour, seconds=seconds)
+
+
+def random_uuid(rng: random.Random) -> uuid.UUID:
+    """Seeded UUID4, much cheaper than uuid.uuid4() for millions of rows"""
+    return uuid.UUID(int=rng.getrandbits(128), version=4)
+
+
+def generate_items(count: int, rng: random.Random, days: int) -> Iterator[Tuple]:
+    """Yield ``items`` rows in COPY column order"""
+    text = TextSource(rng)
+    timestamps = TimestampSource(rng, days)
+    for _ in range(count):
+        created_at = timestamps.sample()
+        if rng.random() < NEVER_UPDATED_RATE:
+            updated_at = created_at
+        else:
+            updated_at = created_at + timedelta(seconds=int(rng.expovariate(1 / 86400)))
+        name = f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {rng.randrange(1, 10000)}"
+        description = (
+            None if rng.random() < NULL_DESCRIPTION_RATE else text.text(*ITEM_DESCRIPTION_LENGTH)
+        )
+        yield (random_uuid(rng), name, description, created_at, updated_at)
+
+
+def generate_chat_messages(sessions: int, rng: random.Random, days: int) -> Iterator[Tuple]:
+    """Yield ``chat_messages`` rows for whole conversations in COPY column order"""
+    text = TextSource(rng)
+    timestamps = TimestampSource(rng, days)
+    for _ in range(sessions):
+        session_id = random_uuid(rng)
+        timestamp = timestamps.sample()
+        turns = 1 + int(rng.expovariate(1 / (MEAN_TURNS_PER_SESSION - 1)))
+        for _ in range(turns):
+            yield (
+                random_uuid(rng),
+                session_id,
+                None,
+                "Y",
+                text.text(*USER_MESSAGE_LENGTH),
+                timestamp,
+            )
+            # Model latency, then the user's reading/typing time before the next turn
+            timestamp += timedelta(seconds=rng.lognormvariate(math.log(4), 0.6))
+            yield (
+                random_uuid(rng),
+                session_id,
+                None,
+                "N",
+                text.text(*ASSISTANT_MESSAGE_LENGTH),
+                timestamp,
+            )
+            timestamp += timedelta(seconds=rng.lognormvariate(math.log(40), 1.0))
+
+
+def batched(rows: Iterator[Tuple], size: int) -> Iterator[List[Tuple]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def load(
+    dsn: str,
+    *,
+    items: int = 0,
+    sessions: int = 0,
+    seed: int = 0,
+    days: int = 90,
+    batch_size: int = 10_000,
+) -> Tuple[int, int]:
+    """Load one worker's share of rows via COPY; returns (items, chat messages) written"""
+    rng = random.Random(seed)
+    item_rows = message_rows = 0
+    conn = await asyncpg.connect(dsn)
+    try:
+        for batch in batched(generate_items(items, rng, days), batch_size):
+            await conn.copy_records_to_table("items", records=batch, columns=ITEM_COLUMNS)
+            item_rows += len(batch)
+        for batch in batched(generate_chat_messages(sessions, rng, days), batch_size):
+            await conn.copy_records_to_table("chat_messages", records=batch, columns=CHAT_COLUMNS)
+            message_rows += len(batch)
+    finally:
+        await conn.close()
+    return item_rows, message_rows
+
+
+def _run_worker(dsn: str, items: int, sessions: int, seed: int, days: int, batch_size: int):
+    return asyncio.run(
+        load(dsn, items=items, sessions=sessions, seed=seed, days=days, batch_size=batch_size)
+    )
+
+
+def _split(total: int, parts: int) -> List[int]:
+    return [total // parts + (1 if i < total % parts else 0) for i in range(parts)]
+
+
+async def _prepare(dsn: str, truncate: bool) -> None:
+    conn = await asyncpg.connect(dsn)
+    try:
+        if truncate:
+            await conn.execute("TRUNCATE items, chat_messages")
+    finally:
+        await conn.close()
+
+
+async def _analyze(dsn: str) -> None:
+    conn = await asyncpg.connect(dsn)
+    try:
+        await conn.execute("ANALYZE items")
+        await conn.execute("ANALYZE chat_messages")
+    finally:
+        await conn.close()
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Generate synthetic items and chat data")
+    parser.add_argument("--items", type=int, default=0, help="number of items to create")
+    parser.add_argument("--sessions", type=int, default=0, help="number of chat conversations")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--batch-size", type=int, default=10_000, help="rows per COPY")
+    parser.add_argument("--days", type=int, default=90, help="spread timestamps over N days")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--truncate", action="store_true", help="empty the tables first")
+    parser.add_argument("--no-analyze", action="store_true", help="skip ANALYZE afterwards")
+    parser.add_argument("--database-url", default=get_settings().database_url)
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    if args.items <= 0 and args.sessions <= 0:
+        print("Nothing to do: pass --items and/or --sessions", file=sys.stderr)
+        return 1
+
+    dsn = asyncpg_dsn(args.database_url)
+    asyncio.run(_prepare(dsn, args.truncate))
+
+    workers = max(1, args.workers)
+    started = time.perf_counter()
+    item_total = message_total = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(
+                _run_worker, dsn, items, sessions, args.seed + i, args.days, args.batch_size
+            )
+            for i, (items, sessions) in enumerate(
+                zip(_split(args.items, workers), _split(args.sessions, workers))
+            )
+        ]
+        for future in as_completed(futures):
+            items, messages = future.result()
+            item_total += items
+            message_total += messages
+            print(f"worker done: {items} items, {messages} chat messages")
+
+    if not args.no_analyze:
+        asyncio.run(_analyze(dsn))
+
+    elapsed = time.perf_counter() - started
+    rows = item_total + message_total
+    print(
+        f"Loaded {item_total} items and {message_total} chat messages "
+        f"in {elapsed:.1f}s ({rows / elapsed:,.0f} rows/s)"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,46 @@
+import asyncio
+import logging
+from typing import Awaitable, TypeVar
+
+from fastapi import HTTPException, Request
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# nginx的约定状态码：客户端在响应前关闭了连接
+CLIENT_CLOSED_REQUEST = 499
+
+
+async def wait_for_disconnect(request: Request) -> None:
+    """Block until the client closes the connection"""
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def cancel_on_disconnect(request: Request, awaitable: Awaitable[T]) -> T:
+    """Run an awaitable, cancelling it as soon as the client disconnects
+
+    Cancelling a task blocked in asyncpg sends a cancel request to PostgreSQL,
+    so the query stops and its connection goes back to the pool right away.
+    """
+    work = asyncio.ensure_future(awaitable)
+    watcher = asyncio.ensure_future(wait_for_disconnect(request))
+    try:
+        await asyncio.wait({work, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        if work.done():
+            return work.result()
+
+        logger.info(f"Client disconnected, cancelling {request.method} {request.url.path}")
+        work.cancel()
+        try:
+            await work
+        except asyncio.CancelledError:
+            pass
+        raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail="Client closed request")
+    finally:
+        for task in (work, watcher):
+            if not task.done():
+                task.cancel()
@@ -0,0 +1,226 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+import httpx
+
+from backend.app.config import EnvSettings
+
+logger = logging.getLogger(__name__)
+
+
+class HedgingSettings(EnvSettings):
+    """Hedged upstream requests"""
+
+    # 对冲请求配置：当前端点超过其常见延迟仍未响应时，向下一个端点发送同样的请求
+    upstream_hedging_enabled: bool = False
+    # Latency percentile of an endpoint after which the next endpoint is tried
+    upstream_hedge_percentile: float = 0.95
+    # Hedge delay used until an endpoint has upstream_hedge_min_samples latency samples
+    upstream_hedge_default_delay_ms: float = 3000.0
+    upstream_hedge_min_delay_ms: float = 200.0
+    upstream_hedge_max_delay_ms: float = 10000.0
+    upstream_hedge_min_samples: int = 20
+    # Extra requests per call at most, bounding the added upstream load (and token spend)
+    upstream_hedge_max_extra: int = 1
+
+
+hedging_settings = HedgingSettings()
+
+LATENCY_WINDOW = 200
+
+
+@dataclass
+class _Attempt:
+    url: str
+    started: float
+    hedge: bool
+
+
+class LatencyTracker:
+    """Sliding window of successful response latencies per endpoint"""
+
+    def __init__(
+        self,
+        window: int = LATENCY_WINDOW,
+        min_samples: int = hedging_settings.upstream_hedge_min_samples,
+    ):
+        self.window = window
+        self.min_samples = min_samples
+        self.samples: Dict[str, Deque[float]] = {}
+
+    def record(self, url: str, latency_ms: float) -> None:
+        if url not in self.samples:
+            self.samples[url] = deque(maxlen=self.window)
+        self.samples[url].append(latency_ms)
+
+    def percentile(self, url: str, q: float) -> Optional[float]:
+        """Latency below which a fraction q of recent responses arrived, None if too few"""
+        samples = self.samples.get(url)
+        if not samples or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+@dataclass
+class HedgeStats:
+    requests: int = 0
+    # Requests that sent at least one hedge, and those a hedge answered first
+    hedged: int = 0
+    hedge_wins: int = 0
+    cancelled: int = 0
+    # Time the primary was still expected to need when a hedge won (from its p99)
+    estimated_saved_ms: float = 0.0
+
+
+class Hedger:
+    """Send one request to several endpoints, staggered by each endpoint's usual latency
+
+    The first successful (HTTP 200) answer wins and every other attempt is
+    cancelled. A failed attempt moves on to the next endpoint immediately,
+    like the sequential retry loop did.
+    """
+
+    def __init__(
+        self,
+        tracker: Optional[LatencyTracker] = None,
+        percentile: float = hedging_settings.upstream_hedge_percentile,
+        default_delay_ms: float = hedging_settings.upstream_hedge_default_delay_ms,
+        min_delay_ms: float = hedging_settings.upstream_hedge_min_delay_ms,
+        max_delay_ms: float = hedging_settings.upstream_hedge_max_delay_ms,
+        max_extra: int = hedging_settings.upstream_hedge_max_extra,
+    ):
+        self.tracker = tracker or LatencyTracker()
+        self.percentile = percentile
+        self.default_delay_ms = default_delay_ms
+        self.min_delay_ms = min_delay_ms
+        self.max_delay_ms = max_delay_ms
+        self.max_extra = max_extra
+        self.stats = HedgeStats()
+
+    def delay_for(self, url: str) -> float:
+        """Seconds to wait for ``url`` before hedging to the next endpoint"""
+        delay_ms = self.tracker.percentile(url, self.percentile)
+        if delay_ms is None:
+            delay_ms = self.default_delay_ms
+        return min(max(delay_ms, self.min_delay_ms), self.max_delay_ms) / 1000
+
+    async def post(
+        self,
+        client: httpx.AsyncClient,
+        urls: List[str],
+        *,
+        on_response: Optional[Callable[[str, int], None]] = None,
+        on_error: Optional[Callable[[str, Exception], None]] = None,
+        stop_statuses: Tuple[int, ...] = (),
+        **kwargs: Any,
+    ) -> Tuple[str, httpx.Response]:
+        """Return (url, response) of the winning attempt
+
+        When no attempt succeeded the last response received is returned, so the
+        caller can still report e.g. a credits error; with no response at all the
+        last exception is raised. A response with one of ``stop_statuses`` (e.g. a
+        model error, the same on every endpoint) is returned without trying further.
+        """
+        self.stats.requests += 1
+        pending: Dict[asyncio.Task, _Attempt] = {}
+        launched = 0
+        extra = 0
+        last_response: Optional[Tuple[str, httpx.Response]] = None
+        last_error: Optional[Exception] = None
+
+        def launch(hedge: bool = False) -> None:
+            nonlocal launched
+            url = urls[launched]
+            launched += 1
+            task = asyncio.create_task(client.post(url, **kwargs))
+            pending[task] = _Attempt(url, time.perf_counter(), hedge)
+
+        launch()
+        try:
+            while pending:
+                timeout = None
+                if launched < len(urls) and extra < self.max_extra:
+                    newest = max(pending.values(), key=lambda attempt: attempt.started)
+                    deadline = newest.started + self.delay_for(newest.url)
+                    timeout = max(0.0, deadline - time.perf_counter())
+                done, _ = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    # Slower than usual: race the next endpoint against it
+                    if extra == 0:
+                        self.stats.hedged += 1
+                    extra += 1
+                    logger.info(f"Hedging {urls[launched]}: no answer within the usual latency")
+                    launch(hedge=True)
+                    continue
+
+                for task in done:
+                    attempt = pending.pop(task)
+                    url = attempt.url
+                    try:
+                        response = task.result()
+                    except Exception as e:
+                        last_error = e
+                        if on_error is not None:
+                            on_error(url, e)
+                        continue
+                    if on_response is not None:
+                        on_response(url, response.status_code)
+                    if response.status_code == 200:
+                        self._record_win(attempt, pending)
+                        return url, response
+                    if response.status_code in stop_statuses:
+                        return url, response
+                    last_response = (url, response)
+
+                if not pending and launched < len(urls):
+                    launch()
+        finally:
+            for task in pending:
+                task.cancel()
+            self.stats.cancelled += len(pending)
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+        if last_response is not None:
+            return last_response
+        raise last_error or RuntimeError("No upstream URL to try")
+
+    def _record_win(self, winner: _Attempt, pending: Dict[asyncio.Task, _Attempt]) -> None:
+        now = time.perf_counter()
+        self.tracker.record(winner.url, (now - winner.started) * 1000)
+        if not winner.hedge:
+            return
+        self.stats.hedge_wins += 1
+        if not pending:
+            return
+        # The attempt that was hedged is the oldest one still running
+        primary = min(pending.values(), key=lambda attempt: attempt.started)
+        waited_ms = (now - primary.started) * 1000
+        expected_ms = self.tracker.percentile(primary.url, 0.99)
+        if expected_ms is not None and expected_ms > waited_ms:
+            self.stats.estimated_saved_ms += expected_ms - waited_ms
+
+    def snapshot(self) -> Dict[str, Any]:
+        stats = self.stats
+        return {
+            "enabled": hedging_settings.upstream_hedging_enabled,
+            "requests": stats.requests,
+            "hedged": stats.hedged,
+            "hedge_rate": round(stats.hedged / stats.requests, 4) if stats.requests else 0.0,
+            "hedge_wins": stats.hedge_wins,
+            "cancelled": stats.cancelled,
+            "estimated_saved_ms": round(stats.estimated_saved_ms, 1),
+            "delays_ms": {
+                url: round(self.delay_for(url) * 1000, 1) for url in self.tracker.samples
+            },
+        }
+
+
+hedger = Hedger()
@@ -0,0 +1,132 @@
+"""
+Paged reads and full-text search over chat_messages
+
+Pages are addressed with keyset cursors on (timestamp, id) instead of
+OFFSET, so reading the hundredth page of a long conversation costs the same
+index range scan as the first one. Search matches the GIN-indexed
+``to_tsvector`` of the content and pages by the same cursor, newest first.
+Rolling summaries written by the compaction worker are internal context and
+are left out of both.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import func, literal_column, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.app.conversations import ROLE_BY_FLAG, SUMMARY_FLAG
+from backend.app.models import CHAT_SEARCH_CONFIG, ChatMessage
+from backend.app.write_behind import chat_write_behind
+
+Cursor = Tuple[datetime, UUID]
+
+
+def encode_cursor(message: Dict[str, Any]) -> str:
+    raw = json.dumps([message["timestamp"].isoformat(), str(message["id"])])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Cursor:
+    """Parse a cursor from a previous page; raises ValueError when malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        timestamp, message_id = json.loads(raw)
+        return datetime.fromisoformat(timestamp), UUID(message_id)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {e}") from e
+
+
+def _as_message(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": row["id"],
+        "session_id": row["session_id"],
+        "role": ROLE_BY_FLAG.get(row["is_user"], "user"),
+        "content": row["content"],
+        "timestamp": row["timestamp"],
+    }
+
+
+_COLUMNS = (
+    ChatMessage.id,
+    ChatMessage.session_id,
+    ChatMessage.is_user,
+    ChatMessage.content,
+    ChatMessage.timestamp,
+)
+
+
+async def session_messages(
+    db: AsyncSession, session_id: UUID, limit: int, before: Optional[str] = None
+) -> Dict[str, Any]:
+    """One page of a session's messages, the newest ``limit`` older than the cursor
+
+    Messages are returned oldest first; ``next_cursor`` points at the page of
+    older messages and is None once the start of the conversation is reached.
+    """
+    statement = (
+        select(*_COLUMNS)
+        .where(ChatMessage.session_id == session_id, ChatMessage.is_user != SUMMARY_FLAG)
+        .order_by(ChatMessage.timestamp.desc(), ChatMessage.id.desc())
+        .limit(limit + 1)
+    )
+    # Taken before the query, so rows flushed meanwhile are found in one or the other
+    rows = [
+        row for row in chat_write_behind.pending_for(session_id) if row["is_user"] != SUMMARY_FLAG
+    ]
+    if before is not None:
+        timestamp, message_id = decode_cursor(before)
+        statement = statement.where(
+            tuple_(ChatMessage.timestamp, ChatMessage.id) < tuple_(timestamp, message_id)
+        )
+        rows = [row for row in rows if (row["timestamp"], row["id"]) < (timestamp, message_id)]
+
+    result = await db.execute(statement)
+    loaded = [row._asdict() for row in result]
+    loaded_ids = {row["id"] for row in loaded}
+    rows = loaded + [row for row in rows if row["id"] not in loaded_ids]
+    rows.sort(key=lambda row: (row["timestamp"], row["id"]), reverse=True)
+
+    page = rows[:limit]
+    return {
+        "messages": [_as_message(row) for row in reversed(page)],
+        "next_cursor": encode_cursor(page[-1]) if len(rows) > limit else None,
+    }
+
+
+async def search_messages(
+    db: AsyncSession,
+    query: str,
+    limit: int,
+    session_id: Optional[UUID] = None,
+    before: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Messages matching a web-search style query, newest first"""
+    config = literal_column(f"'{CHAT_SEARCH_CONFIG}'")
+    # Must match the expression of ix_chat_messages_content_tsv to use the index
+    matches = func.to_tsvector(config, ChatMessage.content).op("@@")(
+        func.websearch_to_tsquery(config, query)
+    )
+    statement = (
+        select(*_COLUMNS)
+        .where(matches, ChatMessage.is_user != SUMMARY_FLAG)
+        .order_by(ChatMessage.timestamp.desc(), ChatMessage.id.desc())
+        .limit(limit + 1)
+    )
+    if session_id is not None:
+        statement = statement.where(ChatMessage.session_id == session_id)
+    if before is not None:
+        timestamp, message_id = decode_cursor(before)
+        statement = statement.where(
+            tuple_(ChatMessage.timestamp, ChatMessage.id) < tuple_(timestamp, message_id)
+        )
+
+    result = await db.execute(statement)
+    rows: List[Dict[str, Any]] = [row._asdict() for row in result]
+    page = rows[:limit]
+    return {
+        "messages": [_as_message(row) for row in page],
+        "next_cursor": encode_cursor(page[-1]) if len(rows) > limit else None,
+    }
@@ -0,0 +1,191 @@
+import logging
+import time
+from collections import deque
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from backend.app.config import EnvSettings
+from backend.app.metrics import db_query_seconds, metrics_settings
+
+logger = logging.getLogger(__name__)
+
+
+class InstrumentationSettings(EnvSettings):
+    """Slow query logging"""
+
+    # 慢查询阈值（毫秒），超过该值的SELECT可选地记录EXPLAIN计划
+    sql_slow_query_ms: float = 200.0
+    sql_explain_slow_queries: bool = False
+    sql_slow_query_buffer: int = 100
+
+
+instrumentation_settings = InstrumentationSettings()
+
+# Keep Server-Timing descriptions short, they travel in every response header
+_MAX_DESC_LENGTH = 120
+
+
+@dataclass
+class QueryStats:
+    """SQL statistics aggregated over a single HTTP request"""
+
+    count: int = 0
+    total_ms: float = 0.0
+    slowest_ms: float = 0.0
+    slowest_statement: Optional[str] = None
+
+    def record(self, statement: str, elapsed_ms: float) -> None:
+        self.count += 1
+        self.total_ms += elapsed_ms
+        if elapsed_ms > self.slowest_ms:
+            self.slowest_ms = elapsed_ms
+            self.slowest_statement = statement
+
+
+@dataclass
+class SlowQuery:
+    """A slow statement together with its captured execution plan"""
+
+    statement: str
+    duration_ms: float
+    captured_at: datetime = field(default_factory=datetime.utcnow)
+    plan: Optional[List[str]] = None
+    error: Optional[str] = None
+
+
+_current_stats: ContextVar[Optional[QueryStats]] = ContextVar("sql_query_stats", default=None)
+
+# 慢查询环形缓冲区，供管理接口读取
+slow_queries: Deque[SlowQuery] = deque(maxlen=instrumentation_settings.sql_slow_query_buffer)
+
+
+def _capture_plan(conn, statement: str, parameters: Any) -> SlowQuery:
+    """Re-run a slow SELECT under EXPLAIN (ANALYZE, BUFFERS) on a raw cursor"""
+    entry = SlowQuery(statement=statement, duration_ms=0.0)
+    # A raw DBAPI cursor bypasses the engine events and leaves the
+    # original cursor's result set untouched
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS) {statement}", parameters)
+        entry.plan = [row[0] for row in cursor.fetchall()]
+    except Exception as e:
+        entry.error = f"{type(e).__name__}: {e}"
+    finally:
+        cursor.close()
+    return entry
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed_ms = (time.perf_counter() - conn.info["query_start_time"].pop()) * 1000
+
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.record(statement, elapsed_ms)
+    if metrics_settings.metrics_enabled:
+        db_query_seconds.observe(elapsed_ms / 1000)
+
+    if elapsed_ms < instrumentation_settings.sql_slow_query_ms:
+        return
+
+    logger.warning(f"Slow query ({elapsed_ms:.1f}ms): {statement[:200]}")
+    # EXPLAIN ANALYZE executes the statement again, so only plain reads qualify
+    if (
+        instrumentation_settings.sql_explain_slow_queries
+        and not executemany
+        and statement.lstrip()[:6].upper() == "SELECT"
+    ):
+        entry = _capture_plan(conn, statement, parameters)
+    else:
+        entry = SlowQuery(statement=statement, duration_ms=0.0)
+    entry.duration_ms = elapsed_ms
+    slow_queries.append(entry)
+
+
+def _handle_error(exception_context):
+    # Failed statements never reach after_cursor_execute; drop their start time
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("query_start_time"):
+        conn.info["query_start_time"].pop()
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Attach query timing hooks to a (sync) engine"""
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(engine, "handle_error", _handle_error)
+
+
+def get_slow_queries() -> List[Dict[str, Any]]:
+    """Return captured slow queries, newest first"""
+    return [
+        {
+            "statement": entry.statement,
+            "duration_ms": round(entry.duration_ms, 2),
+            "captured_at": entry.captured_at.isoformat(),
+            "plan": entry.plan,
+            "error": entry.error,
+        }
+        for entry in reversed(slow_queries)
+    ]
+
+
+def _header_safe(text: str) -> str:
+    """Collapse a SQL statement into something valid inside a quoted header value"""
+    text = " ".join(text.split()).replace("\\", "").replace('"', "'")
+    if len(text) > _MAX_DESC_LENGTH:
+        text = text[: _MAX_DESC_LENGTH - 3] + "..."
+    return text.encode("latin-1", "replace").decode("latin-1")
+
+
+def format_server_timing(stats: QueryStats, total_ms: float) -> str:
+    """Render request SQL statistics as a Server-Timing header value"""
+    metrics = [
+        f'db;dur={stats.total_ms:.2f};desc="{stats.count} queries"',
+        f"app;dur={total_ms:.2f}",
+    ]
+    if stats.slowest_statement is not None:
+        metrics.append(
+            f'db-slowest;dur={stats.slowest_ms:.2f};desc="{_header_safe(stats.slowest_statement)}"'
+        )
+    return ", ".join(metrics)
+
+
+class ServerTimingMiddleware:
+    """ASGI middleware that reports per-request SQL statistics via Server-Timing"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+        token = _current_stats.set(stats)
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                total_ms = (time.perf_counter() - start) * 1000
+                headers = list(message.get("headers", []))
+                headers.append(
+                    (b"server-timing", format_server_timing(stats, total_ms).encode("latin-1"))
+                )
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_stats.reset(token)
@@ -0,0 +1,229 @@
+"""
+Application logging: queued, structured and throttled
+
+Handlers on the event loop only put records on a bounded in-memory queue; a
+QueueListener thread formats them (JSON lines by default) and writes them to
+stdout. Below ERROR, every call site may emit at most LOG_RATE_LIMIT_PER_SECOND
+records, and per-request and per-chunk debug records go through a
+SampledLogger that keeps LOG_SAMPLE_RATE of them, deciding before the record
+is even built. The time the loop spends in logging calls is counted in
+logging_stats().
+"""
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Tuple
+
+from pydantic import field_validator
+
+from backend.app.config import EnvSettings
+
+
+class LoggingSettings(EnvSettings):
+    """Logging"""
+
+    # 日志配置
+    log_level: str = "INFO"
+    # "json" for one JSON object per line, "text" for the classic format
+    log_format: str = "json"
+    # Records waiting for the writer thread; beyond this they are dropped
+    log_queue_size: int = 10000
+    # Share of the hot-path debug records (SampledLogger) that are kept
+    log_sample_rate: float = 0.01
+    # Records per second and call site below ERROR, 0 to disable
+    log_rate_limit_per_second: float = 20.0
+
+    @field_validator("log_level")
+    @classmethod
+    def upper_case_level(cls, value: str) -> str:
+        return value.upper()
+
+    @field_validator("log_format")
+    @classmethod
+    def lower_case_format(cls, value: str) -> str:
+        return value.lower()
+
+
+logging_settings = LoggingSettings()
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# Attributes every LogRecord has; anything else came in through ``extra``
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with ``extra`` fields at the top level"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for name, value in vars(record).items():
+            if name not in _RECORD_ATTRIBUTES:
+                entry[name] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SampledLogger:
+    """Front for a logger on hot paths that keeps a share of its DEBUG records
+
+    The sampling decision comes first, so the records left out cost neither
+    the caller lookup nor a LogRecord.
+    """
+
+    sampled_out = 0
+
+    def __init__(self, logger: logging.Logger, rate: float = logging_settings.log_sample_rate):
+        self.logger = logger
+        self.rate = rate
+
+    def debug(self, msg: str, *args: Any, **kwargs: Any) -> None:
+        if not self.logger.isEnabledFor(logging.DEBUG):
+            return
+        if random.random() >= self.rate:
+            SampledLogger.sampled_out += 1
+            return
+        # Attributed to the caller's line, which is what the rate limit is keyed on
+        self.logger.debug(msg, *args, stacklevel=2, **kwargs)
+
+
+class ThrottleFilter(logging.Filter):
+    """Rate-limits each call site below ERROR
+
+    The next record that gets through from a throttled call site carries the
+    number of records suppressed since, as ``suppressed``.
+    """
+
+    def __init__(self, rate_per_second: float = logging_settings.log_rate_limit_per_second):
+        super().__init__()
+        self.rate_per_second = rate_per_second
+        # (pathname, lineno) -> [tokens, last refill, suppressed since last emit]
+        self._buckets: Dict[Tuple[str, int], list] = {}
+        self.rate_limited = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.ERROR:
+            return True
+        if self.rate_per_second <= 0:
+            return True
+        now = time.monotonic()
+        # A new call site starts with a burst of one second's worth of records
+        bucket = self._buckets.setdefault(
+            (record.pathname, record.lineno), [self.rate_per_second, now, 0]
+        )
+        tokens = min(self.rate_per_second, bucket[0] + (now - bucket[1]) * self.rate_per_second)
+        bucket[1] = now
+        if tokens < 1:
+            bucket[0] = tokens
+            bucket[2] += 1
+            self.rate_limited += 1
+            return False
+        bucket[0] = tokens - 1
+        if bucket[2]:
+            record.suppressed = bucket[2]
+            bucket[2] = 0
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full"""
+
+    def __init__(self, log_queue: "queue.Queue[logging.LogRecord]"):
+        super().__init__(log_queue)
+        self.handled = 0
+        self.records = 0
+        self.dropped = 0
+        self.handle_seconds = 0.0
+
+    def handle(self, record: logging.LogRecord) -> bool:
+        # Runs on the caller's thread, i.e. the event loop for request handlers
+        started = time.perf_counter()
+        try:
+            return super().handle(record)
+        finally:
+            self.handled += 1
+            self.handle_seconds += time.perf_counter() - started
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Only merge the arguments; formatting is left to the listener thread"""
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+            self.records += 1
+        except queue.Full:
+            self.dropped += 1
+
+
+_handler: Optional[NonBlockingQueueHandler] = None
+_throttle: Optional[ThrottleFilter] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+_lock = threading.Lock()
+
+
+def build_formatter(log_format: str = logging_settings.log_format) -> logging.Formatter:
+    return JsonFormatter() if log_format == "json" else logging.Formatter(TEXT_FORMAT)
+
+
+def start_logging(stream=None) -> None:
+    """Route the root logger through the queue, called from the application lifespan"""
+    global _handler, _throttle, _listener
+    with _lock:
+        if _listener is not None:
+            return
+        output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(build_formatter())
+        _throttle = ThrottleFilter()
+        _handler = NonBlockingQueueHandler(queue.Queue(logging_settings.log_queue_size))
+        _handler.addFilter(_throttle)
+        _listener = logging.handlers.QueueListener(_handler.queue, output)
+        root = logging.getLogger()
+        root.setLevel(logging_settings.log_level)
+        root.addHandler(_handler)
+        _listener.start()
+
+
+def stop_logging() -> None:
+    """Detach the queue and write out the records still in it"""
+    global _listener
+    with _lock:
+        if _listener is None:
+            return
+        logging.getLogger().removeHandler(_handler)
+        _listener.stop()
+        _listener = None
+
+
+def logging_stats() -> Dict[str, Any]:
+    if _handler is None or _throttle is None:
+        return {"enabled": False}
+    return {
+        "enabled": _listener is not None,
+        "format": logging_settings.log_format,
+        "level": logging_settings.log_level,
+        "handled": _handler.handled,
+        "records": _handler.records,
+        "queued": _handler.queue.qsize(),
+        "dropped": _handler.dropped,
+        "sampled_out": SampledLogger.sampled_out,
+        "rate_limited": _throttle.rate_limited,
+        # Time the logging calls spent on the caller's thread (the event loop)
+        "loop_ms": round(_handler.handle_seconds * 1000, 1),
+        "loop_us_per_call": round(_handler.handle_seconds * 1e6 / max(_handler.handled, 1), 2),
+    }
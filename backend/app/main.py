@@ -1,39 +1,66 @@
 import logging
-import os
 from contextlib import asynccontextmanager
-from pathlib import Path
 
-from dotenv import load_dotenv
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-
-from backend.app.db import create_db_and_tables, get_engine
-from backend.app.routers import ai, items
-
-# 获取项目根目录
-BASE_DIR = Path(__file__).resolve().parent.parent.parent
-ENV_FILE = BASE_DIR / ".env"
-
-# 使用绝对路径加载.env文件
-print(f"Loading .env from: {ENV_FILE}")
-load_dotenv(dotenv_path=ENV_FILE)
-
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import DBAPIError
+
+from backend.app.chat_cache import start_cache_maintenance, stop_cache_maintenance
+from backend.app.config import get_settings
+from backend.app.db import create_db_and_tables, get_engine, is_statement_timeout
+from backend.app.instrumentation import ServerTimingMiddleware
+from backend.app.logging_config import start_logging, stop_logging
+from backend.app.metrics import MetricsMiddleware
+from backend.app.routers import admin, ai, items, metrics, sessions
+from backend.app.summarizer import stop_summarizer
+from backend.app.upstream import (
+    close_http_client,
+    start_health_prober,
+    start_http_client,
+    stop_health_prober,
 )
+from backend.app.usage import stop_usage_accounting
+from backend.app.write_behind import start_write_behind, stop_write_behind
+
+logger = logging.getLogger(__name__)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    # Log records are written by a background thread, off the event loop
+    start_logging()
+    # Settings are read here once instead of at import time
+    settings = get_settings()
+    logger.info(
+        f"Starting in {settings.environment} mode with model {settings.model_name}, "
+        f"API key {settings.masked_api_key or 'not set'}"
+    )
+    if not settings.openrouter_api_key:
+        logger.warning("OPENROUTER_API_KEY is not set, the AI endpoints will answer with an error")
     # Startup: create tables if they don't exist
     await create_db_and_tables()
+    # Shared keep-alive client for all upstream AI calls
+    await start_http_client()
+    # Probe upstream endpoints in the background instead of on every chat request
+    start_health_prober(ai.upstream_urls(), ai.upstream_headers())
+    # Purge expired rows of the shared response cache
+    start_cache_maintenance()
+    # Batch chat history writes off the request path
+    start_write_behind()
     
     yield
     
-    # Shutdown: close engine
+    # Shutdown: write out buffered chat history and usage, close upstream connections and engine
+    await stop_summarizer()
+    await stop_write_behind()
+    await stop_usage_accounting()
+    await stop_cache_maintenance()
+    await stop_health_prober()
+    await close_http_client()
     engine = get_engine()
     await engine.dispose()
+    stop_logging()
 
 
 app = FastAPI(
@@ -50,11 +77,30 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Prompt-Tokens-Estimate", "Retry-After"],
 )
 
+# Report SQL query count and DB time of each request via the Server-Timing header
+app.add_middleware(ServerTimingMiddleware)
+# Request latency histograms per route and status for GET /metrics
+app.add_middleware(MetricsMiddleware)
+
+@app.exception_handler(DBAPIError)
+async def database_error_handler(request: Request, exc: DBAPIError):
+    """Turn statement timeouts into 504 responses instead of generic 500s"""
+    if is_statement_timeout(exc):
+        logging.getLogger(__name__).warning(f"Statement timeout on {request.url.path}")
+        return JSONResponse(status_code=504, content={"detail": "Database query timed out"})
+    raise exc
+
+
 # Include routers
 app.include_router(items.router, prefix="/api/v1", tags=["items"])
 app.include_router(ai.router, prefix="/api/v1", tags=["ai"])
+app.include_router(sessions.router, prefix="/api/v1", tags=["sessions"])
+app.include_router(admin.router, prefix="/api/v1", tags=["admin"])
+# Scraped by Prometheus at the conventional path, outside the API prefix
+app.include_router(metrics.router, tags=["metrics"])
 
 
 @app.get("/")
@@ -0,0 +1,310 @@
+"""
+Prometheus metrics without a client library
+
+Counters, gauges and fixed-bucket histograms keyed by label values, rendered
+in the Prometheus text exposition format by GET /metrics. Recording is a dict
+lookup and a bisect on the event loop thread, with no locks and no
+allocation once a label combination has been seen. Values that already live
+elsewhere (pool sizes, write-behind backlog) are read by collectors at scrape
+time instead of being tracked on the hot path.
+"""
+import math
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from backend.app.config import EnvSettings
+
+
+class MetricsSettings(EnvSettings):
+    """Prometheus metrics"""
+
+    # 指标配置
+    metrics_enabled: bool = True
+
+
+metrics_settings = MetricsSettings()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Label value for requests that matched no route, so 404 scans do not add series
+UNMATCHED_ROUTE = "unmatched"
+
+Labels = Tuple[str, ...]
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Metric(ABC):
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    @abstractmethod
+    def samples(self) -> List[str]:
+        """Exposition lines of every label combination, without HELP and TYPE"""
+
+    def render(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+            *self.samples(),
+        ]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in sorted(self._values.items())
+        ]
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def set(self, value: float, *labels: str) -> None:
+        self._values[labels] = value
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in sorted(self._values.items())
+        ]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = (),
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> per-bucket counts (the last one is +Inf), then the sum
+        self._series: Dict[Labels, List[float]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def count(self, *labels: str) -> int:
+        series = self._series.get(labels)
+        return int(sum(series[:-1])) if series else 0
+
+    def samples(self) -> List[str]:
+        lines = []
+        bounds = self.buckets + (math.inf,)
+        for labels, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(bounds, series):
+                cumulative += count
+                bucket_labels = _format_labels(
+                    self.labelnames + ("le",), labels + (_format_value(bound),)
+                )
+                lines.append(f"{self.name}_bucket{bucket_labels} {int(cumulative)}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{label_text} {int(cumulative)}")
+        return lines
+
+
+class MetricsRegistry:
+    """The metrics of the process plus the collectors refreshing gauges at scrape time"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+
+    def _register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = (),
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collect: Callable[[], None]) -> None:
+        """Run ``collect`` before every scrape, typically to set gauges"""
+        if collect not in self._collectors:
+            self._collectors.append(collect)
+
+    def render(self) -> str:
+        for collect in self._collectors:
+            collect()
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+DB_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+TTFT_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30)
+COMPLETION_BUCKETS = (0.5, 1, 2, 4, 8, 15, 30, 60, 120)
+TOKENS_PER_SECOND_BUCKETS = (5, 10, 20, 40, 80, 160, 320)
+
+http_request_seconds = registry.histogram(
+    "http_request_duration_seconds",
+    "Time from receiving a request until its response is complete",
+    ["method", "route", "status"],
+    HTTP_BUCKETS,
+)
+db_query_seconds = registry.histogram(
+    "db_query_duration_seconds", "Execution time of SQL statements", buckets=DB_BUCKETS
+)
+db_pool_size = registry.gauge("db_pool_size", "Connections the pool keeps open")
+db_pool_checked_out = registry.gauge("db_pool_checked_out", "Connections currently in use")
+db_pool_overflow = registry.gauge("db_pool_overflow", "Connections opened beyond the pool size")
+ai_upstream_ttft_seconds = registry.histogram(
+    "ai_upstream_ttft_seconds",
+    "Time from sending a streaming completion request until the first token",
+    ["model"],
+    TTFT_BUCKETS,
+)
+ai_upstream_completion_seconds = registry.histogram(
+    "ai_upstream_completion_seconds",
+    "Time from sending a completion request until the whole answer arrived",
+    ["model", "mode"],
+    COMPLETION_BUCKETS,
+)
+ai_upstream_tokens_per_second = registry.histogram(
+    "ai_upstream_tokens_per_second",
+    "Completion tokens per second of generation",
+    ["model", "mode"],
+    TOKENS_PER_SECOND_BUCKETS,
+)
+ai_upstream_failures_total = registry.counter(
+    "ai_upstream_failures_total",
+    "Upstream completion attempts that failed, by HTTP status or exception",
+    ["reason"],
+)
+ai_fallbacks_total = registry.counter(
+    "ai_fallbacks_total",
+    "Answers that did not come from the requested model, e.g. the canned apology",
+    ["kind"],
+)
+
+
+def record_completion(
+    model: str,
+    mode: str,
+    total_seconds: float,
+    completion_tokens: int = 0,
+    ttft_seconds: Optional[float] = None,
+) -> None:
+    """Observe one successful upstream completion; mode is "chat" or "stream"
+
+    Generation speed is measured from the first token when it is known, from
+    the request otherwise.
+    """
+    if not metrics_settings.metrics_enabled:
+        return
+    ai_upstream_completion_seconds.observe(total_seconds, model, mode)
+    if ttft_seconds is not None:
+        ai_upstream_ttft_seconds.observe(ttft_seconds, model)
+    generation_seconds = total_seconds - (ttft_seconds or 0)
+    if completion_tokens and generation_seconds > 0:
+        ai_upstream_tokens_per_second.observe(completion_tokens / generation_seconds, model, mode)
+
+
+def record_upstream_failure(reason: str) -> None:
+    if metrics_settings.metrics_enabled:
+        ai_upstream_failures_total.inc(reason)
+
+
+def record_fallback(kind: str) -> None:
+    if metrics_settings.metrics_enabled:
+        ai_fallbacks_total.inc(kind)
+
+
+class MetricsMiddleware:
+    """ASGI middleware observing the duration of every HTTP request by route template"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not metrics_settings.metrics_enabled:
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router stores the matched route in the scope; its path is the template
+            route = getattr(scope.get("route"), "path", UNMATCHED_ROUTE)
+            http_request_seconds.observe(
+                time.perf_counter() - start, scope["method"], route, str(status)
+            )
@@ -1,13 +1,29 @@
 import uuid
 from datetime import datetime
 
-from sqlalchemy import Column, DateTime, ForeignKey, String, Text
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    Date,
+    DateTime,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    Text,
+    text,
+)
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 
 Base = declarative_base()
 
+# Text search configuration of the chat_messages content index; language
+# independent, since conversations mix Chinese and English
+CHAT_SEARCH_CONFIG = "simple"
+
 
 class Item(Base):
     __tablename__ = "items"
@@ -50,9 +66,19 @@ class User(Base):
 # For future expansion - Chat history model to store AI conversations
 class ChatMessage(Base):
     __tablename__ = "chat_messages"
+    __table_args__ = (
+        # Keyset pagination of a session's history in timestamp order, id breaks ties
+        Index("ix_chat_messages_session_id_timestamp", "session_id", "timestamp", "id"),
+        Index(
+            "ix_chat_messages_content_tsv",
+            text(f"to_tsvector('{CHAT_SEARCH_CONFIG}', content)"),
+            postgresql_using="gin",
+        ),
+    )
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    session_id = Column(UUID(as_uuid=True), index=True, nullable=False)
+    # Indexed together with timestamp, see __table_args__
+    session_id = Column(UUID(as_uuid=True), nullable=False)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=True)
     is_user = Column(String(1), nullable=False)  # "Y" for user message, "N" for AI response
     content = Column(Text, nullable=False)
@@ -61,4 +87,38 @@ class ChatMessage(Base):
     user = relationship("User")
     
     def __repr__(self):
-        return f"<ChatMessage(id={self.id}, is_user={self.is_user})>"
\ No newline at end of file
+        return f"<ChatMessage(id={self.id}, is_user={self.is_user})>"
+
+
+# Shared tier of the /chat response cache, see backend.app.chat_cache
+class ChatResponseCache(Base):
+    __tablename__ = "chat_response_cache"
+    
+    key = Column(String(64), primary_key=True)  # sha256 of (model, messages, max_tokens)
+    model = Column(String(255), nullable=False)
+    response = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f"<ChatResponseCache(key={self.key}, model={self.model})>"
+
+
+# Upstream token usage per day, session and model, see backend.app.usage
+class UsageDaily(Base):
+    __tablename__ = "usage_daily"
+    
+    day = Column(Date, primary_key=True)  # UTC
+    session_id = Column(UUID(as_uuid=True), primary_key=True)
+    model = Column(String(255), primary_key=True)
+    requests = Column(Integer, nullable=False, default=0)
+    # Requests whose token counts were estimated because the upstream omitted usage
+    estimated_requests = Column(Integer, nullable=False, default=0)
+    prompt_tokens = Column(BigInteger, nullable=False, default=0)
+    completion_tokens = Column(BigInteger, nullable=False, default=0)
+    cost = Column(Float, nullable=False, default=0.0)  # credits reported by OpenRouter
+    latency_ms = Column(BigInteger, nullable=False, default=0)  # summed upstream latency
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f"<UsageDaily(day={self.day}, session_id={self.session_id}, model={self.model})>"
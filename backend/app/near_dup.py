@@ -0,0 +1,269 @@
+import asyncio
+import logging
+import random
+import re
+import unicodedata
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, List, Optional, Set, Tuple
+
+from backend.app.chat_cache import chat_cache_settings, response_cache
+from backend.app.config import EnvSettings
+
+logger = logging.getLogger(__name__)
+
+
+class NearDupSettings(EnvSettings):
+    """Near-duplicate prompt cache"""
+
+    # 近似重复提示词缓存配置（默认关闭，建议先开启 shadow 模式观察命中质量）
+    near_dup_cache_enabled: bool = False
+    # Only report what would have been served, without returning it
+    near_dup_shadow: bool = False
+    # Minimum exact Jaccard similarity of the shingle sets to serve a cached answer
+    near_dup_threshold: float = 0.85
+    # Defaults to the size of the response cache the entries point into
+    near_dup_max_entries: int = chat_cache_settings.chat_cache_max_entries
+    # Longer prompts are not indexed; they rarely repeat and are expensive to sign
+    near_dup_max_chars: int = 2000
+    # Prompts longer than this are signed in a worker thread instead of on the event loop
+    near_dup_inline_chars: int = 500
+
+
+near_dup_settings = NearDupSettings()
+
+SHINGLE_SIZE = 4
+# 16 bands x 4 rows: pairs above ~0.5 similarity almost always share a bucket
+LSH_BANDS = 16
+LSH_ROWS = 4
+NUM_PERMUTATIONS = LSH_BANDS * LSH_ROWS
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(1)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(NUM_PERMUTATIONS)
+]
+
+# Signatures of recent prompts, so the answer is indexed without signing the prompt again
+SIGNATURE_CACHE_SIZE = 256
+
+_WHITESPACE = re.compile(r"\s+")
+
+Signature = Tuple[FrozenSet[int], Tuple[int, ...]]
+
+
+def normalize(text: str) -> str:
+    """Case-fold, drop punctuation and collapse whitespace"""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = "".join(" " if unicodedata.category(ch).startswith("P") else ch for ch in text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> FrozenSet[int]:
+    """Hashed character n-grams of normalized text"""
+    if len(text) <= size:
+        return frozenset([zlib.crc32(text.encode("utf-8"))])
+    return frozenset(
+        zlib.crc32(text[i : i + size].encode("utf-8")) for i in range(len(text) - size + 1)
+    )
+
+
+def minhash(hashed_shingles: FrozenSet[int]) -> Tuple[int, ...]:
+    """MinHash signature using universal hashing as permutations"""
+    values = list(hashed_shingles)
+    return tuple(min([(a * h + b) % _MERSENNE_PRIME for h in values]) for a, b in _PERMUTATIONS)
+
+
+def sign_text(text: str) -> Signature:
+    """Shingles and MinHash signature of a prompt"""
+    hashed = shingles(normalize(text))
+    return hashed, minhash(hashed)
+
+
+def jaccard(a: FrozenSet[int], b: FrozenSet[int]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+@dataclass
+class IndexEntry:
+    scope: str
+    shingles: FrozenSet[int]
+    signature: Tuple[int, ...]
+
+
+@dataclass
+class NearDuplicateMatch:
+    key: str
+    similarity: float
+
+
+class NearDuplicateIndex:
+    """MinHash/LSH index of prompts, pointing at exact-match cache keys
+
+    Prompts are only compared within the same scope (model, prior context and
+    max_tokens), so only the wording of the latest message may differ.
+    """
+
+    def __init__(
+        self,
+        *,
+        threshold: float = near_dup_settings.near_dup_threshold,
+        max_entries: int = near_dup_settings.near_dup_max_entries,
+        max_chars: int = near_dup_settings.near_dup_max_chars,
+    ):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        self.entries: "OrderedDict[str, IndexEntry]" = OrderedDict()
+        self.signatures: "OrderedDict[str, Signature]" = OrderedDict()
+        self.buckets: Dict[Tuple[str, int, Tuple[int, ...]], Set[str]] = {}
+        self.lookups = 0
+        self.hits = 0
+        self.candidates = 0
+        self.false_positives = 0
+        self.stale = 0
+        self.shadow_hits = 0
+        self.similarities: List[float] = []
+
+    @staticmethod
+    def _band_keys(scope: str, signature: Tuple[int, ...]):
+        for band in range(LSH_BANDS):
+            yield (scope, band, signature[band * LSH_ROWS : (band + 1) * LSH_ROWS])
+
+    def _remember_signature(self, text: str, signed: Signature) -> None:
+        self.signatures[text] = signed
+        self.signatures.move_to_end(text)
+        while len(self.signatures) > SIGNATURE_CACHE_SIZE:
+            self.signatures.popitem(last=False)
+
+    def _sign(self, text: str) -> Optional[Signature]:
+        if len(text) > self.max_chars:
+            return None
+        signed = self.signatures.get(text)
+        if signed is None:
+            signed = sign_text(text)
+            self._remember_signature(text, signed)
+        return signed
+
+    async def sign(self, text: str) -> Optional[Signature]:
+        """Signature of ``text``, computed off the event loop for long prompts"""
+        if len(text) <= near_dup_settings.near_dup_inline_chars:
+            return self._sign(text)
+        if len(text) > self.max_chars:
+            return None
+        signed = self.signatures.get(text)
+        if signed is None:
+            signed = await asyncio.to_thread(sign_text, text)
+            self._remember_signature(text, signed)
+        return signed
+
+    def add(self, scope: str, text: str, key: str, signed: Optional[Signature] = None) -> None:
+        """Index a prompt whose answer is stored in the response cache under ``key``"""
+        if signed is None:
+            signed = self._sign(text)
+        # The entry keeps the signature from now on
+        self.signatures.pop(text, None)
+        if signed is None:
+            return
+        if key in self.entries:
+            self.remove(key)
+        hashed, signature = signed
+        self.entries[key] = IndexEntry(scope, hashed, signature)
+        for band_key in self._band_keys(scope, signature):
+            self.buckets.setdefault(band_key, set()).add(key)
+        while len(self.entries) > self.max_entries:
+            self.remove(next(iter(self.entries)))
+
+    def remove(self, key: str) -> None:
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        for band_key in self._band_keys(entry.scope, entry.signature):
+            bucket = self.buckets.get(band_key)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self.buckets[band_key]
+
+    def query(
+        self, scope: str, text: str, signed: Optional[Signature] = None
+    ) -> Optional[NearDuplicateMatch]:
+        """Best verified match at or above the threshold"""
+        self.lookups += 1
+        if signed is None:
+            signed = self._sign(text)
+        if signed is None:
+            return None
+        hashed, signature = signed
+
+        candidates: Set[str] = set()
+        for band_key in self._band_keys(scope, signature):
+            candidates.update(self.buckets.get(band_key, ()))
+
+        best: Optional[NearDuplicateMatch] = None
+        for key in candidates:
+            self.candidates += 1
+            # LSH only proposes candidates, the exact shingle overlap decides
+            similarity = jaccard(hashed, self.entries[key].shingles)
+            if similarity < self.threshold:
+                self.false_positives += 1
+            elif best is None or similarity > best.similarity:
+                best = NearDuplicateMatch(key, similarity)
+
+        if best is not None:
+            self.entries.move_to_end(best.key)
+            self.similarities.append(best.similarity)
+            del self.similarities[:-1000]
+        return best
+
+    def stats(self) -> Dict[str, Any]:
+        ordered = sorted(self.similarities)
+        return {
+            "entries": len(self.entries),
+            "threshold": self.threshold,
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+            "candidates": self.candidates,
+            "false_positives": self.false_positives,
+            "false_positive_rate": (
+                round(self.false_positives / self.candidates, 4) if self.candidates else 0.0
+            ),
+            "stale": self.stale,
+            "shadow": near_dup_settings.near_dup_shadow,
+            "shadow_hits": self.shadow_hits,
+            "similarity_p50": ordered[len(ordered) // 2] if ordered else None,
+            "similarity_min": ordered[0] if ordered else None,
+        }
+
+
+near_dup_index = NearDuplicateIndex()
+
+
+async def find_near_duplicate(scope: str, text: str) -> Optional[Tuple[str, float]]:
+    """Cached answer of a similar earlier prompt in the same scope, with its similarity"""
+    match = near_dup_index.query(scope, text, await near_dup_index.sign(text))
+    if match is None:
+        return None
+    # The exact lookup of this request was already counted as a miss
+    answer = await response_cache.peek(match.key)
+    if answer is None:
+        # The answer expired or was evicted from the response cache
+        near_dup_index.stale += 1
+        near_dup_index.remove(match.key)
+        return None
+    if near_dup_settings.near_dup_shadow:
+        near_dup_index.shadow_hits += 1
+        logger.info(f"Near-duplicate shadow hit (similarity {match.similarity:.3f})")
+        return None
+    near_dup_index.hits += 1
+    return answer, match.similarity
+
+
+async def index_near_duplicate(scope: str, text: str, key: str) -> None:
+    """Index a prompt whose answer was just cached, reusing its lookup signature"""
+    near_dup_index.add(scope, text, key, await near_dup_index.sign(text))
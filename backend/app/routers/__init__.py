@@ -1,2 +1,2 @@
 # Import routers to make them available for inclusion in main.py
-from backend.app.routers import ai, items
\ No newline at end of file
+from backend.app.routers import admin, ai, items
\ No newline at end of file
@@ -0,0 +1,111 @@
+from datetime import datetime, timedelta
+from typing import Optional
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.app.admission import admission_stats
+from backend.app.chat_cache import response_cache
+from backend.app.db import get_session
+from backend.app.hedging import hedger
+from backend.app.instrumentation import get_slow_queries
+from backend.app.logging_config import logging_stats
+from backend.app.near_dup import near_dup_index
+from backend.app.routing import upstream_router
+from backend.app.singleflight import chat_flights, stream_flights
+from backend.app.summarizer import conversation_summarizer
+from backend.app.upstream import upstream_health
+from backend.app.usage import top_usage, usage_accumulator
+from backend.app.write_behind import chat_write_behind
+
+router = APIRouter()
+
+
+@router.get("/admin/slow-queries")
+async def read_slow_queries():
+    """Get recently captured slow SQL statements and their EXPLAIN plans"""
+    queries = get_slow_queries()
+    return {"queries": queries, "total": len(queries)}
+
+
+@router.get("/admin/upstream/health")
+async def read_upstream_health():
+    """Get per-endpoint health and circuit breaker state of the AI upstream"""
+    return {"endpoints": upstream_health.snapshot()}
+
+
+@router.get("/admin/upstream/routing")
+async def read_upstream_routing():
+    """Get the (endpoint, model) targets ranked by observed latency, speed and errors"""
+    return {"targets": upstream_router.ranking()}
+
+
+@router.get("/admin/upstream/hedging")
+async def read_upstream_hedging():
+    """Get hedge rate, hedge wins and current hedge delays of upstream requests"""
+    return hedger.snapshot()
+
+
+@router.get("/admin/chat-cache")
+async def read_chat_cache_stats():
+    """Get size and hit rate of the /chat response cache"""
+    return response_cache.stats()
+
+
+@router.get("/admin/near-dup-cache")
+async def read_near_dup_cache_stats():
+    """Get hit and false-positive rates of the near-duplicate prompt index"""
+    return near_dup_index.stats()
+
+
+@router.get("/admin/single-flight")
+async def read_single_flight_stats():
+    """Get how many identical in-flight chat requests were coalesced"""
+    return {"chat": chat_flights.stats(), "stream": stream_flights.stats()}
+
+
+@router.get("/admin/admission")
+async def read_admission_stats():
+    """Get concurrency, queue depth, wait times and rate limiting of the AI endpoints"""
+    return admission_stats()
+
+
+@router.get("/admin/write-behind")
+async def read_write_behind_stats():
+    """Get backlog, lag and flush statistics of the chat history write-behind queue"""
+    return chat_write_behind.stats()
+
+
+@router.get("/admin/summarizer")
+async def read_summarizer_stats(session_id: Optional[UUID] = None):
+    """Get conversation compaction totals, or the compaction stats of one session"""
+    return conversation_summarizer.stats(session_id)
+
+
+@router.get("/admin/logging")
+async def read_logging_stats():
+    """Get queued logging counters and the event-loop time spent in logging calls"""
+    return logging_stats()
+
+
+@router.get("/admin/usage")
+async def read_usage_stats():
+    """Get recording and flush statistics of the upstream token usage accounting"""
+    return usage_accumulator.stats()
+
+
+@router.get("/admin/usage/top")
+async def read_top_usage(
+    group_by: str = Query("session", pattern="^(session|model)$"),
+    days: int = Query(7, ge=1, le=366),
+    limit: int = Query(20, ge=1, le=500),
+    order_by: str = Query(
+        "prompt_tokens", pattern="^(requests|prompt_tokens|completion_tokens|cost|latency_ms)$"
+    ),
+    db: AsyncSession = Depends(get_session),
+):
+    """Get the sessions or models with the most upstream token usage over the last days"""
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    entries = await top_usage(db, group_by, since, limit, order_by)
+    return {"group_by": group_by, "since": since.isoformat(), "entries": entries}
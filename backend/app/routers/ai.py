@@ -1,184 +1,170 @@
-import os
 import uuid
 import logging
 import json
-import traceback
-import sys
+import time
 from typing import List, Optional, Dict, Any, Union
-from pathlib import Path
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 import httpx
-from dotenv import load_dotenv, find_dotenv
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from backend.app.schemas import ChatRequest, ChatResponse
+from backend.app.admission import admission, upstream_limiter
+from backend.app.batch import batch_settings, map_unordered
+from backend.app.chat_cache import cache_key, chat_cache_settings, replay_chunks, response_cache
+from backend.app.config import Settings, get_settings
+from backend.app.context_builder import budget_for_model, build_context
+from backend.app.conversations import conversation_store
+from backend.app.db import get_session
+from backend.app.hedging import hedger, hedging_settings
+from backend.app.logging_config import SampledLogger
+from backend.app.metrics import record_completion, record_fallback, record_upstream_failure
+from backend.app.near_dup import find_near_duplicate, index_near_duplicate, near_dup_settings
+from backend.app.routing import MODEL_ERROR_STATUSES, RouteTarget, upstream_router
+from backend.app.schemas import BatchChatItem, BatchChatRequest, ChatRequest, ChatResponse
+from backend.app.singleflight import chat_flights, single_flight_settings, stream_flights
+from backend.app.sse import dumps, iter_content_deltas
+from backend.app.summarizer import conversation_summarizer, summary_settings
+from backend.app.streaming import (
+    SSE_MEDIA_TYPE,
+    ClosingStreamingResponse,
+    StreamError,
+    StreamUsage,
+    event_stream,
+    plain_text,
+    relay,
+    wants_event_stream,
+)
+from backend.app.upstream import CONNECTION_TEST_TIMEOUT, get_http_client, upstream_health
+from backend.app.usage import resolve_usage, usage_accumulator, usage_settings
 
 # 配置日志
+# Handlers, format and throttling are set up in backend.app.logging_config
 logger = logging.getLogger(__name__)
+# Per-request and per-chunk details, only a sample of which is logged
+sampled_log = SampledLogger(logger)
 
-# Setup console logging - ensure messages appear in the console too
-console_handler = logging.StreamHandler(sys.stdout)
-console_handler.setLevel(logging.INFO)
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-console_handler.setFormatter(formatter)
-logger.addHandler(console_handler)
-logger.setLevel(logging.INFO)
-
-# Debug function to log directly to console - guaranteed visible
-def console_log(message):
-    """Log directly to console with visible markers"""
-    print(f"\n{'='*50}")
-    print(f"AI MODULE: {message}")
-    print(f"{'='*50}\n")
-    # Also log through regular logger
-    logger.info(message)
-    
-console_log("AI Module initialized - Console logging enabled")
-
-# Print current working directory to help debug path issues
-cwd = os.getcwd()
-logger.info(f"Current working directory: {cwd}")
-
-# Debug function to print all environment variables
-def print_env_variables():
-    """Print all environment variables (with sensitive values masked)"""
-    logger.info("=== Environment Variables ===")
-    for key, value in os.environ.items():
-        # Skip outputting some standard environment variables to reduce clutter
-        if key.startswith("PATH") or key.startswith("PYTHON") or key in ["USERNAME", "USER", "HOME"]:
-            continue
-            
-        # Mask API keys and tokens
-        if "KEY" in key or "TOKEN" in key or "SECRET" in key:
-            if value and len(value) > 8:
-                masked_value = f"{value[:5]}...{value[-4:]}"
-            else:
-                masked_value = "[SET]" if value else "[NOT SET]"
-            logger.info(f"{key}={masked_value}")
-        else:
-            logger.info(f"{key}={value}")
-    logger.info("===========================")
-
-# Call the debug function
-print_env_variables()
-
-# 获取项目根目录 - Multiple approaches to find .env
-paths_to_try = [
-    Path(__file__).resolve().parent.parent.parent.parent / ".env",  # Standard path
-    Path(cwd) / ".env",  # Current working directory
-    Path(cwd).parent / ".env",  # Parent of current working directory
-]
-
-env_loaded = False
-# Try each path
-for env_path in paths_to_try:
-    logger.info(f"Trying to load .env from: {env_path}")
-    if env_path.exists():
-        logger.info(f"Found .env file at {env_path}")
-        load_dotenv(dotenv_path=env_path)
-        env_loaded = True
-        break
-
-# If no path worked, try find_dotenv as a last resort
-if not env_loaded:
-    logger.warning(f"No .env file found in standard locations. Trying find_dotenv()...")
-    dotenv_path = find_dotenv()
-    if dotenv_path:
-        logger.info(f"Found .env at {dotenv_path}")
-        load_dotenv(dotenv_path=dotenv_path)
-        env_loaded = True
-    else:
-        logger.error("No .env file found anywhere! API calls will likely fail.")
-
-# 获取环境变量
-# OPENROUTER_API_KEY = os.environ.get("OPENROUTER_API_KEY", "testkey") # Removed default
-OPENROUTER_API_KEY = os.environ.get("OPENROUTER_API_KEY")
-# Ensure we have a default value for the URL
-OPENROUTER_API_URL = os.environ.get("OPENROUTER_API_URL", "https://openrouter.ai/api/v1/chat/completions")
-# Alternative API URLs to try if the main one fails
-ALTERNATE_API_URLS = [
-    "https://openrouter.ai/api/v1/chat/completions",  # Standard URL
-    "https://api.openrouter.ai/api/v1/chat/completions",  # Alternative with api subdomain
-]
-MODEL_NAME = os.environ.get("MODEL_NAME") # Also get model name here
-
-# CRITICAL - Last resort fallback if .env not loading properly
-if not OPENROUTER_API_KEY:
-    logger.warning("HARDCODED FALLBACK: OpenRouter API key not found in environment variables")
-    # 使用硬编码的API密钥（仅用于测试）
-    hardcoded_key = "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"
-    logger.warning(f"Using HARDCODED OpenRouter API key: {hardcoded_key[:8]}... (FOR TESTING ONLY)")
-    OPENROUTER_API_KEY = hardcoded_key
-
-if not MODEL_NAME:
-    logger.warning("HARDCODED FALLBACK: MODEL_NAME not found in environment variables")
-    hardcoded_model = "anthropic/claude-3-haiku" # Guaranteed to work with OpenRouter
-    logger.warning(f"Using HARDCODED model: {hardcoded_model} (FOR TESTING ONLY)")
-    MODEL_NAME = hardcoded_model
-
-# Check if essential variables are loaded
-# 硬编码的fallback已经确保API密钥不为空，所以这里只需记录警告
-if not OPENROUTER_API_KEY:
-    logger.warning("API key is still missing after fallback attempts!")
-    logger.warning("Attempted loading from: " + ", ".join(str(p) for p in paths_to_try))
-else:
-    # Check OpenRouter API key format (should start with sk-or-)
-    if not OPENROUTER_API_KEY.startswith('sk-or-'):
-        logger.warning(f"API key may have incorrect format. OpenRouter API keys typically start with 'sk-or-'")
-        logger.warning(f"Current key format: {OPENROUTER_API_KEY[:5]}...")
-        
-# 硬编码的fallback已经确保OPENROUTER_API_URL不为空，此处可省略
-# if not OPENROUTER_API_URL:
-#      logger.error("CRITICAL: OPENROUTER_API_URL not found.")
-     
-# 硬编码的fallback已经确保MODEL_NAME不为空，所以这里只需记录模型信息
-if MODEL_NAME:
-     # Log model name information
-     logger.info(f"Using model: '{MODEL_NAME}'")
-     
-     # Common OpenRouter models include:
-     # - anthropic/claude-3-opus
-     # - anthropic/claude-3-sonnet
-     # - anthropic/claude-3-haiku  
-     # - meta-llama/llama-3-70b-instruct
-     # - google/gemini-pro
-     # - mistralai/mistral-7b-instruct
-     
-     # Check for Qwen model format (but don't change unless needed)
-     if "qwen" in MODEL_NAME.lower():
-         logger.info("Using Qwen model")
-
-# 打印API密钥前5个字符，用于调试
-# if OPENROUTER_API_KEY != "testkey": # Condition no longer needed
-if OPENROUTER_API_KEY:
-    logger.info(f"Using API key: {OPENROUTER_API_KEY[:5]}...")
-    # Confirm the format has proper Bearer prefix
-    auth_header = f"Bearer {OPENROUTER_API_KEY}"
-    logger.info(f"Authorization header will be: Bearer sk-****...")
-# else: # Removed else block
-#     logger.warning("Using default API key (testkey)")
 
 router = APIRouter()
 
-@router.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+
+def upstream_urls() -> List[str]:
+    """Configured primary URL followed by the alternates, without duplicates"""
+    settings = get_settings()
+    urls = [settings.openrouter_api_url]
+    urls.extend(url for url in settings.alternate_api_urls if url and url not in urls)
+    return urls
+
+
+def upstream_headers() -> Dict[str, str]:
+    """Headers required by OpenRouter"""
+    return {
+        "Authorization": f"Bearer {get_settings().openrouter_api_key}",
+        "Content-Type": "application/json"
+    }
+
+
+def record_upstream_status(url: str, status_code: int) -> None:
+    """Feed a real upstream response into the endpoint circuit breaker"""
+    if status_code >= 500 or status_code == 429:
+        upstream_health.record_failure(url, f"HTTP {status_code}")
+    else:
+        upstream_health.record_success(url)
+
+
+def record_target_status(target: RouteTarget, status_code: int) -> None:
+    """Feed an upstream response status into the circuit breaker and the router"""
+    record_upstream_status(target.url, status_code)
+    if status_code != 200:
+        upstream_router.record_failure(target, f"HTTP {status_code}")
+        record_upstream_failure(f"http_{status_code}")
+
+
+def record_target_error(target: RouteTarget, error: Exception) -> None:
+    """Feed a failed upstream request into the circuit breaker and the router"""
+    logger.warning(
+        "Error with %s at %s: %s: %s", target.model, target.url, type(error).__name__, error
+    )
+    upstream_health.record_failure(target.url, f"{type(error).__name__}: {error}")
+    upstream_router.record_failure(target, f"{type(error).__name__}: {error}")
+    record_upstream_failure(type(error).__name__)
+
+
+async def summarize_conversation(messages: List[Dict[str, str]]) -> str:
+    """Summary of older turns for the compaction worker; no hedging or fallback models"""
+    if not get_settings().openrouter_api_key:
+        raise RuntimeError("OPENROUTER_API_KEY is not set")
+    model = summary_settings.summary_model or get_settings().model_name
+    payload = {
+        "model": model,
+        "messages": messages,
+        "max_tokens": summary_settings.summary_max_tokens,
+    }
+    for target in upstream_router.candidates(upstream_urls(), model, fallback_models=[]):
+        try:
+            response = await get_http_client().post(
+                target.url, json=payload, headers=upstream_headers()
+            )
+        except Exception as e:
+            record_target_error(target, e)
+            continue
+        record_target_status(target, response.status_code)
+        if response.status_code == 200:
+            return response.json()["choices"][0]["message"]["content"] or ""
+    raise RuntimeError("No upstream endpoint produced a summary")
+
+
+def compact_session(session_id: uuid.UUID) -> None:
+    """Queue the session for summarization once its history outgrows the threshold"""
+    if summary_settings.summary_enabled:
+        conversation_summarizer.schedule(session_id, summarize_conversation)
+
+
+def completion_tokens(response) -> Optional[int]:
+    """Completion token count reported in a non-streaming response, if any"""
+    try:
+        usage = response.json().get("usage") or {}
+    except Exception:
+        return None
+    tokens = usage.get("completion_tokens")
+    return tokens if isinstance(tokens, int) else None
+
+
+@router.post("/chat", response_model=ChatResponse, dependencies=[Depends(admission("chat"))])
+async def chat(
+    request: ChatRequest,
+    http_response: Response,
+    db: AsyncSession = Depends(get_session),
+    settings: Settings = Depends(get_settings),
+):
     """Process a chat message using OpenRouter API"""
-    # 在函数开头声明global
-    global OPENROUTER_API_URL
-    
+    return await answer_chat(request, http_response, db, settings)
+
+
+async def answer_chat(
+    request: ChatRequest,
+    http_response: Response,
+    db: Optional[AsyncSession],
+    settings: Settings,
+    persist: bool = True,
+) -> Dict[str, Any]:
+    """Answer one chat message: cache, coalescing, upstream call and history
+
+    ``upstream_error`` in the result marks the apology texts returned when no
+    upstream produced an answer.
+    """
     # Generate a session ID if not provided
     session_id = request.session_id or uuid.uuid4()
     
     # 如果请求中指定了模型，使用请求中的模型
     request_model = request.model
     if request_model and request_model.strip():
-        console_log(f"使用请求指定的模型: {request_model}")
+        sampled_log.debug("使用请求指定的模型: %s", request_model)
         current_model = request_model
     else:
-        current_model = MODEL_NAME
+        current_model = settings.model_name
     
     # Check if API key is available (and not empty string)
-    if not OPENROUTER_API_KEY or OPENROUTER_API_KEY.strip() == "":
+    if not settings.openrouter_api_key or settings.openrouter_api_key.strip() == "":
         logger.error("Missing or empty OpenRouter API key")
         raise HTTPException(
             status_code=500,
@@ -195,306 +181,425 @@ async def chat(request: ChatRequest):
     
     # Apply Qwen-specific checks based on model
     if "qwen" in current_model.lower():
-        logger.info(f"Qwen model detected: {current_model}")
+        sampled_log.debug("Qwen model detected: %s", current_model)
         # Check if Qwen model is available on OpenRouter
         if "qwen2.5" in current_model.lower():
             # While we'll try to use it, log a note for troubleshooting
-            logger.info("Using Qwen 2.5 model - make sure this model is available via OpenRouter")
+            sampled_log.debug("Using Qwen 2.5 model - make sure this model is available via OpenRouter")
     
     # Prepare the context for the AI model
     messages = []
     
     # Add context from previous messages if available
     if request.context:
+        # Older clients still send the whole conversation
         for msg in request.context:
             messages.append(msg)
+    elif request.session_id:
+        # Otherwise the history is rebuilt from the server-side conversation store
+        messages.extend(await conversation_store.history(db, session_id))
     
     # Add the current message
     messages.append({"role": "user", "content": request.message})
     
-    try:
-        # Log the API key being used (partially masked)
-        masked_key = f"{OPENROUTER_API_KEY[:8]}...{OPENROUTER_API_KEY[-4:]}" if len(OPENROUTER_API_KEY) > 12 else OPENROUTER_API_KEY
-        logger.info(f"Attempting OpenRouter request with API Key: {masked_key}")
-        logger.info(f"Using model: '{current_model}'")
+    # Keep the prompt within the model's token budget: newest turns first, older ones dropped
+    context = build_context(messages, budget_for_model(current_model))
+    messages = context.messages
+    if context.dropped or context.collapsed:
+        logger.info(
+            f"Context trimmed to ~{context.estimated_tokens} tokens: "
+            f"dropped {context.dropped}, shortened {context.collapsed} messages"
+        )
+    
+    # Identical (model, messages, max_tokens) requests are answered from the cache
+    use_cache = chat_cache_settings.chat_cache_enabled and request.use_cache
+    key = cache_key(current_model, messages, settings.max_tokens)
+    # Near-duplicate prompts are only matched against the same model and prior context
+    scope = cache_key(current_model, messages[:-1], settings.max_tokens)
+    http_response.headers["X-Prompt-Tokens-Estimate"] = str(context.estimated_tokens)
+    cached = None
+    if use_cache:
+        cached = await response_cache.get(key)
+        http_response.headers["X-Cache"] = "MISS" if cached is None else "HIT"
+        if cached is None and near_dup_settings.near_dup_cache_enabled:
+            near_duplicate = await find_near_duplicate(scope, request.message)
+            if near_duplicate is not None:
+                cached, similarity = near_duplicate
+                http_response.headers["X-Cache"] = "NEAR-HIT"
+                http_response.headers["X-Cache-Similarity"] = f"{similarity:.3f}"
+    
+    async def complete():
+        try:
+            # Log the API key being used (partially masked)
+            sampled_log.debug(
+                "Attempting OpenRouter request for model '%s' with API Key: %s",
+                current_model,
+                settings.masked_api_key,
+            )
         
-        # Call the OpenRouter API
-        async with httpx.AsyncClient() as client:
+            # Call the OpenRouter API over the shared keep-alive client
+            client = get_http_client()
             # OpenRouter requires specific format for models and headers
             # Reference: https://openrouter.ai/docs
-            
-            # Check if the model is likely a Qwen model
-            fallback_model = None
-            try_model = current_model
-            
-            # Always define a fallback model for reliability
-            fallback_model = "anthropic/claude-3-haiku"
-            logger.info(f"Primary model: {try_model}, Fallback model: {fallback_model}")
-            
+        
             # Ensure API key is properly formatted
             # OpenRouter keys start with sk-or-
-            if not OPENROUTER_API_KEY.startswith("sk-or-"):
+            if not settings.openrouter_api_key.startswith("sk-or-"):
                 logger.warning(f"API key doesn't start with 'sk-or-', this might cause authentication issues")
                 # Try fixing the key if it looks wrong
-                if OPENROUTER_API_KEY.startswith("sk-"):
+                if settings.openrouter_api_key.startswith("sk-"):
                     logger.warning("API key starts with 'sk-' but not 'sk-or-', this might be an OpenAI key instead of OpenRouter")
-            
-            # Try using a basic, proven model to test the API connection
-            test_connection = True  # Set to True to always try a test first
-            
+        
             # Simplest possible payload - bare minimum required fields
             payload = {
-                "model": try_model,
+                "model": current_model,
                 "messages": messages,
                 # 限制token数量，避免积分不足问题
-                "max_tokens": 500  # 限制回复长度，减少token消耗
+                "max_tokens": settings.max_tokens
             }
-            
+        
             # Absolute minimal headers required by OpenRouter
-            headers = {
-                "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-                "Content-Type": "application/json"
-            }
-            
-            # First try a test connection with a guaranteed working model if needed
-            if test_connection:
-                try:
-                    # Ensure we have a URL to test
-                    test_url = OPENROUTER_API_URL or ALTERNATE_API_URLS[0]
-                    console_log(f"TESTING API CONNECTION to {test_url}")
-                    console_log(f"Using API Key: {OPENROUTER_API_KEY[:8]}...")
-                    
-                    test_payload = {
-                        "model": "anthropic/claude-3-haiku",
-                        "messages": [{"role": "user", "content": "Hi"}],
-                        "max_tokens": 10  # 严格限制token数，这只是个测试
-                    }
-                    
-                    # Log complete request details
-                    console_log(f"TEST REQUEST: {json.dumps(test_payload)}")
-                    console_log(f"TEST HEADERS: Authorization: Bearer {OPENROUTER_API_KEY[:8]}..., Content-Type: application/json")
-                    
-                    # Make the request with more detailed error handling
+            headers = upstream_headers()
+        
+            # Best (endpoint, model) targets first: requested model, then the fallback models
+            targets = upstream_router.candidates(upstream_urls(), current_model)
+            primary_urls = [target.url for target in targets if target.model == current_model]
+            # Model and latency of the successful attempt, for usage accounting
+            answered_model, upstream_ms = current_model, 0.0
+        
+            if hedging_settings.upstream_hedging_enabled and len(primary_urls) > 1:
+                # Race each model's endpoints instead of waiting out a slow one's full timeout,
+                # moving on to the fallback models like the sequential loop does
+                for model in dict.fromkeys(target.model for target in targets):
+                    model_urls = [target.url for target in targets if target.model == model]
+                    payload["model"] = model
+                    started = time.perf_counter()
                     try:
-                        test_response = await client.post(
-                            test_url,
+                        current_url, response = await hedger.post(
+                            client,
+                            model_urls,
                             headers=headers,
-                            json=test_payload,
-                            timeout=10.0
+                            json=payload,
+                            stop_statuses=MODEL_ERROR_STATUSES,
+                            on_response=lambda url, status, model=model: record_target_status(
+                                RouteTarget(url, model), status
+                            ),
+                            on_error=lambda url, e, model=model: record_target_error(
+                                RouteTarget(url, model), e
+                            ),
                         )
-                        
-                        # Log complete response
-                        console_log(f"TEST RESPONSE STATUS: {test_response.status_code}")
-                        console_log(f"TEST RESPONSE HEADERS: {dict(test_response.headers)}")
-                        console_log(f"TEST RESPONSE BODY: {test_response.text[:1000]}")
-                        
-                        if test_response.status_code == 200:
-                            console_log("✅ TEST CONNECTION SUCCESSFUL!")
-                            try:
-                                resp_data = test_response.json()
-                                console_log(f"TEST RESPONSE PARSED JSON: {json.dumps(resp_data)[:500]}...")
-                            except Exception as e:
-                                console_log(f"Could not parse test response as JSON: {str(e)}")
-                        else:
-                            console_log(f"❌ TEST CONNECTION FAILED: HTTP {test_response.status_code}")
-                            console_log(f"RESPONSE TEXT: {test_response.text}")
-                            
-                            # Try to check specific error reasons
-                            if test_response.status_code == 401:
-                                console_log("AUTHENTICATION ERROR: Invalid API key or unauthorized")
-                            elif test_response.status_code == 400:
-                                console_log("BAD REQUEST: Check model name or request format")
-                            elif test_response.status_code == 404:
-                                console_log("NOT FOUND: Check API URL or model name")
-                            elif test_response.status_code == 422:
-                                console_log("VALIDATION ERROR: Check request parameters")
-                    
-                    except httpx.ConnectError as e:
-                        console_log(f"CONNECTION ERROR: Could not connect to {test_url}")
-                        console_log(f"Error details: {str(e)}")
-                        console_log("Check internet connection and API URL")
-                        
-                    except httpx.TimeoutException as e:
-                        console_log(f"TIMEOUT ERROR: Connection to {test_url} timed out")
-                        console_log(f"Error details: {str(e)}")
-                        
                     except Exception as e:
-                        console_log(f"UNEXPECTED ERROR during request: {type(e).__name__}: {str(e)}")
-                        traceback.print_exc()
-                
-                except Exception as e:
-                    console_log(f"CRITICAL ERROR in test connection: {type(e).__name__}: {str(e)}")
-                    traceback.print_exc()
-            
-            # If the test connection isn't successful, try all alternate URLs for the actual request
-            all_urls_to_try = []
-            if OPENROUTER_API_URL:
-                all_urls_to_try.append(OPENROUTER_API_URL)
-            # 添加所有不在列表中且不为None的备用URL    
-            all_urls_to_try.extend([url for url in ALTERNATE_API_URLS if url and url not in all_urls_to_try])
-            
-            # 确保我们至少有一个URL可以尝试
-            if not all_urls_to_try:
-                all_urls_to_try = ["https://openrouter.ai/api/v1/chat/completions"]
-                console_log("No valid URLs found, using default URL")
-                
-            # Try each URL in turn
-            for i, current_url in enumerate(all_urls_to_try):
-                console_log(f"Attempt {i+1}/{len(all_urls_to_try)}: Trying URL {current_url}")
-                
-                try:
-                    # First attempt with the requested model
-                    response = await client.post(
+                        logger.warning(
+                            f"All hedged attempts for {model} failed: {type(e).__name__}: {e}"
+                        )
+                        continue
+                    sampled_log.debug(
+                        "Hedged response status: %s from %s",
+                        response.status_code,
                         current_url,
-                        headers=headers,
-                        json=payload,
-                        timeout=30.0
                     )
-                    
-                    # Log response status
-                    console_log(f"Response status: {response.status_code} from {current_url}")
-                    
-                    # If successful, use this URL and stop trying others
                     if response.status_code == 200:
-                        console_log(f"Successful response from {current_url}")
-                        if current_url != OPENROUTER_API_URL:
-                            console_log(f"Updating primary API URL to {current_url}")
-                            OPENROUTER_API_URL = current_url
+                        elapsed_ms = (time.perf_counter() - started) * 1000
+                        tokens = completion_tokens(response)
+                        upstream_router.record_success(
+                            RouteTarget(current_url, model), None, elapsed_ms
+                        )
+                        record_completion(model, "chat", elapsed_ms / 1000, tokens or 0)
+                        answered_model, upstream_ms = model, elapsed_ms
+                        if model != current_model:
+                            record_fallback("fallback_model")
                         break
-                    
-                    # Check if model not found and try fallback if available
-                    if response.status_code in [404, 400] and fallback_model and try_model != fallback_model:
-                        error_text = response.text
-                        console_log(f"Primary model error ({response.status_code}): {error_text}")
-                        console_log(f"Trying fallback model: {fallback_model} on {current_url}")
-                        
-                        # Update payload with fallback model
-                        payload["model"] = fallback_model
-                        
-                        # Make second attempt with fallback model
+                    if response.status_code in MODEL_ERROR_STATUSES:
+                        logger.warning(
+                            f"Model error ({response.status_code}) for {model}: "
+                            f"{response.text[:200]}"
+                        )
+            else:
+                # Models that answered with a model error are not retried on other endpoints
+                unavailable_models = set()
+                for i, target in enumerate(targets):
+                    if target.model in unavailable_models:
+                        continue
+                    sampled_log.debug(
+                        "Attempt %d/%d: Trying %s at %s",
+                        i + 1,
+                        len(targets),
+                        target.model,
+                        target.url,
+                    )
+                    payload["model"] = target.model
+                    started = time.perf_counter()
+            
+                    try:
                         response = await client.post(
-                            current_url,
+                            target.url,
                             headers=headers,
-                            json=payload,
-                            timeout=30.0
+                            json=payload
                         )
-                        console_log(f"Fallback response status: {response.status_code}")
-                        
-                        # If successful with fallback model, stop trying other URLs
+                
+                        # Log response status
+                        sampled_log.debug(
+                            "Response status: %s from %s",
+                            response.status_code,
+                            target.url,
+                        )
+                        record_target_status(target, response.status_code)
+                
+                        # If successful, use this target and stop trying others
                         if response.status_code == 200:
-                            console_log(f"Successful response with fallback model from {current_url}")
+                            elapsed_ms = (time.perf_counter() - started) * 1000
+                            tokens = completion_tokens(response)
+                            # Not streamed: the whole request time, no first-token time
+                            upstream_router.record_success(target, None, elapsed_ms)
+                            record_completion(target.model, "chat", elapsed_ms / 1000, tokens or 0)
+                            answered_model, upstream_ms = target.model, elapsed_ms
+                            if target.model != current_model:
+                                record_fallback("fallback_model")
+                            sampled_log.debug(
+                                "Successful response from %s at %s",
+                                target.model,
+                                target.url,
+                            )
                             break
                 
-                except Exception as e:
-                    console_log(f"Error with URL {current_url}: {type(e).__name__}: {str(e)}")
-                    # Continue trying other URLs
+                        if response.status_code in MODEL_ERROR_STATUSES:
+                            logger.warning(
+                                f"Model error ({response.status_code}) for {target.model}: "
+                                f"{response.text[:200]}"
+                            )
+                            unavailable_models.add(target.model)
             
+                    except Exception as e:
+                        record_target_error(target, e)
+                        # Continue trying other targets
+        
             # For debugging, log the final response content
             if 'response' in locals():
-                console_log(f"Final response content: {response.text[:500]}")
-                
+                sampled_log.debug("Final response content: %.500s", response.text)
+            
                 # Process the response if we have one
                 try:
                     # Check for successful response status
                     if response.status_code == 200:
                         try:
                             data = response.json()
-                            console_log(f"Response JSON: {json.dumps(data)[:500]}")
-                            
+                            # %.500s renders the payload only when the record is emitted
+                            sampled_log.debug("Response JSON: %.500s", data)
+                        
                             # 检查是否返回了错误响应
                             if "error" in data:
                                 error_code = data.get("error", {}).get("code")
                                 error_msg = data.get("error", {}).get("message", "未知错误")
-                                console_log(f"API返回错误: code={error_code}, message={error_msg}")
-                                
+                                logger.warning(f"API返回错误: code={error_code}, message={error_msg}")
+                            
                                 # 特殊处理402积分不足错误
                                 if error_code == 402:
+                                    record_fallback("credits_exhausted")
                                     return {
                                         "message": f"AI服务暂时无法使用：积分不足。{error_msg}",
-                                        "session_id": session_id
+                                        "session_id": session_id,
+                                        "upstream_error": True
                                     }
-                                
+                            
                                 # 处理其他错误
+                                record_fallback("upstream_error_response")
                                 return {
                                     "message": f"AI服务返回错误: {error_msg}",
-                                    "session_id": session_id
+                                    "session_id": session_id,
+                                    "upstream_error": True
                                 }
-                            
+                        
                             # 验证预期的响应格式
                             if "choices" not in data:
-                                console_log(f"API response missing 'choices': {data}")
+                                logger.warning(f"API response missing 'choices': {data}")
                                 raise ValueError(f"Invalid API response missing 'choices': {data}")
-                            
+                        
                             if not data["choices"] or not isinstance(data["choices"], list):
-                                console_log(f"API response has empty choices: {data}")
+                                logger.warning(f"API response has empty choices: {data}")
                                 raise ValueError(f"Invalid API response with empty choices: {data}")
-                            
+                        
                             if "message" not in data["choices"][0]:
-                                console_log(f"API response missing message in first choice: {data['choices'][0]}")
+                                logger.warning(f"API response missing message in first choice: {data['choices'][0]}")
                                 raise ValueError("Invalid API response format: missing message in first choice")
-                            
+                        
                             if "content" not in data["choices"][0]["message"]:
-                                console_log(f"API response missing content in message: {data['choices'][0]['message']}")
+                                logger.warning(f"API response missing content in message: {data['choices'][0]['message']}")
                                 raise ValueError("Invalid API response format: missing content in message")
-                            
+                        
                             # Extract the AI's response
                             ai_message = data["choices"][0]["message"]["content"]
-                            console_log(f"Got AI response: {ai_message[:100]}...")
-                            
+                            if usage_settings.usage_accounting_enabled:
+                                usage_accumulator.record(
+                                    session_id,
+                                    answered_model,
+                                    resolve_usage(
+                                        data.get("usage"), context.estimated_tokens, ai_message
+                                    ),
+                                    upstream_ms,
+                                )
+                            sampled_log.debug("Got AI response: %.100s...", ai_message)
+                        
+                            if use_cache:
+                                await response_cache.put(key, current_model, ai_message)
+                                if near_dup_settings.near_dup_cache_enabled:
+                                    await index_near_duplicate(scope, request.message, key)
                             return {"message": ai_message, "session_id": session_id}
                         except json.JSONDecodeError as e:
-                            console_log(f"Failed to parse JSON response: {str(e)}")
+                            logger.warning(f"Failed to parse JSON response: {e}")
                     else:
-                        console_log(f"Final response status code was not 200: {response.status_code}")
-                        
+                        logger.warning(f"Final response status code was not 200: {response.status_code}")
+                    
                         # 检查是否为积分不足错误
                         try:
                             error_data = response.json()
                             if "error" in error_data and error_data.get("error", {}).get("code") == 402:
                                 error_msg = error_data.get("error", {}).get("message", "")
-                                console_log(f"CREDITS ERROR: {error_msg}")
+                                record_fallback("credits_exhausted")
+                                logger.error(f"CREDITS ERROR: {error_msg}")
                                 # 返回自定义错误信息
                                 return {
                                     "message": f"AI服务暂时无法使用：积分不足。{error_msg}",
-                                    "session_id": session_id
+                                    "session_id": session_id,
+                                    "upstream_error": True
                                 }
                         except Exception as e:
-                            console_log(f"Failed to parse error response: {str(e)}")
+                            logger.warning(f"Failed to parse error response: {e}")
                 except Exception as e:
-                    console_log(f"Error processing final response: {type(e).__name__}: {str(e)}")
-                    traceback.print_exc()
-            
+                    logger.error(
+                        f"Error processing final response: {type(e).__name__}: {e}", exc_info=True
+                    )
+        
             # If we get here, we couldn't get a valid response from any URL or model
-            console_log("All API attempts failed, using hardcoded response")
+            logger.warning("All API attempts failed, using hardcoded response")
+            record_fallback("canned_response")
             hardcoded_resp = "我是AI助手，很高兴为您服务！您好！因为OpenRouter API连接暂时不可用，我目前使用的是后备响应模式。请稍后再试或联系管理员检查API配置。"
-            return {"message": hardcoded_resp, "session_id": session_id}
+            return {"message": hardcoded_resp, "session_id": session_id, "upstream_error": True}
     
+        except Exception as e:
+            logger.error(f"Outer exception handler caught: {str(e)}", exc_info=True)  # Add exc_info=True to get traceback
+            raise HTTPException(
+                status_code=500,
+                detail=f"Unexpected error: {str(e)}"
+            )
+
+    if cached is not None:
+        result = {"message": cached}
+    elif single_flight_settings.single_flight_enabled:
+        # Identical concurrent requests share a single upstream call
+        result, coalesced = await chat_flights.do(key, complete)
+        if coalesced:
+            http_response.headers["X-Coalesced"] = "true"
+    else:
+        result = await complete()
+    ai_message = result["message"]
+    
+    # A failed answer (the canned apology) is not part of the conversation
+    if persist and not result.get("upstream_error"):
+        # Persist the turn so the client only has to send the next message
+        await conversation_store.append_turn(db, session_id, request.message, ai_message)
+        compact_session(session_id)
+    return {
+        "message": ai_message,
+        "session_id": session_id,
+        "upstream_error": result.get("upstream_error", False),
+    }
+
+
+async def answer_batch_item(
+    index: int, item: BatchChatItem, batch: BatchChatRequest, settings: Settings
+) -> Dict[str, Any]:
+    """One NDJSON result line of a batch: the answer or the item's error"""
+    line: Dict[str, Any] = {"index": index, "id": item.id}
+    chat_request = ChatRequest(
+        message=item.message,
+        model=item.model or batch.model,
+        context=item.context or [],
+        use_cache=batch.use_cache,
+    )
+    try:
+        # Each item holds an upstream slot, so batches share the limit with interactive chats
+        async with upstream_limiter.slot():
+            result = await answer_chat(chat_request, Response(), None, settings, persist=False)
+    except HTTPException as e:
+        return {**line, "error": e.detail, "status": e.status_code}
     except Exception as e:
-        logger.error(f"Outer exception handler caught: {str(e)}", exc_info=True)  # Add exc_info=True to get traceback
+        logger.error(f"Batch item {index} failed: {type(e).__name__}: {e}")
+        return {**line, "error": f"{type(e).__name__}: {e}", "status": 500}
+    if result["upstream_error"]:
+        return {**line, "error": result["message"], "status": 502}
+    return {**line, "message": result["message"]}
+
+
+@router.post("/chat/batch", dependencies=[Depends(admission("batch", upstream=False))])
+async def chat_batch(request: BatchChatRequest, settings: Settings = Depends(get_settings)):
+    """Answer many prompts concurrently, streaming NDJSON lines in completion order
+
+    Every item produces one line with its ``index`` (and ``id`` if given) and
+    either ``message`` or ``error``; a final line with ``done`` summarizes the batch.
+    """
+    if len(request.items) > batch_settings.chat_batch_max_items:
         raise HTTPException(
-            status_code=500,
-            detail=f"Unexpected error: {str(e)}"
+            status_code=413,
+            detail=f"A batch may contain at most {batch_settings.chat_batch_max_items} items"
         )
-
-@router.post("/chat/stream")
-async def chat_stream(request: ChatRequest):
-    """Process a chat message using OpenRouter API with streaming response"""
-    # 在函数开头声明global
-    global OPENROUTER_API_URL
+    concurrency = min(
+        request.concurrency or batch_settings.chat_batch_concurrency,
+        batch_settings.chat_batch_max_concurrency,
+    )
+    started = time.perf_counter()
     
+    async def lines():
+        failed = 0
+        results = map_unordered(
+            enumerate(request.items),
+            lambda pair: answer_batch_item(pair[0], pair[1], request, settings),
+            concurrency,
+        )
+        try:
+            async for line in results:
+                failed += "error" in line
+                yield dumps(line) + b"\n"
+        finally:
+            # Cancels the items still in flight when the client goes away
+            await results.aclose()
+        yield dumps({
+            "done": True,
+            "total": len(request.items),
+            "succeeded": len(request.items) - failed,
+            "failed": failed,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+        }) + b"\n"
+    
+    return ClosingStreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@router.post("/chat/stream", dependencies=[Depends(admission("stream"))])
+async def chat_stream(
+    request: ChatRequest,
+    http_request: Request,
+    stream_format: Optional[str] = Query(None, alias="format"),
+    db: AsyncSession = Depends(get_session),
+    settings: Settings = Depends(get_settings),
+):
+    """Process a chat message using OpenRouter API with streaming response
+
+    Returns text/plain fragments by default, or typed SSE events (delta, error,
+    usage, done) with ?format=sse or Accept: text/event-stream.
+    """
+    started = time.perf_counter()
     # Generate a session ID if not provided
     session_id = request.session_id or uuid.uuid4()
     
     # 如果请求中指定了模型，使用请求中的模型
     request_model = request.model
     if request_model and request_model.strip():
-        console_log(f"使用请求指定的模型: {request_model}")
+        sampled_log.debug("使用请求指定的模型: %s", request_model)
         current_model = request_model
     else:
-        current_model = MODEL_NAME
+        current_model = settings.model_name
     
     # Check if API key is available (and not empty string)
-    if not OPENROUTER_API_KEY or OPENROUTER_API_KEY.strip() == "":
+    if not settings.openrouter_api_key or settings.openrouter_api_key.strip() == "":
         logger.error("Missing or empty OpenRouter API key")
         raise HTTPException(
             status_code=500,
@@ -514,128 +619,200 @@ async def chat_stream(request: ChatRequest):
     
     # Add context from previous messages if available
     if request.context:
+        # Older clients still send the whole conversation
         for msg in request.context:
             messages.append(msg)
+    elif request.session_id:
+        # Otherwise the history is rebuilt from the server-side conversation store
+        messages.extend(await conversation_store.history(db, session_id))
     
     # Add the current message
     messages.append({"role": "user", "content": request.message})
     
+    # Keep the prompt within the model's token budget: newest turns first, older ones dropped
+    context = build_context(messages, budget_for_model(current_model))
+    messages = context.messages
+    if context.dropped or context.collapsed:
+        logger.info(
+            f"Context trimmed to ~{context.estimated_tokens} tokens: "
+            f"dropped {context.dropped}, shortened {context.collapsed} messages"
+        )
+    
+    sse = wants_event_stream(http_request.headers.get("accept"), stream_format)
+    
+    def stream_response(items, headers):
+        """Persist the turn once complete and frame the stream for the client
+
+        The body is produced in its own task behind a bounded buffer: a slow client
+        pauses the upstream read, a disconnected one cancels it.
+        """
+        items = conversation_store.record_stream(
+            db, session_id, request.message, items, on_recorded=lambda: compact_session(session_id)
+        )
+        headers = {**headers, "X-Prompt-Tokens-Estimate": str(context.estimated_tokens)}
+        if not sse:
+            return ClosingStreamingResponse(
+                relay(plain_text(items)), media_type="text/plain", headers=headers
+            )
+        body = event_stream(
+            items,
+            started=started,
+            prompt_tokens=context.estimated_tokens,
+            metadata={
+                "session_id": str(session_id),
+                "model": current_model,
+                "cache": headers.get("X-Cache"),
+                "coalesced": headers.get("X-Coalesced") == "true",
+            },
+        )
+        # Proxies must neither cache nor buffer the event stream
+        headers.update({"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+        return ClosingStreamingResponse(relay(body), media_type=SSE_MEDIA_TYPE, headers=headers)
+    
+    # Cached answers are replayed as a fast stream without touching the upstream
+    use_cache = chat_cache_settings.chat_cache_enabled and request.use_cache
+    key = cache_key(current_model, messages, settings.max_tokens)
+    scope = cache_key(current_model, messages[:-1], settings.max_tokens)
+    if use_cache:
+        cached = await response_cache.get(key)
+        if cached is not None:
+            async def replay_generator():
+                for chunk in replay_chunks(cached):
+                    yield chunk
+            
+            return stream_response(replay_generator(), {"X-Cache": "HIT"})
+    
     try:
         # Log the API key being used (partially masked)
-        masked_key = f"{OPENROUTER_API_KEY[:8]}...{OPENROUTER_API_KEY[-4:]}" if len(OPENROUTER_API_KEY) > 12 else OPENROUTER_API_KEY
-        logger.info(f"Attempting OpenRouter streaming request with API Key: {masked_key}")
-        logger.info(f"Using model: '{current_model}'")
-        
-        # Prepare the streaming response
-        from fastapi.responses import StreamingResponse
+        sampled_log.debug(
+            "Attempting OpenRouter streaming request for model '%s' with API Key: %s",
+            current_model,
+            settings.masked_api_key,
+        )
         
         async def stream_generator():
-            # Try each API URL in turn
-            all_urls_to_try = []
-            if OPENROUTER_API_URL:
-                all_urls_to_try.append(OPENROUTER_API_URL)
-            # 添加所有不在列表中且不为None的备用URL    
-            all_urls_to_try.extend([url for url in ALTERNATE_API_URLS if url and url not in all_urls_to_try])
-            
-            # 确保我们至少有一个URL可以尝试
-            if not all_urls_to_try:
-                all_urls_to_try = ["https://openrouter.ai/api/v1/chat/completions"]
-                
-            try_model = current_model
-            fallback_model = "anthropic/claude-3-haiku"
+            # Best (endpoint, model) targets first: requested model, then the fallback models
+            targets = upstream_router.candidates(upstream_urls(), current_model)
             
             # Headers required by OpenRouter
-            headers = {
-                "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-                "Content-Type": "application/json"
-            }
+            headers = upstream_headers()
             
             # Payload with streaming enabled
             payload = {
-                "model": try_model,
+                "model": current_model,
                 "messages": messages,
-                "max_tokens": 500,
-                "stream": True  # Enable streaming
+                "max_tokens": settings.max_tokens,
+                "stream": True,  # Enable streaming
+                # The last chunk then carries the token usage
+                "stream_options": {"include_usage": True},
             }
             
             # 如果处理新模型，添加备注到日志
-            if try_model != MODEL_NAME:
-                console_log(f"正在使用非默认模型: {try_model}，默认模型是: {MODEL_NAME}")
+            if current_model != settings.model_name:
+                sampled_log.debug(
+                    "正在使用非默认模型: %s，默认模型是: %s",
+                    current_model,
+                    settings.model_name,
+                )
             
             success = False
+            # Completed answers are collected so they can be cached afterwards
+            streamed_parts = []
+            unavailable_models = set()
             
-            # Try each URL in turn
-            for current_url in all_urls_to_try:
+            # Try each target in turn until one starts streaming
+            for target in targets:
+                if target.model in unavailable_models:
+                    continue
+                payload["model"] = target.model
+                started_at = time.perf_counter()
+                first_token_at = None
+                usage: Dict[str, Any] = {}
                 try:
                     # Make the streaming request
-                    async with httpx.AsyncClient(timeout=60.0) as client:
-                        async with client.stream("POST", current_url, json=payload, headers=headers) as response:
-                            if response.status_code == 200:
-                                # Successfully connected, start streaming
-                                success = True
-                                
-                                # Process the SSE stream
-                                buffer = ""
-                                async for chunk in response.aiter_text():
-                                    # Process SSE format
-                                    buffer += chunk
-                                    while "data:" in buffer:
-                                        # Find and extract SSE data
-                                        parts = buffer.split("data:", 1)
-                                        if len(parts) < 2:
-                                            break
-                                        
-                                        # Find the end of the data part
-                                        data_parts = parts[1].split("\n\n", 1)
-                                        if len(data_parts) < 2:
-                                            # Not a complete message yet
-                                            break
-                                        
-                                        data = data_parts[0].strip()
-                                        buffer = data_parts[1]
-                                        
-                                        if data == "[DONE]":
-                                            # End of stream signal
-                                            continue
-                                            
-                                        try:
-                                            # Parse the JSON data
-                                            parsed_data = json.loads(data)
-                                            
-                                            # More robust content extraction
-                                            choices = parsed_data.get("choices", [])
-                                            if choices:
-                                                delta = choices[0].get("delta", {})
-                                                content = delta.get("content") # Use .get(), allows None
-                                                
-                                                # Yield content if it's not None 
-                                                # (We allow empty strings "" but skip None)
-                                                if content is not None:
-                                                    # Stream the content
-                                                    yield content
-                                        except json.JSONDecodeError:
-                                            logger.warning(f"Skipping invalid JSON in stream: {data}")
-                                            continue
-                                        except Exception as parse_err:
-                                            logger.error(f"Error parsing stream data: {parse_err} - Data: {data}")
-                                            continue
-                                
-                                # Exit the URL loop if successful
-                                break
+                    client = get_http_client()
+                    async with client.stream("POST", target.url, json=payload, headers=headers) as response:
+                        record_target_status(target, response.status_code)
+                        if response.status_code in MODEL_ERROR_STATUSES:
+                            unavailable_models.add(target.model)
+                        if response.status_code == 200:
+                            # Connected; it only counts as a success once content arrived
+                            # Decode the SSE stream incrementally, straight from the raw bytes
+                            async for content in iter_content_deltas(response.aiter_bytes(), usage):
+                                if first_token_at is None:
+                                    first_token_at = time.perf_counter()
+                                sampled_log.debug(
+                                    "Stream chunk of %d chars from %s", len(content), target.model
+                                )
+                                if content:
+                                    streamed_parts.append(content)
+                                yield content
+                            
+                            if not streamed_parts:
+                                # Nothing was sent yet, so the next target can still answer
+                                raise ValueError("Stream ended without any content")
+                            success = True
+                            finished_at = time.perf_counter()
+                            answer = "".join(streamed_parts)
+                            resolved = resolve_usage(usage, context.estimated_tokens, answer)
+                            upstream_router.record_success(
+                                target,
+                                ((first_token_at or finished_at) - started_at) * 1000,
+                                (finished_at - (first_token_at or finished_at)) * 1000,
+                                resolved["completion_tokens"],
+                            )
+                            record_completion(
+                                target.model,
+                                "stream",
+                                finished_at - started_at,
+                                resolved["completion_tokens"],
+                                (first_token_at or finished_at) - started_at,
+                            )
+                            if usage_settings.usage_accounting_enabled:
+                                usage_accumulator.record(
+                                    session_id,
+                                    target.model,
+                                    resolved,
+                                    (finished_at - started_at) * 1000,
+                                )
+                            if target.model != current_model:
+                                record_fallback("fallback_model")
+                            if not resolved["estimated"]:
+                                yield StreamUsage(
+                                    resolved["prompt_tokens"], resolved["completion_tokens"]
+                                )
+                            # Exit the target loop if successful
+                            if use_cache:
+                                await response_cache.put(key, current_model, answer)
+                                if near_dup_settings.near_dup_cache_enabled:
+                                    await index_near_duplicate(scope, request.message, key)
+                            break
                 
                 except Exception as e:
-                    console_log(f"Streaming error with URL {current_url}: {type(e).__name__}: {str(e)}")
-                    # Continue trying other URLs
+                    record_target_error(target, e)
+                    if streamed_parts:
+                        # Part of the answer was already sent, another target would repeat it
+                        record_fallback("stream_interrupted")
+                        yield StreamError("回复中断，请稍后重试。")
+                        return
+                    # Continue trying other targets
             
             # If we couldn't get a successful stream, send a fallback message
             if not success:
-                yield "我是AI助手，很抱歉OpenRouter API连接暂时不可用。请稍后再试或联系管理员检查API配置。"
+                record_fallback("stream_unavailable")
+                yield StreamError("我是AI助手，很抱歉OpenRouter API连接暂时不可用。请稍后再试或联系管理员检查API配置。")
+        
+        headers = {"X-Cache": "MISS"} if use_cache else {}
+        if single_flight_settings.single_flight_enabled:
+            # Identical concurrent requests follow the same upstream token stream
+            chunks, coalesced = stream_flights.subscribe(key, stream_generator)
+            if coalesced:
+                headers["X-Coalesced"] = "true"
+        else:
+            chunks = stream_generator()
         
         # Return a streaming response
-        return StreamingResponse(
-            stream_generator(),
-            media_type="text/plain"
-        )
+        return stream_response(chunks, headers)
     
     except Exception as e:
         logger.error(f"Streaming outer exception handler caught: {str(e)}", exc_info=True)
@@ -646,29 +823,26 @@ async def chat_stream(request: ChatRequest):
 
 # Add a direct test endpoint for debugging
 @router.get("/test-connection", status_code=200)
-async def test_api_connection():
+async def test_api_connection(settings: Settings = Depends(get_settings)):
     """Test the connection to the OpenRouter API"""
-    # 在函数开头声明global
-    global OPENROUTER_API_URL
-    
-    console_log("Direct API test requested")
+    logger.info("Direct API test requested")
     results = {}
     
     # Check environment variables
     results["env_variables"] = {
-        "OPENROUTER_API_KEY": f"{OPENROUTER_API_KEY[:8]}..." if OPENROUTER_API_KEY else "Not set",
-        "OPENROUTER_API_URL": OPENROUTER_API_URL,
-        "MODEL_NAME": MODEL_NAME
+        "OPENROUTER_API_KEY": settings.masked_api_key or "Not set",
+        "OPENROUTER_API_URL": settings.openrouter_api_url,
+        "MODEL_NAME": settings.model_name
     }
     
     # Test each API URL
     results["api_tests"] = []
     
     # 确保我们至少有一个有效的URL来测试
-    urls_to_test = [url for url in ALTERNATE_API_URLS if url]
+    urls_to_test = [url for url in settings.alternate_api_urls if url]
     if not urls_to_test:
         urls_to_test = ["https://openrouter.ai/api/v1/chat/completions"]
-        console_log("No alternate URLs found, using default URL for testing")
+        logger.info("No alternate URLs found, using default URL for testing")
     
     for api_url in urls_to_test:
         test_result = {
@@ -677,8 +851,15 @@ async def test_api_connection():
             "details": {}
         }
         
+        if not settings.openrouter_api_key:
+            # Without a key the upstream can only answer 401
+            test_result["status"] = "Skipped"
+            test_result["details"]["error"] = "OPENROUTER_API_KEY is not set"
+            results["api_tests"].append(test_result)
+            continue
+        
         try:
-            console_log(f"Testing connection to {api_url}")
+            logger.info(f"Testing connection to {api_url}")
             
             test_payload = {
                 "model": "anthropic/claude-3-haiku",
@@ -687,34 +868,34 @@ async def test_api_connection():
             }
             
             headers = {
-                "Authorization": f"Bearer {OPENROUTER_API_KEY}",
+                "Authorization": f"Bearer {settings.openrouter_api_key}",
                 "Content-Type": "application/json"
             }
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    api_url,
-                    headers=headers,
-                    json=test_payload,
-                    timeout=10.0
-                )
-                
-                test_result["status"] = f"{response.status_code}"
-                test_result["details"]["status_code"] = response.status_code
-                test_result["details"]["headers"] = dict(response.headers)
-                test_result["details"]["body"] = response.text[:200] + "..."
-                
-                if response.status_code == 200:
-                    console_log(f"✅ Connection to {api_url} successful!")
-                    # If we find a working URL, update the global URL
-                    if OPENROUTER_API_URL != api_url:
-                        console_log(f"Updating primary API URL to {api_url}")
-                        OPENROUTER_API_URL = api_url
-                else:
-                    console_log(f"❌ Connection to {api_url} failed: {response.status_code}")
+            client = get_http_client()
+            started = time.perf_counter()
+            response = await client.post(
+                api_url,
+                headers=headers,
+                json=test_payload,
+                timeout=CONNECTION_TEST_TIMEOUT
+            )
+            record_upstream_status(api_url, response.status_code)
+
+            test_result["status"] = f"{response.status_code}"
+            test_result["details"]["status_code"] = response.status_code
+            test_result["details"]["headers"] = dict(response.headers)
+            test_result["details"]["body"] = response.text[:200] + "..."
+            
+            if response.status_code == 200:
+                logger.info(f"✅ Connection to {api_url} successful!")
+                # Working URLs are preferred through the health ranking, not by rewriting the config
+                upstream_health.record_success(api_url, (time.perf_counter() - started) * 1000)
+            else:
+                logger.info(f"❌ Connection to {api_url} failed: {response.status_code}")
         
         except Exception as e:
-            console_log(f"Error testing {api_url}: {str(e)}")
+            logger.warning(f"Error testing {api_url}: {str(e)}")
             test_result["status"] = "Error"
             test_result["details"]["error"] = str(e)
             test_result["details"]["error_type"] = type(e).__name__
@@ -1,11 +1,12 @@
 from typing import Optional
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from backend.app.crud import item_crud
-from backend.app.db import get_session
+from backend.app.db import database_settings, get_session, session_with_timeout
+from backend.app.disconnect import cancel_on_disconnect
 from backend.app.schemas import (
     ItemCreate,
     ItemResponse,
@@ -18,14 +19,20 @@ router = APIRouter()
 
 @router.get("/items", response_model=ItemsListResponse)
 async def read_items(
+    request: Request,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
-    db: AsyncSession = Depends(get_session),
+    db: AsyncSession = Depends(session_with_timeout(database_settings.list_statement_timeout_ms)),
 ):
     """Get all items with pagination"""
-    items = await item_crud.get_multi(db, skip=skip, limit=limit)
-    total = await item_crud.count(db)
-    return {"items": items, "total": total}
+
+    async def list_items():
+        items = await item_crud.get_multi(db, skip=skip, limit=limit)
+        total = await item_crud.count(db)
+        return {"items": items, "total": total}
+
+    # Stop the queries (and free the connection) if the client gives up
+    return await cancel_on_disconnect(request, list_items())
 
 
 @router.post("/items", response_model=ItemResponse, status_code=201)
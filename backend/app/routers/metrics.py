@@ -0,0 +1,46 @@
+from fastapi import APIRouter
+from fastapi.responses import Response
+from sqlalchemy.pool import QueuePool
+
+from backend.app.db import get_engine
+from backend.app.metrics import (
+    CONTENT_TYPE,
+    db_pool_checked_out,
+    db_pool_overflow,
+    db_pool_size,
+    registry,
+)
+from backend.app.write_behind import chat_write_behind
+
+router = APIRouter()
+
+write_behind_pending = registry.gauge(
+    "chat_write_behind_pending", "Chat messages not yet written to the database"
+)
+write_behind_lag_seconds = registry.gauge(
+    "chat_write_behind_lag_seconds", "Age of the oldest chat message not yet written"
+)
+
+
+def collect_db_pool() -> None:
+    pool = get_engine().pool
+    # NullPool (tests) keeps no connections to report
+    if isinstance(pool, QueuePool):
+        db_pool_size.set(pool.size())
+        db_pool_checked_out.set(pool.checkedout())
+        db_pool_overflow.set(max(pool.overflow(), 0))
+
+
+def collect_write_behind() -> None:
+    write_behind_pending.set(chat_write_behind.pending)
+    write_behind_lag_seconds.set(round(chat_write_behind.lag_seconds(), 3))
+
+
+registry.add_collector(collect_db_pool)
+registry.add_collector(collect_write_behind)
+
+
+@router.get("/metrics", include_in_schema=False)
+async def read_metrics():
+    """Prometheus scrape endpoint"""
+    return Response(registry.render(), media_type=CONTENT_TYPE)
@@ -0,0 +1,45 @@
+from typing import Optional
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.app.db import database_settings, session_with_timeout
+from backend.app.disconnect import cancel_on_disconnect
+from backend.app.history import search_messages, session_messages
+from backend.app.schemas import ChatMessagesPage
+
+router = APIRouter()
+
+
+@router.get("/sessions/{session_id}/messages", response_model=ChatMessagesPage)
+async def read_session_messages(
+    request: Request,
+    session_id: UUID,
+    limit: int = Query(50, ge=1, le=500),
+    before: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    db: AsyncSession = Depends(session_with_timeout(database_settings.list_statement_timeout_ms)),
+):
+    """Get a page of a session's chat history, newest page first"""
+    try:
+        page = session_messages(db, session_id, limit=limit, before=before)
+        return await cancel_on_disconnect(request, page)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/sessions/messages/search", response_model=ChatMessagesPage)
+async def search_session_messages(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=200),
+    session_id: Optional[UUID] = None,
+    limit: int = Query(20, ge=1, le=100),
+    before: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    db: AsyncSession = Depends(session_with_timeout(database_settings.search_statement_timeout_ms)),
+):
+    """Full-text search over chat messages, optionally within one session"""
+    try:
+        page = search_messages(db, q, limit=limit, session_id=session_id, before=before)
+        return await cancel_on_disconnect(request, page)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -0,0 +1,191 @@
+"""
+Latency-aware routing of chat requests over (endpoint, model) targets
+
+Every target keeps exponentially weighted moving averages of its time to
+first token, generation speed and error rate, fed by real traffic. Answers
+that were not streamed only show their total time, which is averaged
+separately and used only while a target has no streamed answers. Targets
+serving the requested model are tried first, best score first; the
+configured fallback models follow. A model error (HTTP 400/404) skips the
+remaining endpoints of that model instead of repeating it everywhere.
+"""
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from backend.app.config import EnvSettings
+from backend.app.upstream import upstream_health
+
+
+class RoutingSettings(EnvSettings):
+    """Latency-aware routing over upstream targets"""
+
+    # 上游路由配置
+    # Models tried, in order, when the requested model is unavailable (comma-separated)
+    upstream_fallback_models: str = "anthropic/claude-3-haiku"
+    # Weight of the newest sample in the moving averages
+    routing_ewma_alpha: float = 0.2
+    # Answer length the score is computed for: TTFT plus the time to generate this many tokens
+    routing_reference_tokens: int = 200
+
+    @property
+    def fallback_models(self) -> List[str]:
+        return [
+            model.strip() for model in self.upstream_fallback_models.split(",") if model.strip()
+        ]
+
+
+routing_settings = RoutingSettings()
+
+# Status codes meaning the model (not the endpoint) cannot serve the request
+MODEL_ERROR_STATUSES = (400, 404)
+# Keeps a target that fails every request rankable instead of dividing by zero
+_MIN_SUCCESS_RATE = 0.05
+
+
+@dataclass(frozen=True)
+class RouteTarget:
+    url: str
+    model: str
+
+
+@dataclass
+class TargetStats:
+    """Moving averages observed for one (endpoint, model) target"""
+
+    ttft_ms: Optional[float] = None
+    tokens_per_second: Optional[float] = None
+    # Whole request time of non-streamed answers, which carry no first-token time
+    total_ms: Optional[float] = None
+    error_rate: float = 0.0
+    requests: int = 0
+    failures: int = 0
+    last_error: Optional[str] = None
+    last_used: Optional[float] = None
+
+    def score(self) -> Optional[float]:
+        """Expected milliseconds to a reference answer, inflated by the error rate"""
+        if self.ttft_ms is not None:
+            expected_ms = self.ttft_ms
+            if self.tokens_per_second:
+                expected_ms += (
+                    routing_settings.routing_reference_tokens / self.tokens_per_second * 1000
+                )
+        elif self.total_ms is not None:
+            expected_ms = self.total_ms
+        else:
+            return None
+        # Each failed attempt costs roughly another try elsewhere
+        return expected_ms / max(1.0 - self.error_rate, _MIN_SUCCESS_RATE)
+
+
+def _ewma(current: Optional[float], sample: float, alpha: float) -> float:
+    return sample if current is None else current + alpha * (sample - current)
+
+
+class UpstreamRouter:
+    """Rank (endpoint, model) targets by their observed latency, speed and errors"""
+
+    def __init__(self, alpha: float = routing_settings.routing_ewma_alpha):
+        self.alpha = alpha
+        self.targets: Dict[RouteTarget, TargetStats] = {}
+
+    def _get(self, target: RouteTarget) -> TargetStats:
+        if target not in self.targets:
+            self.targets[target] = TargetStats()
+        return self.targets[target]
+
+    def candidates(
+        self, urls: List[str], model: str, fallback_models: Optional[List[str]] = None
+    ) -> List[RouteTarget]:
+        """Targets to try in order: requested model first, then each fallback model"""
+        models = [model]
+        if fallback_models is None:
+            fallback_models = routing_settings.fallback_models
+        for fallback in fallback_models:
+            if fallback not in models:
+                models.append(fallback)
+        # Endpoints keep the health order (open circuits last) among equal scores
+        urls = upstream_health.ordered(urls)
+
+        def sort_key(target: RouteTarget) -> Tuple[bool, float]:
+            stats = self.targets.get(target)
+            if stats is None:
+                # Unmeasured targets score 0 so they are tried once and get measured
+                score = 0.0
+            else:
+                # Targets that never answered rank after every measured one
+                score = stats.score()
+                score = float("inf") if score is None else score
+            return (not upstream_health.is_available(target.url), score)
+
+        ordered = []
+        for candidate_model in models:
+            targets = [RouteTarget(url, candidate_model) for url in urls]
+            ordered.extend(sorted(targets, key=sort_key))
+        return ordered
+
+    def record_success(
+        self,
+        target: RouteTarget,
+        ttft_ms: Optional[float],
+        duration_ms: Optional[float] = None,
+        completion_tokens: Optional[int] = None,
+    ) -> None:
+        """Feed one answered request; duration covers first to last token
+
+        Without ``ttft_ms`` the answer was not streamed and ``duration_ms`` is
+        the whole request time. It then feeds only the error rate and
+        ``total_ms``, not the first-token and speed averages of streamed answers.
+        """
+        stats = self._get(target)
+        stats.requests += 1
+        stats.last_used = time.time()
+        stats.error_rate = _ewma(stats.error_rate, 0.0, self.alpha)
+        if ttft_ms is None:
+            if duration_ms is not None:
+                stats.total_ms = _ewma(stats.total_ms, duration_ms, self.alpha)
+            return
+        stats.ttft_ms = _ewma(stats.ttft_ms, ttft_ms, self.alpha)
+        if completion_tokens and duration_ms and duration_ms > 0:
+            speed = completion_tokens / (duration_ms / 1000)
+            stats.tokens_per_second = _ewma(stats.tokens_per_second, speed, self.alpha)
+
+    def record_failure(self, target: RouteTarget, error: str) -> None:
+        stats = self._get(target)
+        stats.requests += 1
+        stats.failures += 1
+        stats.last_used = time.time()
+        stats.last_error = error
+        stats.error_rate = _ewma(stats.error_rate, 1.0, self.alpha)
+
+    def ranking(self) -> List[Dict[str, Any]]:
+        """Known targets, best first, for the admin endpoint"""
+
+        def sort_key(item: Tuple[RouteTarget, TargetStats]):
+            score = item[1].score()
+            return (score is None, score or 0.0)
+
+        return [
+            {
+                "url": target.url,
+                "model": target.model,
+                "score_ms": round(stats.score(), 1) if stats.score() is not None else None,
+                "ttft_ms": round(stats.ttft_ms, 1) if stats.ttft_ms is not None else None,
+                "total_ms": round(stats.total_ms, 1) if stats.total_ms is not None else None,
+                "tokens_per_second": (
+                    round(stats.tokens_per_second, 1)
+                    if stats.tokens_per_second is not None
+                    else None
+                ),
+                "error_rate": round(stats.error_rate, 4),
+                "requests": stats.requests,
+                "failures": stats.failures,
+                "last_error": stats.last_error,
+                "available": upstream_health.is_available(target.url),
+            }
+            for target, stats in sorted(self.targets.items(), key=sort_key)
+        ]
+
+
+upstream_router = UpstreamRouter()
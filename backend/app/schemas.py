@@ -39,6 +39,8 @@ class ChatRequest(BaseModel):
     session_id: Optional[UUID] = None
     context: Optional[List[dict]] = Field(default_factory=list)
     model: Optional[str] = None
+    # Set to false to bypass the response cache for this request
+    use_cache: Optional[bool] = True
 
 
 class ChatResponse(BaseModel):
@@ -46,6 +48,38 @@ class ChatResponse(BaseModel):
     session_id: UUID
 
 
+# Chat history schemas
+class ChatMessageResponse(BaseModel):
+    id: UUID
+    session_id: UUID
+    role: str
+    content: str
+    timestamp: datetime
+
+
+class ChatMessagesPage(BaseModel):
+    messages: List[ChatMessageResponse]
+    # Pass as ``before`` to get the next page; None when there are no more messages
+    next_cursor: Optional[str] = None
+
+
+class BatchChatItem(BaseModel):
+    message: str
+    # Echoed back so callers can match results, which arrive in completion order
+    id: Optional[str] = None
+    model: Optional[str] = None
+    context: Optional[List[dict]] = Field(default_factory=list)
+
+
+class BatchChatRequest(BaseModel):
+    items: List[BatchChatItem] = Field(min_length=1)
+    # Defaults for items that do not set their own model
+    model: Optional[str] = None
+    # Upstream calls in flight at once, capped by CHAT_BATCH_MAX_CONCURRENCY
+    concurrency: Optional[int] = Field(default=None, ge=1)
+    use_cache: Optional[bool] = True
+
+
 # User schemas for future expansion
 class UserBase(BaseModel):
     username: str
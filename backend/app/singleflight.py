@@ -0,0 +1,203 @@
+import asyncio
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from backend.app.config import EnvSettings
+
+
+class SingleFlightSettings(EnvSettings):
+    """Coalescing of identical concurrent requests"""
+
+    # 合并相同的并发请求，只向上游发起一次调用
+    single_flight_enabled: bool = True
+    # Upstream is not read further while the slowest subscriber is this many chunks behind
+    stream_broadcast_max_lag: int = 64
+    # Chunks kept for late subscribers to replay; past this, chunks every subscriber has
+    # read are dropped and the stream is no longer joined
+    stream_broadcast_max_chunks: int = 1024
+
+
+single_flight_settings = SingleFlightSettings()
+
+
+@dataclass
+class _Call:
+    task: asyncio.Task
+    waiters: int = 0
+
+
+class SingleFlight:
+    """Run one coroutine per key; concurrent callers with the same key await its result"""
+
+    def __init__(self):
+        self.calls: Dict[str, _Call] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Return (result, shared); shared is True when another caller started the call"""
+        call = self.calls.get(key)
+        shared = call is not None
+        if call is None:
+            call = _Call(asyncio.ensure_future(fn()))
+            self.calls[key] = call
+            self.started += 1
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+        else:
+            self.coalesced += 1
+
+        call.waiters += 1
+        try:
+            # Shielded so one caller going away does not cancel the others
+            return await asyncio.shield(call.task), shared
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Forget it right away so a new caller does not join a cancelled call
+                self._forget(key, call)
+                call.task.cancel()
+
+    def _forget(self, key: str, call: _Call) -> None:
+        if self.calls.get(key) is call:
+            del self.calls[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {"in_flight": len(self.calls), "started": self.started, "coalesced": self.coalesced}
+
+
+class StreamBroadcast:
+    """Pump one stream into a chunk log that any number of subscribers read from
+
+    Subscribers joining late replay the chunks produced so far, then follow live.
+    The pump waits while the slowest subscriber is ``max_lag`` chunks behind, so
+    a stalled client does not make the whole upstream answer pile up in memory.
+    The source is cancelled once the last subscriber disconnects.
+    """
+
+    def __init__(
+        self,
+        source: AsyncIterator[Any],
+        max_lag: int = single_flight_settings.stream_broadcast_max_lag,
+        max_chunks: int = single_flight_settings.stream_broadcast_max_chunks,
+    ):
+        self.max_lag = max_lag
+        self.max_chunks = max_chunks
+        self.chunks: List[Any] = []
+        # Number of chunks dropped from the front of the log
+        self.offset = 0
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.joined = 0
+        # Next chunk each subscriber will read, counted from the start of the stream
+        self.positions: Dict[int, int] = {}
+        # Set once abandoned by every subscriber; a closed broadcast is never joined
+        self.closed = False
+        self._changed = asyncio.Event()
+        self._consumed = asyncio.Event()
+        self.task = asyncio.create_task(self._pump(source))
+
+    @property
+    def produced(self) -> int:
+        return self.offset + len(self.chunks)
+
+    @property
+    def joinable(self) -> bool:
+        """A new subscriber can still replay the stream from its first chunk"""
+        return not self.closed and self.offset == 0
+
+    def lag(self) -> int:
+        """Chunks produced that the slowest subscriber has not read yet"""
+        if not self.positions:
+            return 0
+        return self.produced - min(self.positions.values())
+
+    async def _pump(self, source: AsyncIterator[Any]) -> None:
+        try:
+            async for chunk in source:
+                self.chunks.append(chunk)
+                self._notify()
+                while self.lag() >= self.max_lag:
+                    await self._consumed.wait()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+
+    def _notify(self) -> None:
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def _notify_consumed(self) -> None:
+        if len(self.chunks) > self.max_chunks and self.positions:
+            read = min(self.positions.values()) - self.offset
+            del self.chunks[:read]
+            self.offset += read
+        consumed, self._consumed = self._consumed, asyncio.Event()
+        consumed.set()
+
+    async def subscribe(self) -> AsyncIterator[Any]:
+        self.subscribers += 1
+        self.joined += 1
+        subscriber = self.joined
+        position = self.offset
+        self.positions[subscriber] = position
+        try:
+            while True:
+                while position < self.produced:
+                    yield self.chunks[position - self.offset]
+                    position += 1
+                    self.positions[subscriber] = position
+                    self._notify_consumed()
+                if self.done:
+                    break
+                await self._changed.wait()
+            if self.error is not None:
+                raise self.error
+        finally:
+            self.subscribers -= 1
+            del self.positions[subscriber]
+            self._notify_consumed()
+            if self.subscribers == 0 and not self.task.done():
+                self.closed = True
+                self.task.cancel()
+
+
+class StreamSingleFlight:
+    """Fan one upstream token stream out to every identical concurrent request"""
+
+    def __init__(self):
+        self.streams: Dict[str, StreamBroadcast] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    def subscribe(
+        self, key: str, factory: Callable[[], AsyncIterator[Any]]
+    ) -> Tuple[AsyncIterator[Any], bool]:
+        """Return (chunks, shared); the stream is started by the first subscriber"""
+        broadcast = self.streams.get(key)
+        shared = broadcast is not None and broadcast.joinable
+        if not shared:
+            broadcast = StreamBroadcast(factory())
+            self.streams[key] = broadcast
+            self.started += 1
+            broadcast.task.add_done_callback(lambda _: self._forget(key, broadcast))
+        else:
+            self.coalesced += 1
+        return broadcast.subscribe(), shared
+
+    def _forget(self, key: str, broadcast: StreamBroadcast) -> None:
+        if self.streams.get(key) is broadcast:
+            del self.streams[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(self.streams),
+            "started": self.started,
+            "coalesced": self.coalesced,
+        }
+
+
+chat_flights = SingleFlight()
+stream_flights = StreamSingleFlight()
@@ -0,0 +1,192 @@
+"""
+Server-Sent Events: incremental decoder for upstream streams, encoder for clients
+
+Bytes are appended to a receive buffer and scanned once from where the
+previous chunk stopped; only the unfinished last line stays buffered, so
+decoding is linear in the stream size. Each ``data:`` value is sliced out of
+the buffer exactly once and handed to the JSON parser without decoding it to
+``str`` first.
+"""
+import importlib.util
+import json
+import logging
+import re
+from typing import Any, AsyncIterator, Dict, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+if importlib.util.find_spec("orjson") is not None:
+    import orjson
+
+    def loads(data: Union[bytes, bytearray]) -> Any:
+        return orjson.loads(data)
+
+    def dumps(value: Any) -> bytes:
+        return orjson.dumps(value)
+
+else:
+
+    def loads(data: Union[bytes, bytearray]) -> Any:
+        return json.loads(data)
+
+    def dumps(value: Any) -> bytes:
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+DONE = b"[DONE]"
+
+# Lines may end in CRLF, LF or a lone CR
+_END_OF_LINE = re.compile(rb"\r\n|\r|\n")
+_BOM = b"\xef\xbb\xbf"
+
+
+class SSEEvent:
+    __slots__ = ("event", "data", "id")
+
+    def __init__(self, data: Union[bytes, bytearray], event: str = "message", id: str = ""):
+        self.data = data
+        self.event = event
+        self.id = id
+
+    def json(self) -> Any:
+        return loads(self.data)
+
+    def __repr__(self) -> str:
+        return f"SSEEvent(event={self.event!r}, data={bytes(self.data)!r})"
+
+
+class SSEDecoder:
+    """Feed raw bytes, get complete events back"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._data: List[bytearray] = []
+        self._event = ""
+        self.last_event_id = ""
+        self._skip_lf = False
+        self._started = False
+
+    def feed(self, chunk: bytes) -> List[SSEEvent]:
+        buffer = self._buffer
+        scan_from = len(buffer)
+        buffer += chunk
+        if not self._started:
+            # Everything buffered so far is unscanned until the optional BOM is resolved
+            if len(buffer) < len(_BOM) and _BOM.startswith(buffer):
+                return []
+            self._started = True
+            if buffer.startswith(_BOM):
+                del buffer[: len(_BOM)]
+            scan_from = 0
+        if self._skip_lf and scan_from < len(buffer):
+            # The previous chunk ended in CR; a LF right after it belongs to the same break
+            self._skip_lf = False
+            if buffer[scan_from] == 0x0A:
+                del buffer[scan_from]
+
+        events: List[SSEEvent] = []
+        start = 0
+        for match in _END_OF_LINE.finditer(buffer, scan_from):
+            self._process_line(buffer, start, match.start(), events)
+            start = match.end()
+            if start == len(buffer) and match.group() == b"\r":
+                self._skip_lf = True
+        if start:
+            del buffer[:start]
+        return events
+
+    def flush(self) -> List[SSEEvent]:
+        """Dispatch what is left when the stream ends without a final blank line"""
+        events: List[SSEEvent] = []
+        if self._buffer:
+            self._process_line(self._buffer, 0, len(self._buffer), events)
+            self._buffer.clear()
+        self._dispatch(events)
+        return events
+
+    def _process_line(
+        self, buffer: bytearray, start: int, end: int, events: List[SSEEvent]
+    ) -> None:
+        if start == end:
+            self._dispatch(events)
+            return
+        if buffer[start] == 0x3A:
+            # ":" starts a comment, used by servers as keep-alive
+            return
+
+        if buffer.startswith(b"data:", start, end):
+            # Fast path for the overwhelmingly common field
+            value_start = start + 5
+            if value_start < end and buffer[value_start] == 0x20:
+                value_start += 1
+            self._data.append(buffer[value_start:end])
+            return
+
+        colon = buffer.find(b":", start, end)
+        if colon == -1:
+            field, value_start = bytes(buffer[start:end]), end
+        else:
+            field, value_start = bytes(buffer[start:colon]), colon + 1
+            if value_start < end and buffer[value_start] == 0x20:
+                value_start += 1
+
+        if field == b"data":
+            self._data.append(buffer[value_start:end])
+        elif field == b"event":
+            self._event = buffer[value_start:end].decode("utf-8", "replace")
+        elif field == b"id":
+            self.last_event_id = buffer[value_start:end].decode("utf-8", "replace")
+        # "retry" and unknown fields are ignored
+
+    def _dispatch(self, events: List[SSEEvent]) -> None:
+        if self._data:
+            data = self._data[0] if len(self._data) == 1 else bytearray(b"\n").join(self._data)
+            events.append(SSEEvent(data, self._event or "message", self.last_event_id))
+        self._data = []
+        self._event = ""
+
+
+async def iter_sse_events(chunks: AsyncIterator[bytes]) -> AsyncIterator[SSEEvent]:
+    decoder = SSEDecoder()
+    async for chunk in chunks:
+        for event in decoder.feed(chunk):
+            yield event
+    for event in decoder.flush():
+        yield event
+
+
+def delta_content(payload: Any) -> Optional[str]:
+    """Content of the first choice's delta of an OpenAI-style stream chunk"""
+    choices = payload.get("choices") if isinstance(payload, dict) else None
+    if not choices:
+        return None
+    return (choices[0].get("delta") or {}).get("content")
+
+
+async def iter_content_deltas(
+    chunks: AsyncIterator[bytes], usage: Optional[Dict[str, Any]] = None
+) -> AsyncIterator[str]:
+    """Text deltas of a chat completion stream, until [DONE]
+
+    The ``usage`` object the upstream sends with its last chunk (when asked to
+    via ``stream_options``) is copied into ``usage`` if given.
+    """
+    async for event in iter_sse_events(chunks):
+        if event.data == DONE:
+            return
+        try:
+            payload = event.json()
+        except ValueError:
+            logger.warning(f"Skipping invalid JSON in stream: {bytes(event.data)[:200]!r}")
+            continue
+        if usage is not None and isinstance(payload, dict) and payload.get("usage"):
+            usage.update(payload["usage"])
+        content = delta_content(payload)
+        # Empty strings are passed through, only missing content is skipped
+        if content is not None:
+            yield content
+
+
+def format_sse(event: str, data: Any) -> bytes:
+    """Encode one named event with a single-line JSON payload"""
+    return b"event: " + event.encode("utf-8") + b"\ndata: " + dumps(data) + b"\n\n"
@@ -0,0 +1,212 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional, Union
+
+import anyio
+from starlette.responses import StreamingResponse
+from starlette.types import Send
+
+from backend.app.config import EnvSettings
+from backend.app.context_builder import estimate_tokens
+from backend.app.sse import format_sse
+
+
+class StreamingSettings(EnvSettings):
+    """Server-sent event streams"""
+
+    # 流式响应配置
+    # Interval of SSE keep-alive comments so idle proxies do not cut long generations
+    stream_heartbeat_seconds: float = 15.0
+    # Chunks buffered for a slow client before the upstream reader pauses
+    stream_buffer_chunks: int = 64
+
+
+streaming_settings = StreamingSettings()
+
+SSE_MEDIA_TYPE = "text/event-stream"
+
+
+@dataclass
+class StreamError:
+    """Failure reported in place of (further) content by a chat stream producer"""
+
+    message: str
+
+
+@dataclass
+class StreamUsage:
+    """Token usage reported by the upstream, sent by the producer after the content"""
+
+    prompt_tokens: int
+    completion_tokens: int
+
+
+StreamItem = Union[str, StreamError, StreamUsage]
+
+_END = object()
+
+
+def wants_event_stream(accept: Optional[str], stream_format: Optional[str]) -> bool:
+    """Framed SSE is used when asked for via ?format=sse or the Accept header"""
+    if stream_format:
+        return stream_format.lower() == "sse"
+    return SSE_MEDIA_TYPE in (accept or "")
+
+
+async def plain_text(items: AsyncIterator[StreamItem]) -> AsyncIterator[str]:
+    """Legacy text/plain body: content and error messages concatenated"""
+    async for item in items:
+        if isinstance(item, StreamUsage):
+            continue
+        yield item.message if isinstance(item, StreamError) else item
+
+
+async def with_heartbeats(
+    items: AsyncIterator[Any], interval: float
+) -> AsyncIterator[Optional[Any]]:
+    """Pass items through, yielding None whenever nothing arrived for ``interval`` seconds"""
+    iterator = items.__aiter__()
+    pending = asyncio.ensure_future(iterator.__anext__())
+    try:
+        while True:
+            done, _ = await asyncio.wait({pending}, timeout=interval)
+            if not done:
+                yield None
+                continue
+            try:
+                item = pending.result()
+            except StopAsyncIteration:
+                return
+            yield item
+            pending = asyncio.ensure_future(iterator.__anext__())
+    finally:
+        if not pending.done():
+            pending.cancel()
+            try:
+                await pending
+            except (asyncio.CancelledError, StopAsyncIteration):
+                pass
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+async def event_stream(
+    items: AsyncIterator[StreamItem],
+    *,
+    started: float,
+    prompt_tokens: int,
+    metadata: Optional[Dict[str, Any]] = None,
+    heartbeat_interval: float = streaming_settings.stream_heartbeat_seconds,
+) -> AsyncIterator[bytes]:
+    """Frame a chat stream as typed SSE events: delta, error, usage and done
+
+    The usage event carries the upstream's token counts when the producer sent
+    them, an estimate otherwise.
+    """
+    first_delta_at = None
+    chunks = 0
+    parts = []
+    failed = False
+    reported: Optional[StreamUsage] = None
+    async for item in with_heartbeats(items, heartbeat_interval):
+        if item is None:
+            yield b": heartbeat\n\n"
+        elif isinstance(item, StreamError):
+            failed = True
+            yield format_sse("error", {"message": item.message})
+        elif isinstance(item, StreamUsage):
+            reported = item
+        else:
+            if first_delta_at is None:
+                first_delta_at = time.perf_counter()
+            chunks += 1
+            parts.append(item)
+            yield format_sse("delta", {"content": item})
+
+    if reported is not None:
+        prompt_tokens, completion_tokens = reported.prompt_tokens, reported.completion_tokens
+    else:
+        completion_tokens = estimate_tokens("".join(parts))
+    yield format_sse(
+        "usage",
+        {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "estimated": reported is None,
+        },
+    )
+    finished = time.perf_counter()
+    yield format_sse(
+        "done",
+        {
+            **(metadata or {}),
+            "status": "error" if failed else "ok",
+            "chunks": chunks,
+            "ttft_ms": (
+                round((first_delta_at - started) * 1000, 1) if first_delta_at is not None else None
+            ),
+            "total_ms": round((finished - started) * 1000, 1),
+        },
+    )
+
+
+async def relay(
+    items: AsyncIterator[Any], maxsize: int = streaming_settings.stream_buffer_chunks
+) -> AsyncIterator[Any]:
+    """Read ``items`` in a separate task through a bounded queue
+
+    A full queue pauses the reader, so a slow client throttles the upstream read
+    instead of growing memory. Closing the relay cancels the reader right away.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+    failure: List[Exception] = []
+
+    async def pump() -> None:
+        try:
+            async for item in items:
+                await queue.put(item)
+        except Exception as e:
+            failure.append(e)
+        finally:
+            aclose = getattr(items, "aclose", None)
+            if aclose is not None:
+                await aclose()
+        await queue.put(_END)
+
+    reader = asyncio.create_task(pump())
+    try:
+        while True:
+            item = await queue.get()
+            if item is _END:
+                break
+            yield item
+        if failure:
+            raise failure[0]
+    finally:
+        if not reader.done():
+            reader.cancel()
+            try:
+                await reader
+            except asyncio.CancelledError:
+                pass
+
+
+class ClosingStreamingResponse(StreamingResponse):
+    """StreamingResponse that closes its body as soon as the response ends
+
+    On client disconnect Starlette cancels the response while the body generator
+    is suspended, which would leave it (and the upstream request behind it)
+    running until garbage collection. Closing it explicitly cancels the chain.
+    """
+
+    async def stream_response(self, send: Send) -> None:
+        try:
+            await super().stream_response(send)
+        finally:
+            aclose = getattr(self.body_iterator, "aclose", None)
+            if aclose is not None:
+                with anyio.CancelScope(shield=True):
+                    await aclose()
@@ -0,0 +1,269 @@
+"""
+Background compaction of long conversations
+
+Once the history of a session outgrows a token threshold, a worker asks the
+model to summarize the older turns and stores the result as one summary row
+(is_user "S") in chat_messages. Context assembly then starts from the newest
+summary, so later turns send the summary plus recent messages instead of an
+ever-growing transcript. Summaries run one at a time and only while the
+upstream has spare capacity, so they never compete with interactive chats.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from uuid import UUID, uuid4
+
+from sqlalchemy import select
+
+from backend.app.admission import upstream_limiter
+from backend.app.config import EnvSettings
+from backend.app.context_builder import estimate_message_tokens, estimate_tokens
+from backend.app.conversations import (
+    SUMMARY_FLAG,
+    SUMMARY_PREFIX,
+    conversation_store,
+    since_last_summary,
+)
+from backend.app.db import async_session_maker
+from backend.app.models import ChatMessage
+from backend.app.write_behind import chat_write_behind
+
+logger = logging.getLogger(__name__)
+
+
+class SummarySettings(EnvSettings):
+    """Rolling summaries of long sessions"""
+
+    # 长会话摘要压缩配置
+    summary_enabled: bool = True
+    # Estimated history tokens (summary included) above which a session is compacted
+    summary_trigger_tokens: int = 3000
+    # Most recent messages kept verbatim next to the summary
+    summary_keep_recent_messages: int = 6
+    # Model used for summaries, empty for the chat model
+    summary_model: str = ""
+    summary_max_tokens: int = 400
+    # Summaries only start while fewer than this share of the upstream slots are in use
+    summary_upstream_share: float = 0.5
+    summary_queue_size: int = 1000
+
+
+summary_settings = SummarySettings()
+
+# Messages read per compaction; anything older than this is not summarized again
+MAX_INPUT_MESSAGES = 200
+# Sessions whose compaction stats are kept for the admin endpoint
+STATS_SESSIONS = 1000
+# How often a waiting compaction checks the upstream load again
+IDLE_POLL_SECONDS = 1.0
+
+SUMMARY_INSTRUCTIONS = (
+    "Summarize the conversation below for your own future reference. Keep the facts, "
+    "names, numbers, decisions and open questions the user may come back to; drop "
+    "greetings and filler. Write in the language of the conversation, at most "
+    "a few short paragraphs."
+)
+
+Summarize = Callable[[List[Dict[str, str]]], Awaitable[str]]
+
+
+def history_tokens(messages: List[Dict[str, str]]) -> int:
+    return sum(estimate_message_tokens(message) for message in messages)
+
+
+def summary_prompt(
+    previous: Optional[Dict[str, Any]], turns: List[Dict[str, Any]]
+) -> List[Dict[str, str]]:
+    """Messages asking the model to fold the previous summary and older turns into one"""
+    lines = []
+    if previous is not None:
+        lines.append(SUMMARY_PREFIX + previous["content"])
+    speakers = {"Y": "User", "N": "Assistant"}
+    lines.extend(f"{speakers.get(row['is_user'], 'User')}: {row['content']}" for row in turns)
+    return [
+        {"role": "system", "content": SUMMARY_INSTRUCTIONS},
+        {"role": "user", "content": "\n\n".join(lines)},
+    ]
+
+
+class ConversationSummarizer:
+    """Queue of sessions to compact, worked off by one low-priority background task"""
+
+    def __init__(
+        self,
+        *,
+        trigger_tokens: int = summary_settings.summary_trigger_tokens,
+        keep_recent: int = summary_settings.summary_keep_recent_messages,
+        upstream_share: float = summary_settings.summary_upstream_share,
+        max_queue: int = summary_settings.summary_queue_size,
+        session_factory=async_session_maker,
+    ):
+        self.trigger_tokens = trigger_tokens
+        self.keep_recent = keep_recent
+        self.upstream_share = upstream_share
+        self.max_queue = max_queue
+        self.session_factory = session_factory
+        self._queue: "OrderedDict[UUID, Summarize]" = OrderedDict()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.sessions: "OrderedDict[UUID, Dict[str, Any]]" = OrderedDict()
+        self.scheduled = 0
+        self.compactions = 0
+        self.failures = 0
+        self.skipped = 0
+        self.tokens_saved = 0
+
+    def schedule(self, session_id: UUID, summarize: Summarize) -> bool:
+        """Queue a session for compaction if its cached history is over the threshold"""
+        messages = conversation_store.sessions.get(session_id)
+        if not messages or session_id in self._queue or len(self._queue) >= self.max_queue:
+            return False
+        if history_tokens(messages) <= self.trigger_tokens:
+            return False
+        self._queue[session_id] = summarize
+        self.scheduled += 1
+        self._wakeup.set()
+        self.start()
+        return True
+
+    def upstream_is_busy(self) -> bool:
+        return (
+            upstream_limiter.queue_depth > 0
+            or upstream_limiter.active >= upstream_limiter.limit * self.upstream_share
+        )
+
+    async def _load(self, session_id: UUID) -> List[Dict[str, Any]]:
+        """The session's newest messages, buffered ones included, oldest first"""
+        unflushed = chat_write_behind.pending_for(session_id)
+        async with self.session_factory() as session:
+            result = await session.execute(
+                select(
+                    ChatMessage.id, ChatMessage.is_user, ChatMessage.content, ChatMessage.timestamp
+                )
+                .where(ChatMessage.session_id == session_id)
+                .order_by(ChatMessage.timestamp.desc(), ChatMessage.id.desc())
+                .limit(MAX_INPUT_MESSAGES)
+            )
+            rows = [row._asdict() for row in result]
+        loaded_ids = {row["id"] for row in rows}
+        rows.extend(row for row in unflushed if row["id"] not in loaded_ids)
+        rows.sort(key=lambda row: (row["timestamp"], row["id"]))
+        return rows
+
+    def _split(
+        self, rows: List[Dict[str, Any]]
+    ) -> Tuple[Optional[Dict[str, Any]], List[Dict[str, Any]]]:
+        """The previous summary and the turns to fold into the next one"""
+        rows = since_last_summary(rows)
+        previous = rows[0] if rows and rows[0]["is_user"] == SUMMARY_FLAG else None
+        turns = rows[1:] if previous is not None else rows
+        split = len(turns) - self.keep_recent
+        # Recent messages start at a question, so no answer loses the question it belongs to
+        while split > 0 and turns[split]["is_user"] != "Y":
+            split -= 1
+        return previous, turns[: max(split, 0)]
+
+    async def compact(self, session_id: UUID, summarize: Summarize) -> bool:
+        """Summarize the older turns of one session and store the summary row"""
+        rows = await self._load(session_id)
+        previous, covered = self._split(rows)
+        if not covered:
+            self.skipped += 1
+            return False
+
+        started = time.perf_counter()
+        async with upstream_limiter.slot():
+            summary = await summarize(summary_prompt(previous, covered))
+        summary = summary.strip()
+        if not summary:
+            raise ValueError("empty summary")
+
+        async with self.session_factory() as session:
+            session.add(
+                ChatMessage(
+                    id=uuid4(),
+                    session_id=session_id,
+                    is_user=SUMMARY_FLAG,
+                    content=summary,
+                    # Sorts right after the last summarized message, before the recent ones
+                    timestamp=covered[-1]["timestamp"] + timedelta(microseconds=1),
+                )
+            )
+            await session.commit()
+        # The next turn reloads the history, starting from the new summary
+        conversation_store.forget(session_id)
+
+        folded = ([previous] if previous is not None else []) + covered
+        tokens_before = sum(estimate_tokens(row["content"]) for row in folded)
+        tokens_after = estimate_tokens(summary)
+        self.compactions += 1
+        self.tokens_saved += max(tokens_before - tokens_after, 0)
+        stats = self.sessions.pop(session_id, None) or {"compactions": 0, "messages_summarized": 0}
+        stats.update(
+            compactions=stats["compactions"] + 1,
+            messages_summarized=stats["messages_summarized"] + len(covered),
+            tokens_before=tokens_before,
+            tokens_after=tokens_after,
+            duration_ms=round((time.perf_counter() - started) * 1000, 1),
+            compacted_at=time.time(),
+        )
+        self.sessions[session_id] = stats
+        while len(self.sessions) > STATS_SESSIONS:
+            self.sessions.popitem(last=False)
+        return True
+
+    async def run(self) -> None:
+        """Compact queued sessions one at a time until cancelled"""
+        while True:
+            if not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            if self.upstream_is_busy():
+                # Interactive requests first
+                await asyncio.sleep(IDLE_POLL_SECONDS)
+                continue
+            session_id, summarize = self._queue.popitem(last=False)
+            try:
+                await self.compact(session_id, summarize)
+            except Exception as e:
+                self.failures += 1
+                logger.warning(f"Failed to summarize session {session_id}: {type(e).__name__}: {e}")
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self, session_id: Optional[UUID] = None) -> Dict[str, Any]:
+        if session_id is not None:
+            return {"session_id": str(session_id), **self.sessions.get(session_id, {})}
+        return {
+            "enabled": summary_settings.summary_enabled,
+            "queued": len(self._queue),
+            "scheduled": self.scheduled,
+            "compactions": self.compactions,
+            "failures": self.failures,
+            "skipped": self.skipped,
+            "tokens_saved": self.tokens_saved,
+            "sessions": len(self.sessions),
+        }
+
+
+conversation_summarizer = ConversationSummarizer()
+
+
+async def stop_summarizer() -> None:
+    """Cancel pending compactions, called from the application lifespan"""
+    await conversation_summarizer.stop()
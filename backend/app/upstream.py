@@ -0,0 +1,252 @@
+import asyncio
+import importlib.util
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from backend.app.config import EnvSettings
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamSettings(EnvSettings):
+    """Connections to the upstream provider and their health"""
+
+    # 上游(OpenRouter)连接池配置
+    upstream_max_connections: int = 100
+    upstream_max_keepalive_connections: int = 20
+    upstream_keepalive_expiry: float = 60.0
+    upstream_http2: bool = False
+
+    # Timeouts in seconds; read also bounds the gap between two streamed chunks
+    upstream_connect_timeout: float = 5.0
+    upstream_read_timeout: float = 60.0
+    upstream_write_timeout: float = 10.0
+    upstream_pool_timeout: float = 5.0
+
+    # 上游健康探测与熔断配置
+    upstream_probe_interval: float = 30.0
+    upstream_probe_timeout: float = 5.0
+    upstream_circuit_failures: int = 3
+    upstream_circuit_reset_seconds: float = 30.0
+
+
+upstream_settings = UpstreamSettings()
+
+# /test-connection asks for a 10 token answer, so it gives up on reading sooner
+CONNECTION_TEST_TIMEOUT = httpx.Timeout(
+    connect=upstream_settings.upstream_connect_timeout,
+    read=10.0,
+    write=upstream_settings.upstream_write_timeout,
+    pool=upstream_settings.upstream_pool_timeout,
+)
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def create_http_client() -> httpx.AsyncClient:
+    """Create a keep-alive client with bounded connection pool for upstream AI calls"""
+    http2 = upstream_settings.upstream_http2
+    if http2 and importlib.util.find_spec("h2") is None:
+        logger.warning("UPSTREAM_HTTP2 is enabled but the 'h2' package is missing, using HTTP/1.1")
+        http2 = False
+
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=upstream_settings.upstream_max_connections,
+            max_keepalive_connections=upstream_settings.upstream_max_keepalive_connections,
+            keepalive_expiry=upstream_settings.upstream_keepalive_expiry,
+        ),
+        timeout=httpx.Timeout(
+            connect=upstream_settings.upstream_connect_timeout,
+            read=upstream_settings.upstream_read_timeout,
+            write=upstream_settings.upstream_write_timeout,
+            pool=upstream_settings.upstream_pool_timeout,
+        ),
+    )
+
+
+async def start_http_client() -> httpx.AsyncClient:
+    """Open the shared upstream client, called from the application lifespan"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = create_http_client()
+    return _client
+
+
+async def close_http_client() -> None:
+    """Close the shared upstream client and its pooled connections"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the shared upstream client
+
+    Created lazily when the lifespan did not run (e.g. tests using an ASGI client).
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = create_http_client()
+    return _client
+
+
+# Weight of the newest latency sample in the per-endpoint moving average
+LATENCY_EWMA_ALPHA = 0.3
+
+
+@dataclass
+class EndpointHealth:
+    """Health and circuit breaker state of one upstream URL"""
+
+    url: str
+    consecutive_failures: int = 0
+    opened_at: Optional[float] = None
+    latency_ms: Optional[float] = None
+    last_checked: Optional[float] = None
+    last_error: Optional[str] = None
+
+    def state(self, reset_seconds: float) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= reset_seconds:
+            # Let traffic through again to find out whether the endpoint recovered
+            return "half_open"
+        return "open"
+
+
+class UpstreamHealth:
+    """Per-URL health tracking with a consecutive-failure circuit breaker"""
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.endpoints: Dict[str, EndpointHealth] = {}
+
+    def _get(self, url: str) -> EndpointHealth:
+        if url not in self.endpoints:
+            self.endpoints[url] = EndpointHealth(url=url)
+        return self.endpoints[url]
+
+    def record_success(self, url: str, latency_ms: Optional[float] = None) -> None:
+        """Close the circuit; latency comes from probes only so endpoints stay comparable"""
+        endpoint = self._get(url)
+        endpoint.consecutive_failures = 0
+        endpoint.opened_at = None
+        endpoint.last_error = None
+        endpoint.last_checked = time.monotonic()
+        if latency_ms is None:
+            return
+        if endpoint.latency_ms is None:
+            endpoint.latency_ms = latency_ms
+        else:
+            endpoint.latency_ms += LATENCY_EWMA_ALPHA * (latency_ms - endpoint.latency_ms)
+
+    def record_failure(self, url: str, error: str) -> None:
+        endpoint = self._get(url)
+        endpoint.consecutive_failures += 1
+        endpoint.last_error = error
+        endpoint.last_checked = time.monotonic()
+        state = endpoint.state(self.reset_seconds)
+        if state == "half_open" or (
+            state == "closed" and endpoint.consecutive_failures >= self.failure_threshold
+        ):
+            if state == "closed":
+                logger.warning(
+                    f"Opening circuit for {url} after {endpoint.consecutive_failures} failures"
+                )
+            endpoint.opened_at = time.monotonic()
+
+    def is_available(self, url: str) -> bool:
+        return self._get(url).state(self.reset_seconds) != "open"
+
+    def ordered(self, urls: List[str]) -> List[str]:
+        """Order candidate URLs healthiest first; open circuits go last as a last resort"""
+
+        def sort_key(url: str):
+            endpoint = self._get(url)
+            latency = endpoint.latency_ms if endpoint.latency_ms is not None else float("inf")
+            return (not self.is_available(url), latency)
+
+        # sorted() is stable, so URLs without measurements keep their configured order
+        return sorted(urls, key=sort_key)
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "url": endpoint.url,
+                "state": endpoint.state(self.reset_seconds),
+                "consecutive_failures": endpoint.consecutive_failures,
+                "latency_ms": (
+                    round(endpoint.latency_ms, 1) if endpoint.latency_ms is not None else None
+                ),
+                "last_error": endpoint.last_error,
+            }
+            for endpoint in self.endpoints.values()
+        ]
+
+
+upstream_health = UpstreamHealth(
+    upstream_settings.upstream_circuit_failures, upstream_settings.upstream_circuit_reset_seconds
+)
+
+_prober_task: Optional[asyncio.Task] = None
+
+
+def models_url(completions_url: str) -> str:
+    """Map a chat completions URL to the (free) model listing endpoint of the same API"""
+    base = completions_url.rstrip("/")
+    if base.endswith("/chat/completions"):
+        base = base[: -len("/chat/completions")]
+    return f"{base}/models"
+
+
+async def probe_endpoint(url: str, headers: Dict[str, str]) -> None:
+    """Check one upstream URL without spending completion tokens"""
+    client = get_http_client()
+    started = time.perf_counter()
+    try:
+        response = await client.get(
+            models_url(url), headers=headers, timeout=upstream_settings.upstream_probe_timeout
+        )
+    except httpx.HTTPError as e:
+        upstream_health.record_failure(url, f"{type(e).__name__}: {e}")
+        return
+
+    if response.status_code >= 500 or response.status_code == 429:
+        upstream_health.record_failure(url, f"HTTP {response.status_code}")
+    else:
+        upstream_health.record_success(url, (time.perf_counter() - started) * 1000)
+
+
+async def run_health_prober(urls: List[str], headers: Dict[str, str], interval: float) -> None:
+    """Probe every upstream URL on an interval until cancelled"""
+    while True:
+        await asyncio.gather(*(probe_endpoint(url, headers) for url in urls))
+        await asyncio.sleep(interval)
+
+
+def start_health_prober(urls: List[str], headers: Dict[str, str]) -> None:
+    """Start the background prober, called from the application lifespan"""
+    global _prober_task
+    if _prober_task is None or _prober_task.done():
+        _prober_task = asyncio.create_task(
+            run_health_prober(urls, headers, upstream_settings.upstream_probe_interval)
+        )
+
+
+async def stop_health_prober() -> None:
+    global _prober_task
+    if _prober_task is not None:
+        _prober_task.cancel()
+        try:
+            await _prober_task
+        except asyncio.CancelledError:
+            pass
+        _prober_task = None
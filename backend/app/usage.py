@@ -0,0 +1,270 @@
+"""
+Upstream token usage accounting
+
+Every answered upstream completion adds its prompt and completion tokens,
+reported cost and latency to an in-process total per (UTC day, session,
+model). A background task upserts the totals into usage_daily in one
+statement per flush, so the table grows by one row per session, model and
+day rather than per request. When the upstream omits ``usage`` the counts are
+estimated locally and the request is counted as estimated.
+"""
+import asyncio
+import logging
+import time
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import desc, func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.app.config import EnvSettings
+from backend.app.context_builder import estimate_tokens
+from backend.app.db import async_session_maker
+from backend.app.metrics import registry
+from backend.app.models import UsageDaily
+
+logger = logging.getLogger(__name__)
+
+
+class UsageSettings(EnvSettings):
+    """Upstream token usage accounting"""
+
+    # 上游token用量统计配置
+    usage_accounting_enabled: bool = True
+    usage_flush_interval: float = 5.0
+    # Beyond this many unflushed (day, session, model) totals new usage is dropped
+    usage_max_pending_keys: int = 100000
+    usage_drain_timeout: float = 10.0
+
+
+usage_settings = UsageSettings()
+
+UsageKey = Tuple[date, UUID, str]
+# Summed per key, in this order
+COUNTERS = (
+    "requests",
+    "estimated_requests",
+    "prompt_tokens",
+    "completion_tokens",
+    "cost",
+    "latency_ms",
+)
+
+usage_tokens_total = registry.counter(
+    "ai_usage_tokens_total", "Upstream tokens accounted, by model and kind", ["model", "kind"]
+)
+
+
+def resolve_usage(
+    usage: Optional[Dict[str, Any]], prompt_estimate: int, completion: str
+) -> Dict[str, Any]:
+    """Token counts and cost from an upstream ``usage`` object, estimated where missing"""
+    usage = usage or {}
+    prompt_tokens = usage.get("prompt_tokens")
+    completion_tokens = usage.get("completion_tokens")
+    estimated = not isinstance(prompt_tokens, int) or not isinstance(completion_tokens, int)
+    if not isinstance(prompt_tokens, int):
+        prompt_tokens = prompt_estimate
+    if not isinstance(completion_tokens, int):
+        completion_tokens = estimate_tokens(completion)
+    cost = usage.get("cost")
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "cost": float(cost) if isinstance(cost, (int, float)) else 0.0,
+        "estimated": estimated,
+    }
+
+
+class UsageAccumulator:
+    """Per-day, per-session, per-model usage totals upserted by a background task"""
+
+    def __init__(
+        self,
+        *,
+        flush_interval: float = usage_settings.usage_flush_interval,
+        max_pending_keys: int = usage_settings.usage_max_pending_keys,
+        session_factory=async_session_maker,
+    ):
+        self.flush_interval = flush_interval
+        self.max_pending_keys = max_pending_keys
+        self.session_factory = session_factory
+        self._totals: Dict[UsageKey, List[float]] = {}
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.recorded = 0
+        self.estimated = 0
+        self.flushed_rows = 0
+        self.failures = 0
+        self.dropped = 0
+        self.last_flush_ms = 0.0
+
+    def record(
+        self, session_id: UUID, model: str, resolved: Dict[str, Any], latency_ms: float
+    ) -> None:
+        """Account one upstream completion, with counts from resolve_usage()"""
+        usage_tokens_total.inc(model, "prompt", amount=resolved["prompt_tokens"])
+        usage_tokens_total.inc(model, "completion", amount=resolved["completion_tokens"])
+        key = (datetime.utcnow().date(), session_id, model)
+        totals = self._totals.get(key)
+        if totals is None:
+            if len(self._totals) >= self.max_pending_keys:
+                self.dropped += 1
+                return
+            totals = self._totals[key] = [0, 0, 0, 0, 0.0, 0]
+        self.merge(
+            totals,
+            [
+                1,
+                int(resolved["estimated"]),
+                resolved["prompt_tokens"],
+                resolved["completion_tokens"],
+                resolved["cost"],
+                round(latency_ms),
+            ],
+        )
+        self.recorded += 1
+        self.estimated += resolved["estimated"]
+        self.start()
+
+    @staticmethod
+    def merge(totals: List[float], values: List[float]) -> None:
+        for i, value in enumerate(values):
+            totals[i] += value
+
+    def _restore(self, batch: Dict[UsageKey, List[float]]) -> None:
+        """Put a failed batch back; usage recorded meanwhile is added on top"""
+        for key, totals in batch.items():
+            if key in self._totals:
+                self.merge(totals, self._totals[key])
+            self._totals[key] = totals
+
+    async def flush(self) -> int:
+        """Upsert the totals gathered so far; on failure they are merged back"""
+        async with self._flush_lock:
+            if not self._totals:
+                return 0
+            batch, self._totals = self._totals, {}
+            rows = [
+                {
+                    "day": day,
+                    "session_id": session_id,
+                    "model": model,
+                    **dict(zip(COUNTERS, totals)),
+                    "updated_at": datetime.utcnow(),
+                }
+                for (day, session_id, model), totals in batch.items()
+            ]
+            started = time.perf_counter()
+            try:
+                async with self.session_factory() as session:
+                    statement = insert(UsageDaily).values(rows)
+                    statement = statement.on_conflict_do_update(
+                        index_elements=["day", "session_id", "model"],
+                        set_={
+                            **{
+                                name: getattr(UsageDaily, name) + getattr(statement.excluded, name)
+                                for name in COUNTERS
+                            },
+                            "updated_at": statement.excluded.updated_at,
+                        },
+                    )
+                    await session.execute(statement)
+                    await session.commit()
+            except asyncio.CancelledError:
+                # Interrupted by shutdown; the drain writes these totals again
+                self._restore(batch)
+                raise
+            except Exception as e:
+                self._restore(batch)
+                self.failures += 1
+                logger.warning(
+                    f"Failed to persist usage of {len(rows)} keys: {type(e).__name__}: {e}"
+                )
+                return 0
+            self.last_flush_ms = (time.perf_counter() - started) * 1000
+            self.flushed_rows += len(rows)
+            return len(rows)
+
+    async def run(self) -> None:
+        """Flush every interval until cancelled"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+
+    async def drain(self, timeout: float = usage_settings.usage_drain_timeout) -> None:
+        """Stop the background task and write out the remaining totals"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await asyncio.wait_for(self.flush(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        if self._totals:
+            logger.warning(f"Shutting down with usage of {len(self._totals)} keys unsaved")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": usage_settings.usage_accounting_enabled,
+            "pending_keys": len(self._totals),
+            "recorded": self.recorded,
+            "estimated": self.estimated,
+            "flushed_rows": self.flushed_rows,
+            "failures": self.failures,
+            "dropped": self.dropped,
+            "last_flush_ms": round(self.last_flush_ms, 1),
+        }
+
+
+async def top_usage(
+    db: AsyncSession,
+    group_by: str,
+    since: date,
+    limit: int,
+    order_by: str = "prompt_tokens",
+) -> List[Dict[str, Any]]:
+    """Sessions or models with the most usage since a day, largest first
+
+    ``avg_prompt_tokens`` growing with ``requests`` marks sessions whose
+    context keeps growing; ``avg_latency_ms`` shows what it costs in time.
+    """
+    group = {"session": UsageDaily.session_id, "model": UsageDaily.model}[group_by]
+    sums = {name: func.sum(getattr(UsageDaily, name)).label(name) for name in COUNTERS}
+    result = await db.execute(
+        select(group.label(group_by), *sums.values())
+        .where(UsageDaily.day >= since)
+        .group_by(group)
+        .order_by(desc(sums[order_by]))
+        .limit(limit)
+    )
+    entries = []
+    for row in result:
+        entry = row._asdict()
+        requests = entry["requests"] or 1
+        entry.update(
+            cost=round(entry["cost"], 6),
+            avg_prompt_tokens=round(entry["prompt_tokens"] / requests, 1),
+            avg_completion_tokens=round(entry["completion_tokens"] / requests, 1),
+            avg_latency_ms=round(entry["latency_ms"] / requests, 1),
+        )
+        entries.append(entry)
+    return entries
+
+
+usage_accumulator = UsageAccumulator()
+
+
+async def stop_usage_accounting() -> None:
+    """Write out the remaining totals, called from the application lifespan"""
+    await usage_accumulator.drain()
@@ -0,0 +1,211 @@
+"""
+Write-behind persistence of chat messages
+
+The AI routes hand finished turns to an in-process buffer instead of
+committing them on the request path. A background task flushes the buffer
+into chat_messages with one multi-row INSERT per batch, as soon as a batch
+is full or the flush interval has passed. Shutdown drains what is left.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from sqlalchemy.dialects.postgresql import insert
+
+from backend.app.config import EnvSettings
+from backend.app.db import async_session_maker
+from backend.app.models import ChatMessage
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindSettings(EnvSettings):
+    """Write-behind of chat messages"""
+
+    # 聊天记录异步批量写入配置
+    chat_write_behind_enabled: bool = True
+    chat_write_behind_batch_size: int = 500
+    chat_write_behind_flush_interval: float = 0.5
+    # Beyond this many unflushed messages the oldest are dropped (e.g. while the DB is down)
+    chat_write_behind_max_pending: int = 50000
+    chat_write_behind_drain_timeout: float = 10.0
+
+
+write_behind_settings = WriteBehindSettings()
+
+
+class ChatWriteBehind:
+    """Buffer of chat_messages rows flushed in batches by a background task"""
+
+    def __init__(
+        self,
+        *,
+        batch_size: int = write_behind_settings.chat_write_behind_batch_size,
+        flush_interval: float = write_behind_settings.chat_write_behind_flush_interval,
+        max_pending: int = write_behind_settings.chat_write_behind_max_pending,
+        session_factory=async_session_maker,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.session_factory = session_factory
+        # (enqueued at, row) pairs, oldest first
+        self._pending: Deque[Tuple[float, Dict[str, Any]]] = deque()
+        # Rows of the batch being inserted, still visible to readers until committed
+        self._in_flight: List[Dict[str, Any]] = []
+        self._batch_ready = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.enqueued = 0
+        self.flushed = 0
+        self.batches = 0
+        self.failures = 0
+        self.dropped = 0
+        self.last_flush_ms = 0.0
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending) + len(self._in_flight)
+
+    def lag_seconds(self) -> float:
+        """Age of the oldest message not yet handed to the database"""
+        if not self._pending:
+            return 0.0
+        return time.monotonic() - self._pending[0][0]
+
+    def enqueue(self, rows: List[Dict[str, Any]]) -> None:
+        """Queue chat_messages rows; ids are assigned here so readers can dedupe"""
+        now = time.monotonic()
+        for row in rows:
+            row.setdefault("id", uuid.uuid4())
+            self._pending.append((now, row))
+        self.enqueued += len(rows)
+        while len(self._pending) > self.max_pending:
+            self._pending.popleft()
+            self.dropped += 1
+        if len(self._pending) >= self.batch_size:
+            self._batch_ready.set()
+        self.start()
+
+    def pending_for(self, session_id: uuid.UUID) -> List[Dict[str, Any]]:
+        """Unflushed rows of one session, oldest first"""
+        rows = self._in_flight + [row for _, row in self._pending]
+        return [row for row in rows if row["session_id"] == session_id]
+
+    async def flush(self) -> int:
+        """Insert one batch; failed batches go back to the front of the buffer"""
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            count = min(self.batch_size, len(self._pending))
+            batch = [self._pending.popleft() for _ in range(count)]
+            self._in_flight = [row for _, row in batch]
+            started = time.perf_counter()
+            try:
+                async with self.session_factory() as session:
+                    # Ids are fixed at enqueue time, so retrying a batch never duplicates rows
+                    statement = insert(ChatMessage).values(self._in_flight)
+                    await session.execute(statement.on_conflict_do_nothing(index_elements=["id"]))
+                    await session.commit()
+            except asyncio.CancelledError:
+                # Interrupted by shutdown; the drain writes these rows again
+                self._pending.extendleft(reversed(batch))
+                raise
+            except Exception as e:
+                self.failures += 1
+                logger.warning(f"Failed to persist {count} chat messages: {type(e).__name__}: {e}")
+                self._pending.extendleft(reversed(batch))
+                return 0
+            finally:
+                self._in_flight = []
+            self.last_flush_ms = (time.perf_counter() - started) * 1000
+            self.flushed += count
+            self.batches += 1
+            return count
+
+    async def flush_all(self) -> None:
+        """Flush until the buffer is empty or a batch fails"""
+        while self._pending:
+            if not await self.flush():
+                return
+
+    async def run(self) -> None:
+        """Flush whenever a batch is full or the interval has passed, until cancelled"""
+        while True:
+            try:
+                await asyncio.wait_for(self._batch_ready.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._batch_ready.clear()
+            failed_before = self.failures
+            await self.flush_all()
+            if self.failures != failed_before:
+                # Give the database a moment before retrying
+                await asyncio.sleep(self.flush_interval)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+
+    async def drain(
+        self, timeout: float = write_behind_settings.chat_write_behind_drain_timeout
+    ) -> None:
+        """Stop the background task and write out what is still buffered"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await asyncio.wait_for(self.flush_all(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        if self._pending:
+            logger.warning(f"Shutting down with {len(self._pending)} chat messages unsaved")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": write_behind_settings.chat_write_behind_enabled,
+            "pending": self.pending,
+            "lag_ms": round(self.lag_seconds() * 1000, 1),
+            "enqueued": self.enqueued,
+            "flushed": self.flushed,
+            "batches": self.batches,
+            "failures": self.failures,
+            "dropped": self.dropped,
+            "last_flush_ms": round(self.last_flush_ms, 1),
+        }
+
+
+def turn_rows(session_id: uuid.UUID, user_message: str, ai_message: str) -> List[Dict[str, Any]]:
+    """chat_messages rows of one user/assistant exchange"""
+    now = datetime.utcnow()
+    return [
+        {"session_id": session_id, "is_user": "Y", "content": user_message, "timestamp": now},
+        # Strictly after the question so the turn order survives reloading
+        {
+            "session_id": session_id,
+            "is_user": "N",
+            "content": ai_message,
+            "timestamp": now + timedelta(microseconds=1),
+        },
+    ]
+
+
+chat_write_behind = ChatWriteBehind()
+
+
+def start_write_behind() -> None:
+    """Start the flusher, called from the application lifespan"""
+    if write_behind_settings.chat_write_behind_enabled:
+        chat_write_behind.start()
+
+
+async def stop_write_behind() -> None:
+    await chat_write_behind.drain()
@@ -25,10 +25,18 @@ from frontend.utils.styles import get_chat_css
 from frontend.utils.session import (
     initialize_session_state, 
     initialize_chat_history,
-    format_chat_context,
-    clear_chat_history
+    clear_chat_history,
+    get_welcome_message,
+    trim_chat_history,
+    reset_older_messages,
+    HISTORY_PAGE_SIZE,
+)
+from frontend.utils.api import (
+    run_async,
+    stream_chat_message,
+    fetch_session_messages,
+    search_chat_messages,
 )
-from frontend.utils.api import run_async, stream_chat_message
 
 # 导入组件
 from frontend.components.chat_message import render_chat_history
@@ -36,6 +44,44 @@ from frontend.components.model_selector import model_selector
 from frontend.components.chat_input import fixed_bottom_input_container
 
 
+def load_older_messages():
+    """从后端加载当前显示内容之前的一页消息，只保留这一页在session_state中"""
+    session_id = st.session_state.session_id
+    cursor = st.session_state.older_cursor
+    if not st.session_state.older_loaded:
+        # 第一次翻页：先跳过页面上已显示的消息，取得它们之前的游标
+        shown = [m for m in st.session_state.chat_history if m["content"] != get_welcome_message()]
+        cursor = None
+        if shown:
+            cursor = run_async(fetch_session_messages, session_id, None, len(shown))["next_cursor"]
+    
+    page = {"messages": [], "next_cursor": None}
+    if cursor:
+        page = run_async(fetch_session_messages, session_id, cursor, HISTORY_PAGE_SIZE)
+    st.session_state.older_messages = page["messages"]
+    st.session_state.older_cursor = page["next_cursor"]
+    st.session_state.older_loaded = True
+
+
+def render_older_messages():
+    """显示按页加载的更早消息"""
+    has_more = not st.session_state.older_loaded or st.session_state.older_cursor
+    if not has_more and not st.session_state.older_messages:
+        return
+    with st.expander("更早的消息", expanded=bool(st.session_state.older_messages)):
+        if st.session_state.older_messages:
+            render_chat_history(st.session_state.older_messages)
+        col_older, col_latest = st.columns(2)
+        if has_more and col_older.button("加载更早的消息", key="load_older_messages"):
+            load_older_messages()
+            st.rerun()
+        if st.session_state.older_messages and col_latest.button(
+            "收起", key="reset_older_messages"
+        ):
+            reset_older_messages()
+            st.rerun()
+
+
 def ai_chat_page():
     """AI聊天助手页面 (using st.chat_input and st.chat_message)"""
     # Page config should ideally be in the main app file (streamlit_app.py)
@@ -55,6 +101,17 @@ def ai_chat_page():
         if st.button("清空聊天记录", key="clear_chat_sidebar"):
             clear_chat_history()
             st.rerun()
+        
+        # 全文搜索当前会话的聊天记录
+        query = st.text_input("搜索聊天记录", key="chat_search_query")
+        if query:
+            results = run_async(search_chat_messages, query, st.session_state.session_id)
+            if not results:
+                st.caption("没有找到匹配的消息")
+            for message in results:
+                speaker = "我" if message["role"] == "user" else "AI"
+                st.caption(f"{speaker} · {message['timestamp'][:19]}")
+                st.markdown(message["content"][:200])
 
     # --- Main Chat Area --- 
     st.markdown("## AI 助手") # Title for the main area
@@ -75,6 +132,8 @@ def ai_chat_page():
     # --- Display History --- 
     # This runs *after* the input handling logic in each rerun.
     # In the rerun triggered by st.rerun() above, it will show the user message.
+    # Older messages stay on the backend and are paged in on demand
+    render_older_messages()
     render_chat_history(st.session_state.chat_history)
     
     # --- AI Response Placeholder --- 
@@ -90,8 +149,7 @@ def ai_chat_page():
         
         current_input = prompt_to_process # Use the stored prompt
 
-        # Prepare for AI response
-        context = format_chat_context()
+        # Prepare for AI response; the backend keeps the conversation history by session_id
         # Add empty AI message placeholder in history *before* calling API
         st.session_state.chat_history.append({"role": "assistant", "content": ""})
         message_index = len(st.session_state.chat_history) - 1 
@@ -119,7 +177,7 @@ def ai_chat_page():
             stream_chat_message,
             current_input,
             st.session_state.session_id,
-            context,
+            None,
             selected_model if selected_model != "默认模型" else None,
             update_placeholder # Pass the callback
         )
@@ -141,6 +199,8 @@ def ai_chat_page():
              print(f"Error after stream: message_index {message_index} out of bounds.")
 
         streaming_placeholder.empty() # Clear the external placeholder
+        # Keep only the most recent messages in session_state
+        trim_chat_history()
 
         # Rerun one last time to display the final AI message rendered by render_chat_history
         st.rerun()
@@ -42,14 +42,22 @@ def sanitize_response(content):
     return content
 
 
-async def send_chat_message(message: str, session_id: str, context: list, model: str = None) -> dict:
+def busy_message(response) -> str:
+    """后端限流(429)或过载(503)时的提示信息，其他情况返回空字符串"""
+    retry_after = response.headers.get("Retry-After")
+    if response.status_code in (429, 503) and retry_after:
+        return f"AI服务繁忙，请在{retry_after}秒后重试"
+    return ""
+
+
+async def send_chat_message(message: str, session_id: str, context: list = None, model: str = None) -> dict:
     """
     发送普通聊天消息到API
     
     Args:
         message: 用户消息内容
         session_id: 会话ID
-        context: 对话上下文
+        context: 可选的对话上下文，默认由后端根据session_id从会话历史中重建
         model: 可选的模型名称
         
     Returns:
@@ -59,10 +67,13 @@ async def send_chat_message(message: str, session_id: str, context: list, model:
         try:
             request_data = {
                 "message": message,
-                "session_id": session_id,
-                "context": context
+                "session_id": session_id
             }
             
+            # 只有显式传入时才发送上下文，否则由后端维护会话历史
+            if context:
+                request_data["context"] = context
+            
             # 添加模型参数如果指定
             if model:
                 request_data["model"] = model
@@ -81,6 +92,8 @@ async def send_chat_message(message: str, session_id: str, context: list, model:
                 if "message" in result:
                     result["message"] = sanitize_response(result["message"])
                 return result
+            elif busy_message(response):
+                return {"message": busy_message(response), "session_id": session_id}
             else:
                 error_text = await response.text()
                 logger.error(f"API错误: {response.status_code} - {error_text}")
@@ -98,7 +111,36 @@ async def send_chat_message(message: str, session_id: str, context: list, model:
             }
 
 
-async def stream_chat_message(message: str, session_id: str, context: list, model: str = None, 
+async def iter_sse_events(response):
+    """
+    解析 text/event-stream 响应，逐个返回 (事件类型, 数据) 元组
+    
+    Args:
+        response: httpx 流式响应
+    
+    Returns:
+        异步生成器，数据部分已按JSON解析
+    """
+    event_type, data_lines = "message", []
+    async for line in response.aiter_lines():
+        if not line:
+            # 空行表示一个事件结束
+            if data_lines:
+                try:
+                    yield event_type, json.loads("\n".join(data_lines))
+                except json.JSONDecodeError:
+                    logger.warning(f"无法解析的事件数据: {data_lines}")
+            event_type, data_lines = "message", []
+        elif line.startswith(":"):
+            # 注释行（心跳），忽略
+            continue
+        elif line.startswith("event:"):
+            event_type = line[6:].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[5:].lstrip(" "))
+
+
+async def stream_chat_message(message: str, session_id: str, context: list = None, model: str = None, 
                               on_chunk=None) -> str:
     """
     流式发送聊天消息到API
@@ -106,7 +148,7 @@ async def stream_chat_message(message: str, session_id: str, context: list, mode
     Args:
         message: 用户消息内容
         session_id: 会话ID
-        context: 对话上下文
+        context: 可选的对话上下文，默认由后端根据session_id从会话历史中重建
         model: 可选的模型名称
         on_chunk: 接收每个响应块的回调函数
         
@@ -119,27 +161,47 @@ async def stream_chat_message(message: str, session_id: str, context: list, mode
         async with httpx.AsyncClient() as client:
             request_data = {
                 "message": message,
-                "session_id": session_id,
-                "context": context
+                "session_id": session_id
             }
             
+            # 只有显式传入时才发送上下文，否则由后端维护会话历史
+            if context:
+                request_data["context"] = context
+            
             # 添加模型参数如果指定
             if model:
                 request_data["model"] = model
                 
             logger.info(f"发送流式请求到 {API_BASE_URL}/chat/stream")
                 
+            # 请求带类型的SSE事件，以便区分内容、错误和统计信息
             async with client.stream("POST", f"{API_BASE_URL}/chat/stream", 
-                                    json=request_data, timeout=60.0) as response:
+                                    json=request_data, timeout=60.0,
+                                    headers={"Accept": "text/event-stream"}) as response:
                 if response.status_code == 200:
-                    async for chunk in response.aiter_text():
-                        # 清理每个响应块
-                        clean_chunk = sanitize_response(chunk)
-                        streaming_content += clean_chunk
+                    async for event_type, data in iter_sse_events(response):
+                        if event_type == "delta":
+                            # 清理每个响应块
+                            streaming_content += sanitize_response(data.get("content", ""))
+                        elif event_type == "error":
+                            logger.error(f"AI服务流式错误: {data.get('message')}")
+                            streaming_content += sanitize_response(data.get("message", ""))
+                        elif event_type == "usage":
+                            logger.info(f"Token用量: {data}")
+                            continue
+                        elif event_type == "done":
+                            logger.info(f"流式响应完成: {data}")
+                            break
+                        else:
+                            continue
                         
                         # 如果提供了回调函数，执行它
                         if on_chunk:
                             on_chunk(streaming_content)
+                elif busy_message(response):
+                    if on_chunk:
+                        on_chunk(busy_message(response))
+                    return busy_message(response)
                 else:
                     error_text = await response.text()
                     error_message = f"API错误: {response.status_code} - {error_text}"
@@ -158,6 +220,50 @@ async def stream_chat_message(message: str, session_id: str, context: list, mode
     return streaming_content
 
 
+async def fetch_session_messages(session_id: str, before: str = None, limit: int = 50) -> dict:
+    """
+    分页获取会话的历史消息（从最新的一页开始向前翻页）
+    
+    Args:
+        session_id: 会话ID
+        before: 上一页返回的next_cursor，为空时获取最新一页
+        limit: 每页消息条数
+        
+    Returns:
+        {"messages": [...], "next_cursor": ...}，出错时返回空页
+    """
+    params = {"limit": limit}
+    if before:
+        params["before"] = before
+    try:
+        async with httpx.AsyncClient() as client:
+            response = await client.get(
+                f"{API_BASE_URL}/sessions/{session_id}/messages", params=params, timeout=10.0
+            )
+            response.raise_for_status()
+            return response.json()
+    except Exception as e:
+        logger.error(f"获取历史消息失败: {str(e)}")
+        return {"messages": [], "next_cursor": None}
+
+
+async def search_chat_messages(query: str, session_id: str = None, limit: int = 20) -> list:
+    """全文搜索聊天消息，可限定在某个会话内，返回最新的匹配消息"""
+    params = {"q": query, "limit": limit}
+    if session_id:
+        params["session_id"] = session_id
+    try:
+        async with httpx.AsyncClient() as client:
+            response = await client.get(
+                f"{API_BASE_URL}/sessions/messages/search", params=params, timeout=10.0
+            )
+            response.raise_for_status()
+            return response.json()["messages"]
+    except Exception as e:
+        logger.error(f"搜索聊天消息失败: {str(e)}")
+        return []
+
+
 async def check_api_connection() -> bool:
     """检查API连接状态"""
     try:
@@ -4,6 +4,11 @@
 import uuid
 import streamlit as st
 
+# 页面中保留的最近消息条数，更早的消息按页从后端加载，不常驻session_state
+CHAT_HISTORY_WINDOW = 50
+# 每次加载的更早消息条数
+HISTORY_PAGE_SIZE = 20
+
 
 def initialize_session_state():
     """
@@ -17,6 +22,9 @@ def initialize_session_state():
     
     if 'items' not in st.session_state:
         st.session_state.items = []
+    
+    if "older_messages" not in st.session_state:
+        reset_older_messages()
 
 
 def get_welcome_message():
@@ -36,25 +44,6 @@ def initialize_chat_history():
         ]
 
 
-def format_chat_context(exclude_last=True):
-    """
-    将聊天历史格式化为API上下文
-    
-    Args:
-        exclude_last: 是否排除最后一条消息（通常是刚添加的用户消息）
-    
-    Returns:
-        格式化的上下文列表
-    """
-    history = st.session_state.chat_history[:-1] if exclude_last and st.session_state.chat_history else st.session_state.chat_history
-    
-    return [
-        {"role": msg.get("role", "user" if msg.get("is_user", False) else "assistant"), 
-         "content": msg["content"]}
-        for msg in history
-    ]
-
-
 def clear_chat_history():
     """
     清空聊天历史并重新添加欢迎消息
@@ -62,4 +51,24 @@ def clear_chat_history():
     st.session_state.chat_history = [
         {"role": "assistant", "content": get_welcome_message()}
     ]
-    st.session_state.session_id = str(uuid.uuid4()) 
\ No newline at end of file
+    st.session_state.session_id = str(uuid.uuid4())
+    reset_older_messages()
+
+
+def trim_chat_history():
+    """
+    只保留最近的CHAT_HISTORY_WINDOW条消息，完整历史保存在后端
+    """
+    if len(st.session_state.chat_history) > CHAT_HISTORY_WINDOW:
+        st.session_state.chat_history = st.session_state.chat_history[-CHAT_HISTORY_WINDOW:]
+
+
+def reset_older_messages():
+    """
+    清除已加载的更早消息，回到只显示最近消息的状态
+    """
+    # 当前显示的一页更早消息，以及再往前一页的游标
+    st.session_state.older_messages = []
+    st.session_state.older_cursor = None
+    # 是否已经从后端取得过游标（第一次翻页前为False）
+    st.session_state.older_loaded = False
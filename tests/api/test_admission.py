@@ -0,0 +1,140 @@
+import asyncio
+import uuid
+from unittest.mock import patch
+
+import pytest
+from fastapi import HTTPException
+from httpx import AsyncClient
+
+from backend.app.admission import ConcurrencyLimiter, TokenBucketLimiter, route_limiters
+from backend.app.upstream import get_http_client
+from tests.api.test_sse import completion_chunk
+from tests.api.test_streaming import FakeUpstreamStream
+from tests.api.test_upstream import make_completion_response
+
+
+@pytest.mark.asyncio
+async def test_limiter_queues_then_rejects_when_queue_is_full():
+    limiter = ConcurrencyLimiter("test", limit=1, max_queue=1, queue_timeout=5)
+    await limiter.acquire()
+    waiting = asyncio.create_task(limiter.acquire())
+    await asyncio.sleep(0)
+    assert limiter.queue_depth == 1
+
+    with pytest.raises(HTTPException) as rejected:
+        await limiter.acquire()
+    assert rejected.value.status_code == 503
+    assert int(rejected.value.headers["Retry-After"]) >= 1
+
+    # Releasing hands the slot straight to the queued request
+    limiter.release()
+    await waiting
+    assert (limiter.active, limiter.queue_depth) == (1, 0)
+    stats = limiter.stats()
+    assert (stats["admitted"], stats["rejected"], stats["max_queue_depth"]) == (2, 1, 1)
+
+
+@pytest.mark.asyncio
+async def test_limiter_wait_times_out_without_leaking_slots():
+    limiter = ConcurrencyLimiter("test", limit=1, max_queue=4, queue_timeout=0.01)
+    await limiter.acquire()
+
+    with pytest.raises(HTTPException) as rejected:
+        await limiter.acquire()
+    assert rejected.value.status_code == 503
+    cancelled = asyncio.create_task(limiter.acquire())
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    await asyncio.gather(cancelled, return_exceptions=True)
+
+    limiter.release()
+    assert (limiter.active, limiter.queue_depth, limiter.timed_out) == (0, 0, 1)
+
+
+def test_token_bucket_limits_each_key():
+    limiter = TokenBucketLimiter(rate_per_minute=60, burst=2, max_keys=10)
+    limiter.check("session:a")
+    limiter.check("session:a")
+    with pytest.raises(HTTPException) as limited:
+        limiter.check("session:a")
+    assert limited.value.status_code == 429
+    assert limited.value.headers["Retry-After"] == "1"
+    limiter.check("session:b")
+
+    # One token per second flows back in
+    limiter.buckets["session:a"].updated -= 1
+    limiter.check("session:a")
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_chat_returns_503_when_route_is_saturated(client: AsyncClient):
+    """Test that requests beyond the concurrency limit and queue are turned away"""
+    release = asyncio.Event()
+
+    async def slow_post(*args, **kwargs):
+        await release.wait()
+        return make_completion_response("Done")
+
+    limiter = ConcurrencyLimiter("chat", limit=1, max_queue=0, queue_timeout=1)
+    with patch.dict(route_limiters, {"chat": limiter}), patch.object(
+        get_http_client(), "post", side_effect=slow_post
+    ):
+        first = asyncio.create_task(
+            client.post("/api/v1/chat", json={"message": "First", "use_cache": False})
+        )
+        await asyncio.sleep(0.05)
+        second = await client.post("/api/v1/chat", json={"message": "Second", "use_cache": False})
+        release.set()
+        first = await first
+
+    assert second.status_code == 503
+    assert "Retry-After" in second.headers
+    assert first.status_code == 200
+    assert limiter.active == 0
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_chat_rate_limited_per_client_ip(client: AsyncClient):
+    """Test that a new session ID per request does not get around the rate limit"""
+    limiter = TokenBucketLimiter(rate_per_minute=1, burst=1, max_keys=10)
+
+    with patch("backend.app.admission.client_rate_limiter", limiter), patch.object(
+        get_http_client(), "post", return_value=make_completion_response("Hi")
+    ):
+        payload = {"message": "Hi", "use_cache": False}
+        allowed = await client.post(
+            "/api/v1/chat", json={**payload, "session_id": str(uuid.uuid4())}
+        )
+        limited = await client.post(
+            "/api/v1/chat", json={**payload, "session_id": str(uuid.uuid4())}
+        )
+
+    assert allowed.status_code == 200
+    assert limited.status_code == 429
+    assert int(limited.headers["Retry-After"]) > 1
+    assert list(limiter.buckets) == ["ip:127.0.0.1"]
+    stats = (await client.get("/api/v1/admin/admission")).json()
+    assert set(stats["routes"]) == {"chat", "stream", "batch"}
+    assert stats["upstream"]["active"] == 0
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_stream_holds_its_slot_until_body_is_sent(client: AsyncClient):
+    active_while_streaming = []
+
+    class Upstream(FakeUpstreamStream):
+        async def aiter_bytes(self):
+            active_while_streaming.append(route_limiters["stream"].active)
+            yield completion_chunk("streamed")
+
+    with patch.object(get_http_client(), "stream", return_value=Upstream(200)):
+        response = await client.post(
+            "/api/v1/chat/stream", json={"message": "Stream me", "use_cache": False}
+        )
+
+    assert response.text == "streamed"
+    assert active_while_streaming == [1]
+    assert route_limiters["stream"].active == 0
@@ -0,0 +1,112 @@
+import asyncio
+import json
+from unittest.mock import patch
+
+import pytest
+from httpx import AsyncClient
+
+from backend.app.batch import batch_settings, map_unordered
+from backend.app.chat_cache import response_cache
+from backend.app.conversations import conversation_store
+from backend.app.routing import upstream_router
+from backend.app.upstream import get_http_client
+from tests.api.test_upstream import make_completion_response
+
+
+@pytest.mark.asyncio
+async def test_map_unordered_bounds_concurrency_and_yields_in_completion_order():
+    in_flight = 0
+    peak = 0
+
+    async def work(delay):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(delay)
+        in_flight -= 1
+        return delay
+
+    delays = [0.05, 0.01, 0.03, 0.02, 0.04]
+    results = [result async for result in map_unordered(delays, work, concurrency=2)]
+
+    assert sorted(results) == sorted(delays)
+    assert results[0] == 0.01
+    assert peak == 2
+
+
+@pytest.mark.asyncio
+async def test_map_unordered_cancels_work_when_consumer_stops():
+    cancelled = []
+
+    async def work(item):
+        try:
+            await asyncio.sleep(0 if item == 0 else 10)
+        except asyncio.CancelledError:
+            cancelled.append(item)
+            raise
+        return item
+
+    results = map_unordered(range(100), work, concurrency=3)
+    assert await results.__anext__() == 0
+    await results.aclose()
+
+    assert sorted(cancelled) == [1, 2, 3]
+
+
+def parse_lines(body: str):
+    return [json.loads(line) for line in body.splitlines()]
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_chat_batch_streams_ndjson_results(client: AsyncClient):
+    """Test that every prompt gets a result line and failures are reported per item"""
+    response_cache.memory.clear()
+    sessions_before = len(conversation_store.sessions)
+
+    async def post(url, json, **kwargs):
+        prompt = json["messages"][-1]["content"]
+        if prompt == "fail":
+            raise ConnectionError("upstream down")
+        await asyncio.sleep(0.05 if prompt == "slow" else 0)
+        return make_completion_response(f"answer to {prompt}")
+
+    payload = {
+        "items": [
+            {"id": "a", "message": "slow"},
+            {"id": "b", "message": "fast"},
+            {"id": "c", "message": "fail"},
+        ],
+        "concurrency": 3,
+        "use_cache": False,
+    }
+    with patch.object(get_http_client(), "post", side_effect=post):
+        response = await client.post("/api/v1/chat/batch", json=payload)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = parse_lines(response.text)
+    results = {line["id"]: line for line in lines[:-1]}
+    assert results["a"] == {"index": 0, "id": "a", "message": "answer to slow"}
+    assert results["b"]["message"] == "answer to fast"
+    assert results["c"]["status"] == 502
+    # Completion order: the slow prompt finishes last
+    assert [line["id"] for line in lines[:-1]][-1] == "a"
+    assert lines[-1]["done"] is True
+    assert (lines[-1]["succeeded"], lines[-1]["failed"]) == (2, 1)
+    # Batch prompts are not stored as conversations
+    assert len(conversation_store.sessions) == sessions_before
+    upstream_router.targets.clear()
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_chat_batch_rejects_oversized_batches(client: AsyncClient):
+    with patch.object(batch_settings, "chat_batch_max_items", 2):
+        response = await client.post(
+            "/api/v1/chat/batch", json={"items": [{"message": str(i)} for i in range(3)]}
+        )
+    assert response.status_code == 413
+
+    response = await client.post("/api/v1/chat/batch", json={"items": []})
+    assert response.status_code == 422
@@ -0,0 +1,134 @@
+import asyncio
+import time
+from unittest.mock import patch
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import delete
+
+from backend.app.chat_cache import LRUCache, ResponseCache, cache_key, response_cache
+from backend.app.models import ChatResponseCache
+from backend.app.upstream import get_http_client
+from tests.api.test_upstream import make_completion_response
+from tests.conftest import test_async_session as session_factory
+
+
+@pytest.fixture(autouse=True)
+def clear_response_cache():
+    response_cache.memory.clear()
+    yield
+    response_cache.memory.clear()
+
+
+def test_cache_key_is_canonical():
+    """Test that the key only depends on the request content, not dict ordering"""
+    messages = [{"role": "user", "content": "你好"}]
+    assert cache_key("m", messages, 500) == cache_key("m", [{"content": "你好", "role": "user"}], 500)
+    assert cache_key("m", messages, 500) != cache_key("m", messages, 100)
+    assert cache_key("m", messages, 500) != cache_key("other", messages, 500)
+
+
+def test_lru_evicts_by_entries_and_bytes():
+    cache = LRUCache(max_entries=2, max_bytes=10, ttl_seconds=60)
+    cache.put("a", "1")
+    cache.put("b", "2")
+    cache.get("a")
+    cache.put("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+
+    cache.put("big", "x" * 10)
+    assert len(cache) == 1
+    assert cache.bytes == 10
+    assert cache.evictions == 3
+
+
+def test_lru_expires_entries():
+    cache = LRUCache(max_entries=10, max_bytes=1000, ttl_seconds=60)
+    cache.put("a", "1", ttl_seconds=0)
+    time.sleep(0.001)
+    assert cache.get("a") is None
+    assert cache.bytes == 0
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_repeated_chat_is_served_from_cache(client: AsyncClient):
+    """Test that an identical second request does not reach the upstream"""
+    payload = {"message": "What is FastAPI?"}
+
+    with patch.object(get_http_client(), "post") as mock_post:
+        mock_post.return_value = make_completion_response("A web framework")
+        first = await client.post("/api/v1/chat", json=payload)
+        second = await client.post("/api/v1/chat", json=payload)
+
+    assert first.headers["X-Cache"] == "MISS"
+    assert second.headers["X-Cache"] == "HIT"
+    assert second.json()["message"] == "A web framework"
+    mock_post.assert_called_once()
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_use_cache_false_bypasses_cache(client: AsyncClient):
+    payload = {"message": "Tell me a joke", "use_cache": False}
+
+    with patch.object(get_http_client(), "post") as mock_post:
+        mock_post.return_value = make_completion_response("Knock knock")
+        await client.post("/api/v1/chat", json=payload)
+        response = await client.post("/api/v1/chat", json=payload)
+
+    assert "X-Cache" not in response.headers
+    assert mock_post.call_count == 2
+    assert len(response_cache.memory) == 0
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_stream_replays_cached_answer(client: AsyncClient):
+    """Test that /chat/stream replays an answer cached by /chat"""
+    payload = {"message": "Explain caching"}
+
+    with patch.object(get_http_client(), "post") as mock_post:
+        mock_post.return_value = make_completion_response("Keep results " * 20)
+        await client.post("/api/v1/chat", json=payload)
+
+    response = await client.post("/api/v1/chat/stream", json=payload)
+
+    assert response.status_code == 200
+    assert response.headers["X-Cache"] == "HIT"
+    assert response.text == "Keep results " * 20
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_database_tier_is_shared(db_session):
+    """Test that an entry written by one instance is found by another via PostgreSQL"""
+    writer = ResponseCache(db_enabled=True, session_factory=session_factory)
+    reader = ResponseCache(db_enabled=True, session_factory=session_factory)
+
+    await writer.put("shared-key", "test-model", "cached answer")
+    await asyncio.gather(*writer._pending_writes)
+
+    assert await reader.get("shared-key") == "cached answer"
+    assert reader.hits["db"] == 1
+    # Promoted into the local tier
+    assert await reader.get("shared-key") == "cached answer"
+    assert reader.hits["memory"] == 1
+
+    assert await reader.get("unknown-key") is None
+    assert reader.misses == 1
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_purge_trims_database_tier(db_session):
+    await db_session.execute(delete(ChatResponseCache))
+    await db_session.commit()
+    cache = ResponseCache(db_enabled=True, db_max_rows=1, session_factory=session_factory)
+    for i in range(3):
+        await cache._db_put(f"key-{i}", "test-model", f"answer {i}")
+
+    assert await cache.purge() == 2
+    cache.memory.clear()
+    assert await cache.get("key-2") == "answer 2"
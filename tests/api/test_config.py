@@ -0,0 +1,67 @@
+import os
+from unittest.mock import patch
+
+import pytest
+from httpx import AsyncClient
+
+from backend.app.config import DEFAULT_API_URL, Settings, get_settings
+from backend.app.hedging import HedgingSettings
+from backend.app.main import app
+from backend.app.upstream import get_http_client
+
+
+def test_blank_settings_fall_back_to_defaults(monkeypatch):
+    monkeypatch.setenv("MODEL_NAME", " ")
+    monkeypatch.setenv("OPENROUTER_API_URL", "")
+    monkeypatch.setenv("MAX_TOKENS", "64")
+
+    settings = Settings(_env_file=None)
+
+    assert settings.model_name == Settings.model_fields["model_name"].default
+    assert settings.openrouter_api_url == DEFAULT_API_URL
+    assert settings.max_tokens == 64
+
+
+def test_masked_api_key():
+    settings = Settings(_env_file=None, openrouter_api_key="sk-or-v1-0123456789abcdef")
+    assert settings.masked_api_key == "sk-or-v1...cdef"
+
+
+def test_api_key_has_no_default(monkeypatch):
+    monkeypatch.delenv("OPENROUTER_API_KEY", raising=False)
+    assert Settings(_env_file=None).openrouter_api_key == ""
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_endpoints_without_api_key_do_not_call_upstream(client: AsyncClient):
+    settings = Settings(_env_file=None, openrouter_api_key="")
+    app.dependency_overrides[get_settings] = lambda: settings
+    try:
+        with patch.object(get_http_client(), "post") as mock_post:
+            chat = await client.post("/api/v1/chat", json={"message": "Hi", "use_cache": False})
+            connection = await client.get("/api/v1/test-connection")
+    finally:
+        del app.dependency_overrides[get_settings]
+
+    assert chat.status_code == 500
+    assert "API key not configured" in chat.json()["detail"]
+    assert {test["status"] for test in connection.json()["api_tests"]} == {"Skipped"}
+    mock_post.assert_not_called()
+
+
+def test_module_tunables_read_the_env_file(tmp_path, monkeypatch):
+    monkeypatch.delenv("UPSTREAM_HEDGING_ENABLED", raising=False)
+    monkeypatch.delenv("UPSTREAM_HEDGE_MAX_EXTRA", raising=False)
+    env_file = tmp_path / ".env"
+    env_file.write_text("UPSTREAM_HEDGING_ENABLED=true\nUPSTREAM_HEDGE_MAX_EXTRA=2\n")
+
+    settings = HedgingSettings(_env_file=env_file)
+
+    assert settings.upstream_hedging_enabled is True
+    assert settings.upstream_hedge_max_extra == 2
+    # Read by pydantic-settings, not copied into the process environment
+    assert "UPSTREAM_HEDGING_ENABLED" not in os.environ
+
+    monkeypatch.setenv("UPSTREAM_HEDGE_MAX_EXTRA", "3")
+    assert HedgingSettings(_env_file=env_file).upstream_hedge_max_extra == 3
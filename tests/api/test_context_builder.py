@@ -0,0 +1,111 @@
+import uuid
+from unittest.mock import patch
+
+import pytest
+from httpx import AsyncClient
+
+from backend.app.context_builder import (
+    COLLAPSED_MARKER,
+    build_context,
+    estimate_tokens,
+    parse_model_budgets,
+    truncate_to_tokens,
+)
+from backend.app.routers import ai
+from backend.app.upstream import get_http_client
+from tests.api.test_upstream import make_completion_response
+
+
+def conversation(turns: int, length: int):
+    messages = [{"role": "system", "content": "You are helpful."}]
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"question {i} " + "q" * length})
+        messages.append({"role": "assistant", "content": f"answer {i} " + "a" * length})
+    messages.append({"role": "user", "content": "latest question"})
+    return messages
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abcdefgh") == 2
+    # One token per CJK character
+    assert estimate_tokens("你好世界") == 4
+    assert estimate_tokens("hello 你好") == 2 + 2
+
+
+def test_parse_model_budgets():
+    assert parse_model_budgets("a/b=8000, c/d:free=16000,broken") == {
+        "a/b": 8000,
+        "c/d:free": 16000,
+    }
+
+
+def test_short_conversation_is_unchanged():
+    messages = conversation(turns=2, length=10)
+    built = build_context(messages, budget=4000)
+    assert built.messages == messages
+    assert (built.dropped, built.collapsed) == (0, 0)
+    assert built.estimated_tokens <= 4000
+
+
+def test_long_conversation_keeps_system_prompt_and_recent_turns():
+    messages = conversation(turns=50, length=400)
+    built = build_context(messages, budget=1000)
+
+    assert built.estimated_tokens <= 1000
+    assert built.messages[0] == messages[0]
+    assert built.messages[-1] == messages[-1]
+    assert built.messages[-2] == messages[-2]
+    assert built.dropped + len(built.messages) == len(messages)
+
+
+def test_older_message_is_shortened_when_budget_remains():
+    messages = [
+        {"role": "user", "content": "first"},
+        {"role": "assistant", "content": "a" * 2000},
+        {"role": "user", "content": "next"},
+    ]
+    built = build_context(messages, budget=200)
+
+    assert built.estimated_tokens <= 200
+    assert (built.dropped, built.collapsed) == (1, 1)
+    assert built.messages[0]["content"].endswith(COLLAPSED_MARKER)
+    assert built.messages[-1] == messages[-1]
+
+
+def test_latest_message_is_always_kept():
+    messages = [{"role": "user", "content": "x" * 10_000}]
+    built = build_context(messages, budget=100)
+    assert built.messages == messages
+    assert built.estimated_tokens > 100
+
+
+def test_truncate_to_tokens():
+    assert truncate_to_tokens("short", 10) == "short"
+    assert truncate_to_tokens("你好世界你好世界", 3) == "你好世" + COLLAPSED_MARKER
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_chat_trims_context_and_reports_estimate(client: AsyncClient, monkeypatch):
+    """Test that /chat forwards a budgeted context and reports its estimated size"""
+    monkeypatch.setattr(ai, "budget_for_model", lambda model: 300)
+    context = conversation(turns=20, length=200)[:-1]
+
+    with patch.object(get_http_client(), "post") as mock_post:
+        mock_post.return_value = make_completion_response("OK")
+        response = await client.post(
+            "/api/v1/chat",
+            json={
+                "message": "latest question",
+                "session_id": str(uuid.uuid4()),
+                "context": context,
+                "use_cache": False,
+            },
+        )
+
+    sent = mock_post.call_args[1]["json"]["messages"]
+    assert len(sent) < len(context) + 1
+    assert sent[0]["role"] == "system"
+    assert sent[-1]["content"] == "latest question"
+    assert int(response.headers["X-Prompt-Tokens-Estimate"]) <= 300
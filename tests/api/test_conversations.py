@@ -0,0 +1,163 @@
+import uuid
+from unittest.mock import patch
+
+import httpx
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.app.chat_cache import response_cache
+from backend.app.conversations import ConversationStore, conversation_store
+from backend.app.models import ChatMessage
+from backend.app.upstream import get_http_client
+from backend.app.write_behind import chat_write_behind
+from tests.api.test_upstream import make_completion_response
+
+
+async def chunks(*parts):
+    for part in parts:
+        yield part
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_chat_persists_turns_and_rebuilds_context(client: AsyncClient, db_session):
+    """Test that the client only sends the new message and the server supplies the history"""
+    response_cache.memory.clear()
+    session_id = str(uuid.uuid4())
+
+    with patch.object(get_http_client(), "post") as mock_post:
+        mock_post.return_value = make_completion_response("Paris")
+        await client.post(
+            "/api/v1/chat", json={"message": "Capital of France?", "session_id": session_id}
+        )
+        mock_post.return_value = make_completion_response("About 2 million")
+        response = await client.post(
+            "/api/v1/chat", json={"message": "Population?", "session_id": session_id}
+        )
+
+    assert response.json()["message"] == "About 2 million"
+    assert mock_post.call_args[1]["json"]["messages"] == [
+        {"role": "user", "content": "Capital of France?"},
+        {"role": "assistant", "content": "Paris"},
+        {"role": "user", "content": "Population?"},
+    ]
+
+    await chat_write_behind.flush_all()
+    result = await db_session.execute(
+        select(ChatMessage.is_user, ChatMessage.content)
+        .where(ChatMessage.session_id == uuid.UUID(session_id))
+        .order_by(ChatMessage.timestamp)
+    )
+    assert [tuple(row) for row in result] == [
+        ("Y", "Capital of France?"),
+        ("N", "Paris"),
+        ("Y", "Population?"),
+        ("N", "About 2 million"),
+    ]
+    response_cache.memory.clear()
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_explicit_context_is_still_honoured(client: AsyncClient):
+    """Test that older clients sending the full context keep working"""
+    context = [{"role": "user", "content": "Earlier"}, {"role": "assistant", "content": "Reply"}]
+
+    with patch.object(get_http_client(), "post") as mock_post:
+        mock_post.return_value = make_completion_response("OK")
+        await client.post(
+            "/api/v1/chat",
+            json={
+                "message": "Next",
+                "session_id": str(uuid.uuid4()),
+                "context": context,
+                "use_cache": False,
+            },
+        )
+
+    assert mock_post.call_args[1]["json"]["messages"][:2] == context
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_history_is_reloaded_from_database(db_session: AsyncSession):
+    store = ConversationStore(max_sessions=1, max_messages=2)
+    session_id, other_session_id = uuid.uuid4(), uuid.uuid4()
+
+    assert await store.history(db_session, session_id) == []
+    await store.append_turn(db_session, session_id, "Question 1", "Answer 1")
+    await store.append_turn(db_session, session_id, "Question 2", "Answer 2")
+    # Only the most recent messages are kept
+    assert await store.history(db_session, session_id) == [
+        {"role": "user", "content": "Question 2"},
+        {"role": "assistant", "content": "Answer 2"},
+    ]
+
+    # Evicted by another session, then loaded again from chat_messages
+    await store.history(db_session, other_session_id)
+    assert session_id not in store.sessions
+    assert await store.history(db_session, session_id) == [
+        {"role": "user", "content": "Question 2"},
+        {"role": "assistant", "content": "Answer 2"},
+    ]
+    assert store.stats() == {"sessions": 1, "hits": 1, "loads": 3}
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_streamed_turn_is_persisted_after_completion(db_session: AsyncSession):
+    session_id = uuid.uuid4()
+    conversation_store.forget(session_id)
+
+    streamed = conversation_store.record_stream(
+        db_session, session_id, "Stream please", chunks("Hello", ", ", "world")
+    )
+    assert [chunk async for chunk in streamed] == ["Hello", ", ", "world"]
+
+    conversation_store.forget(session_id)
+    assert await conversation_store.history(db_session, session_id) == [
+        {"role": "user", "content": "Stream please"},
+        {"role": "assistant", "content": "Hello, world"},
+    ]
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_failed_chat_is_not_stored_as_a_turn(client: AsyncClient, db_session):
+    """Test that the canned apology after an upstream failure is not part of the history"""
+    session_id = uuid.uuid4()
+
+    with patch.object(get_http_client(), "post", side_effect=httpx.ConnectError("down")):
+        response = await client.post(
+            "/api/v1/chat",
+            json={"message": "Anyone?", "session_id": str(session_id), "use_cache": False},
+        )
+
+    assert response.status_code == 200
+    assert conversation_store.sessions.get(session_id, []) == []
+    assert chat_write_behind.pending_for(session_id) == []
+    history = await client.get(f"/api/v1/sessions/{session_id}/messages")
+    assert history.json()["messages"] == []
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_history_written_elsewhere_is_seen_after_the_ttl(db_session: AsyncSession):
+    """Test that a cached history expires, so turns stored by another worker are loaded"""
+    store = ConversationStore(ttl_seconds=30)
+    other_worker = ConversationStore()
+    session_id = uuid.uuid4()
+    assert await store.history(db_session, session_id) == []
+
+    await other_worker.append_turn(db_session, session_id, "Question", "Answer")
+    await chat_write_behind.flush_all()
+    assert await store.history(db_session, session_id) == []
+
+    loaded_at = store.loaded_at[session_id]
+    with patch("backend.app.conversations.time.monotonic", return_value=loaded_at + 31):
+        assert await store.history(db_session, session_id) == [
+            {"role": "user", "content": "Question"},
+            {"role": "assistant", "content": "Answer"},
+        ]
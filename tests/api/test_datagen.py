@@ -0,0 +1,29 @@
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.app.datagen import asyncpg_dsn, load
+from backend.app.models import ChatMessage, Item
+from tests.conftest import TEST_DATABASE_URL
+
+
+@pytest.mark.asyncio
+async def test_datagen_load(db_session: AsyncSession):
+    """Test bulk loading synthetic items and conversations via COPY"""
+    items_before = await db_session.scalar(select(func.count(Item.id)))
+
+    items, messages = await load(
+        asyncpg_dsn(TEST_DATABASE_URL), items=250, sessions=20, seed=1, batch_size=100
+    )
+
+    assert items == 250
+    # 每轮对话包含一条用户消息和一条AI回复
+    assert messages >= 40 and messages % 2 == 0
+    assert await db_session.scalar(select(func.count(Item.id))) == items_before + 250
+
+    sessions = await db_session.scalar(select(func.count(func.distinct(ChatMessage.session_id))))
+    assert sessions >= 20
+    user_messages = await db_session.scalar(
+        select(func.count(ChatMessage.id)).where(ChatMessage.is_user == "Y")
+    )
+    assert user_messages >= messages // 2
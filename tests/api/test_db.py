@@ -0,0 +1,71 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.app.db import is_statement_timeout, session_with_timeout
+from backend.app.disconnect import CLIENT_CLOSED_REQUEST, cancel_on_disconnect
+
+
+class DisconnectingRequest:
+    """Minimal stand-in for a Request whose client leaves after a delay"""
+
+    method = "GET"
+
+    class url:
+        path = "/api/v1/items"
+
+    def __init__(self, disconnect_after: float):
+        self.disconnect_after = disconnect_after
+
+    async def receive(self):
+        await asyncio.sleep(self.disconnect_after)
+        return {"type": "http.disconnect"}
+
+
+@pytest.mark.asyncio
+async def test_statement_timeout(db_session: AsyncSession):
+    """Test that SET LOCAL statement_timeout cancels slow queries"""
+    session = await session_with_timeout(50)(session=db_session)
+
+    with pytest.raises(DBAPIError) as exc_info:
+        await session.execute(text("SELECT pg_sleep(2)"))
+    assert is_statement_timeout(exc_info.value)
+    await session.rollback()
+
+    # 超时仅作用于当前事务
+    result = await session.execute(text("SHOW statement_timeout"))
+    assert result.scalar() == "0"
+
+
+@pytest.mark.asyncio
+async def test_cancel_on_disconnect(db_session: AsyncSession):
+    """Test that an in-flight query is cancelled when the client disconnects"""
+    request = DisconnectingRequest(disconnect_after=0.1)
+
+    started = time.perf_counter()
+    with pytest.raises(HTTPException) as exc_info:
+        await cancel_on_disconnect(request, db_session.execute(text("SELECT pg_sleep(5)")))
+    assert exc_info.value.status_code == CLIENT_CLOSED_REQUEST
+    assert time.perf_counter() - started < 2
+    await db_session.rollback()
+
+    # 连接应该立即可以继续使用
+    result = await db_session.execute(text("SELECT 1"))
+    assert result.scalar() == 1
+
+
+@pytest.mark.asyncio
+async def test_cancel_on_disconnect_returns_result():
+    """Test that work finishing before a disconnect returns normally"""
+    request = DisconnectingRequest(disconnect_after=5)
+
+    async def work():
+        await asyncio.sleep(0.01)
+        return "done"
+
+    assert await cancel_on_disconnect(request, work()) == "done"
@@ -0,0 +1,155 @@
+import asyncio
+import uuid
+from unittest.mock import MagicMock, patch
+
+import pytest
+from httpx import AsyncClient
+
+from backend.app.hedging import Hedger, LatencyTracker, hedging_settings
+from backend.app.routers.ai import upstream_urls
+from backend.app.routing import upstream_router
+from backend.app.upstream import get_http_client
+from tests.api.test_upstream import make_completion_response
+
+PRIMARY = "https://a.example/api/v1/chat/completions"
+SECONDARY = "https://b.example/api/v1/chat/completions"
+
+
+class FakeClient:
+    """Answers each URL after its own delay and remembers which calls were cancelled"""
+
+    def __init__(self, delays, statuses=None):
+        self.delays = delays
+        self.statuses = statuses or {}
+        self.calls = []
+        self.cancelled = []
+
+    async def post(self, url, **kwargs):
+        self.calls.append(url)
+        try:
+            await asyncio.sleep(self.delays[url])
+        except asyncio.CancelledError:
+            self.cancelled.append(url)
+            raise
+        response = make_completion_response(url)
+        response.status_code = self.statuses.get(url, 200)
+        return response
+
+
+def make_hedger(**kwargs) -> Hedger:
+    options = {"default_delay_ms": 50, "min_delay_ms": 0, "max_delay_ms": 1000}
+    options.update(kwargs)
+    return Hedger(LatencyTracker(min_samples=5), **options)
+
+
+@pytest.mark.asyncio
+async def test_slow_primary_is_hedged_and_loser_cancelled():
+    hedger = make_hedger()
+    client = FakeClient({PRIMARY: 5, SECONDARY: 0.01})
+
+    url, response = await hedger.post(client, [PRIMARY, SECONDARY], json={})
+
+    assert url == SECONDARY
+    assert client.cancelled == [PRIMARY]
+    stats = hedger.snapshot()
+    assert stats["hedged"] == 1
+    assert stats["hedge_wins"] == 1
+    assert stats["cancelled"] == 1
+
+
+@pytest.mark.asyncio
+async def test_fast_primary_is_not_hedged():
+    hedger = make_hedger()
+    client = FakeClient({PRIMARY: 0.01, SECONDARY: 0.01})
+
+    url, _ = await hedger.post(client, [PRIMARY, SECONDARY], json={})
+
+    assert url == PRIMARY
+    assert client.calls == [PRIMARY]
+    assert hedger.snapshot()["hedge_rate"] == 0.0
+
+
+@pytest.mark.asyncio
+async def test_failed_primary_moves_on_without_waiting_for_hedge_delay():
+    hedger = make_hedger(default_delay_ms=1000)
+    client = FakeClient({PRIMARY: 0, SECONDARY: 0}, statuses={PRIMARY: 503})
+    calls = []
+
+    url, response = await asyncio.wait_for(
+        hedger.post(
+            client,
+            [PRIMARY, SECONDARY],
+            on_response=lambda url, status: calls.append((url, status)),
+        ),
+        timeout=0.5,
+    )
+
+    assert (url, response.status_code) == (SECONDARY, 200)
+    assert calls == [(PRIMARY, 503), (SECONDARY, 200)]
+    assert hedger.stats.hedged == 0
+
+
+@pytest.mark.asyncio
+async def test_stop_status_is_returned_without_trying_other_endpoints():
+    hedger = make_hedger()
+    client = FakeClient({PRIMARY: 0, SECONDARY: 0}, statuses={PRIMARY: 404})
+
+    url, response = await hedger.post(client, [PRIMARY, SECONDARY], stop_statuses=(400, 404))
+
+    assert (url, response.status_code) == (PRIMARY, 404)
+    assert client.calls == [PRIMARY]
+
+
+@pytest.mark.asyncio
+async def test_last_response_returned_when_every_endpoint_fails():
+    hedger = make_hedger()
+    client = FakeClient({PRIMARY: 0, SECONDARY: 0}, statuses={PRIMARY: 503, SECONDARY: 402})
+
+    url, response = await hedger.post(client, [PRIMARY, SECONDARY])
+
+    assert (url, response.status_code) == (SECONDARY, 402)
+
+
+def test_hedge_delay_follows_tracked_percentile():
+    hedger = make_hedger(default_delay_ms=3000, min_delay_ms=10, max_delay_ms=500)
+    assert hedger.delay_for(PRIMARY) == 0.5
+
+    for latency_ms in [100, 100, 100, 100, 100, 100, 100, 100, 100, 300]:
+        hedger.tracker.record(PRIMARY, latency_ms)
+    assert hedger.delay_for(PRIMARY) == 0.3
+
+    for _ in range(200):
+        hedger.tracker.record(PRIMARY, 1)
+    assert hedger.delay_for(PRIMARY) == 0.01
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_chat_hedges_slow_endpoint(client: AsyncClient):
+    """Test that /chat answers from the second endpoint when the first one stalls"""
+    hedger = make_hedger(default_delay_ms=20)
+    called = []
+
+    async def post(url, **kwargs):
+        called.append(url)
+        if len(called) == 1:
+            # Whichever endpoint is ranked first stalls
+            await asyncio.sleep(5)
+        return make_completion_response("hedged answer")
+
+    with patch.object(hedging_settings, "upstream_hedging_enabled", True), patch(
+        "backend.app.routers.ai.hedger", hedger
+    ), patch.object(get_http_client(), "post", side_effect=post):
+        response = await asyncio.wait_for(
+            client.post(
+                "/api/v1/chat",
+                json={"message": "Hedge me", "session_id": str(uuid.uuid4()), "use_cache": False},
+            ),
+            timeout=2,
+        )
+
+    assert response.status_code == 200
+    assert response.json()["message"] == "hedged answer"
+    assert hedger.stats.hedge_wins == 1
+    assert sorted(called) == sorted(upstream_urls())
+    upstream_router.targets.clear()
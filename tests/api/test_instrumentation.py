@@ -0,0 +1,55 @@
+import pytest
+from httpx import AsyncClient
+
+from backend.app import instrumentation
+from tests.conftest import test_engine
+
+# 测试使用独立的引擎，需要单独挂载计时钩子
+instrumentation.instrument_engine(test_engine.sync_engine)
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_server_timing_header(client: AsyncClient, setup_database):
+    """Test that SQL statistics are reported via Server-Timing"""
+    response = await client.get("/api/v1/items")
+
+    assert response.status_code == 200
+    server_timing = response.headers["server-timing"]
+    # 列表接口会执行三条语句：设置语句超时、分页查询和计数查询
+    assert "db;dur=" in server_timing
+    assert 'desc="3 queries"' in server_timing
+    assert "db-slowest;dur=" in server_timing
+    assert "app;dur=" in server_timing
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_server_timing_without_queries(client: AsyncClient):
+    """Test Server-Timing on a route that does not touch the database"""
+    response = await client.get("/api/v1/")
+
+    assert response.status_code == 200
+    assert 'desc="0 queries"' in response.headers["server-timing"]
+    assert "db-slowest" not in response.headers["server-timing"]
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_slow_query_explain_capture(client: AsyncClient, setup_database, monkeypatch):
+    """Test that slow SELECTs are captured with EXPLAIN plans"""
+    monkeypatch.setattr(instrumentation.instrumentation_settings, "sql_slow_query_ms", 0.0)
+    monkeypatch.setattr(instrumentation.instrumentation_settings, "sql_explain_slow_queries", True)
+    instrumentation.slow_queries.clear()
+
+    response = await client.get("/api/v1/items")
+    assert response.status_code == 200
+
+    response = await client.get("/api/v1/admin/slow-queries")
+    assert response.status_code == 200
+    data = response.json()
+    selects = [q for q in data["queries"] if q["statement"].lstrip().upper().startswith("SELECT")]
+    assert len(selects) >= 2
+    for query in selects:
+        assert query["error"] is None
+        assert any("actual time" in line for line in query["plan"])
@@ -0,0 +1,98 @@
+import io
+import json
+import logging
+from unittest.mock import patch
+
+from backend.app import logging_config
+from backend.app.logging_config import (
+    JsonFormatter,
+    SampledLogger,
+    ThrottleFilter,
+    logging_stats,
+    start_logging,
+    stop_logging,
+)
+
+
+def make_record(message="hello", level=logging.INFO, lineno=1, **extra):
+    record = logging.makeLogRecord(
+        {"name": "test", "msg": message, "levelno": level, "lineno": lineno, **extra}
+    )
+    record.levelname = logging.getLevelName(level)
+    return record
+
+
+def test_json_formatter_puts_extra_fields_at_top_level():
+    line = JsonFormatter().format(make_record("hi %s", args=("there",), session_id="abc"))
+    entry = json.loads(line)
+    assert entry["message"] == "hi there"
+    assert entry["level"] == "INFO"
+    assert entry["session_id"] == "abc"
+
+
+def test_throttle_rate_limits_each_call_site():
+    throttle = ThrottleFilter(rate_per_second=3)
+
+    with patch("backend.app.logging_config.time.monotonic", return_value=100.0):
+        passed = [throttle.filter(make_record(lineno=1)) for _ in range(5)]
+        # Another call site has its own budget, errors are never throttled
+        assert throttle.filter(make_record(lineno=2))
+        assert throttle.filter(make_record(level=logging.ERROR, lineno=1))
+    assert passed == [True, True, True, False, False]
+
+    with patch("backend.app.logging_config.time.monotonic", return_value=101.0):
+        record = make_record(lineno=1)
+        assert throttle.filter(record)
+    assert record.suppressed == 2
+    assert throttle.rate_limited == 2
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def test_sampled_logger_keeps_a_share_of_debug_records():
+    logger = logging.getLogger("tests.sampled")
+    handler = ListHandler()
+    logger.addHandler(handler)
+    logger.setLevel(logging.DEBUG)
+    sampled = SampledLogger(logger, rate=0.25)
+    before = SampledLogger.sampled_out
+
+    try:
+        with patch("backend.app.logging_config.random.random", side_effect=[0.1, 0.3, 0.9, 0.2]):
+            for i in range(4):
+                sampled.debug("chunk %d", i)
+    finally:
+        logger.removeHandler(handler)
+
+    assert [r.getMessage() for r in handler.records] == ["chunk 0", "chunk 3"]
+    # Attributed to this test, not to the wrapper
+    assert handler.records[0].funcName == "test_sampled_logger_keeps_a_share_of_debug_records"
+    assert SampledLogger.sampled_out - before == 2
+
+
+def test_records_are_written_by_the_listener_thread():
+    output = io.StringIO()
+    logger = logging.getLogger("tests.logging")
+    start_logging(output)
+    try:
+        logger.info("queued %d", 1, extra={"route": "chat"})
+        logger.debug("not enabled at INFO")
+    finally:
+        stop_logging()
+
+    entries = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [(e["message"], e["route"]) for e in entries if e["logger"] == "tests.logging"] == [
+        ("queued 1", "chat")
+    ]
+    stats = logging_stats()
+    assert stats["enabled"] is False
+    assert stats["records"] >= 1
+    assert stats["loop_ms"] >= 0
+    assert logging_config._listener is None
@@ -0,0 +1,95 @@
+import uuid
+from unittest.mock import patch
+
+import pytest
+from httpx import AsyncClient
+
+from backend.app.metrics import (
+    Metric,
+    MetricsRegistry,
+    ai_fallbacks_total,
+    ai_upstream_completion_seconds,
+    ai_upstream_failures_total,
+    http_request_seconds,
+)
+from backend.app.routing import upstream_router
+from backend.app.upstream import get_http_client, upstream_health
+from tests.api.test_upstream import make_completion_response
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("latency_seconds", "Latency", ["route"], buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 3):
+        histogram.observe(value, '/a"b')
+
+    lines = registry.render().splitlines()
+
+    assert lines[:2] == ["# HELP latency_seconds Latency", "# TYPE latency_seconds histogram"]
+    assert lines[2:] == [
+        'latency_seconds_bucket{route="/a\\"b",le="0.1"} 2',
+        'latency_seconds_bucket{route="/a\\"b",le="1"} 3',
+        'latency_seconds_bucket{route="/a\\"b",le="+Inf"} 4',
+        'latency_seconds_sum{route="/a\\"b"} 3.65',
+        'latency_seconds_count{route="/a\\"b"} 4',
+    ]
+
+
+def test_duplicate_metric_names_are_rejected():
+    registry = MetricsRegistry()
+    registry.counter("requests_total", "Requests")
+    with pytest.raises(ValueError):
+        registry.gauge("requests_total", "Requests")
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_request_latency_is_recorded_by_route_template(client: AsyncClient, db_session):
+    before = http_request_seconds.count("GET", "/api/v1/items/{item_id}", "404")
+
+    await client.get(f"/api/v1/items/{uuid.uuid4()}")
+    response = await client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert http_request_seconds.count("GET", "/api/v1/items/{item_id}", "404") == before + 1
+    assert (
+        'http_request_duration_seconds_count{method="GET",route="/api/v1/items/{item_id}",'
+        'status="404"}' in response.text
+    )
+    assert "# TYPE ai_upstream_ttft_seconds histogram" in response.text
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_upstream_outcomes_are_counted(client: AsyncClient):
+    upstream_router.targets.clear()
+    failed = make_completion_response("unavailable")
+    failed.status_code = 503
+    canned_before = ai_fallbacks_total.value("canned_response")
+    failures_before = ai_upstream_failures_total.value("http_503")
+    model = "test/metrics-model"
+
+    with patch.object(get_http_client(), "post", return_value=failed):
+        await client.post(
+            "/api/v1/chat", json={"message": "Anyone there?", "model": model, "use_cache": False}
+        )
+    assert ai_fallbacks_total.value("canned_response") == canned_before + 1
+    assert ai_upstream_failures_total.value("http_503") > failures_before
+
+    with patch.object(get_http_client(), "post", return_value=make_completion_response("Hi")):
+        await client.post(
+            "/api/v1/chat", json={"message": "Hello?", "model": model, "use_cache": False}
+        )
+    assert ai_upstream_completion_seconds.count(model, "chat") == 1
+
+    upstream_router.targets.clear()
+    upstream_health.endpoints.clear()
+
+
+def test_metric_without_samples_cannot_be_created():
+    class Incomplete(Metric):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete("incomplete", "Missing samples()")
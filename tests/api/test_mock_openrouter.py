@@ -0,0 +1,104 @@
+import uuid
+from unittest.mock import patch
+
+import httpx
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import select
+
+from backend.app import upstream
+from backend.app.models import UsageDaily
+from backend.app.routing import upstream_router
+from backend.app.sse import iter_content_deltas
+from backend.app.upstream import upstream_health
+from backend.app.usage import usage_accumulator
+from tests.perf.mock_openrouter import (
+    COMPLETIONS_PATH,
+    MockConfig,
+    Recording,
+    create_app,
+)
+
+FAST = {"ttft": 0, "tokens_per_second": 0, "seed": 7}
+
+
+def mock_client(config: MockConfig) -> httpx.AsyncClient:
+    transport = httpx.ASGITransport(app=create_app(config))
+    return httpx.AsyncClient(transport=transport, base_url="http://mock")
+
+
+def completion_request(**overrides):
+    return {
+        "model": "mock/model",
+        "messages": [{"role": "user", "content": "Say hello"}],
+        **overrides,
+    }
+
+
+@pytest.mark.asyncio
+async def test_stream_sends_the_configured_tokens_and_usage():
+    async with mock_client(MockConfig(completion_tokens=5, **FAST)) as client:
+        response = await client.post(
+            COMPLETIONS_PATH,
+            json=completion_request(stream=True, stream_options={"include_usage": True}),
+        )
+        usage = {}
+        deltas = [delta async for delta in iter_content_deltas(response.aiter_bytes(), usage)]
+
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert len([delta for delta in deltas if delta]) == 5
+    assert usage["completion_tokens"] == 5
+    assert usage["prompt_tokens"] > 0
+
+
+@pytest.mark.asyncio
+async def test_errors_and_rate_limits_are_injected():
+    async with mock_client(MockConfig(rate_limit_rate=1, retry_after=3, **FAST)) as client:
+        limited = await client.post(COMPLETIONS_PATH, json=completion_request())
+    async with mock_client(MockConfig(error_rate=1, error_status=502, **FAST)) as client:
+        failed = await client.post(COMPLETIONS_PATH, json=completion_request())
+        stats = (await client.get("/stats")).json()
+
+    assert (limited.status_code, limited.headers["retry-after"]) == (429, "3")
+    assert failed.status_code == 502
+    assert failed.json()["error"]["code"] == 502
+    assert (stats["requests"], stats["errors"]) == (1, 1)
+
+
+@pytest.mark.asyncio
+async def test_recordings_are_replayed_byte_for_byte(tmp_path):
+    chunks = [(0.0, b": OPENROUTER PROCESSING\n\n"), (0.01, b'data: {"choices": []}\n\n')]
+    path = tmp_path / "streams.jsonl"
+    path.write_text(Recording(True, 200, "text/event-stream", chunks).to_json() + "\n")
+
+    config = MockConfig(replay_path=str(path), replay_speed=10, **FAST)
+    async with mock_client(config) as client:
+        replayed = await client.post(COMPLETIONS_PATH, json=completion_request(stream=True))
+        missing = await client.post(COMPLETIONS_PATH, json=completion_request())
+
+    assert replayed.content == b"".join(data for _, data in chunks)
+    assert missing.status_code == 501
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_chat_is_answered_through_the_mock(client: AsyncClient, db_session):
+    upstream_router.targets.clear()
+    session_id = uuid.uuid4()
+
+    async with mock_client(MockConfig(completion_tokens=8, **FAST)) as mock:
+        with patch.object(upstream, "_client", mock):
+            response = await client.post(
+                "/api/v1/chat",
+                json={"message": "Hello?", "session_id": str(session_id), "use_cache": False},
+            )
+
+    assert response.status_code == 200
+    assert len(response.json()["message"].split()) == 8
+    # The mock's reported usage is accounted, not the local estimate
+    await usage_accumulator.flush()
+    row = await db_session.scalar(select(UsageDaily).where(UsageDaily.session_id == session_id))
+    assert (row.completion_tokens, row.estimated_requests) == (8, 0)
+
+    upstream_router.targets.clear()
+    upstream_health.endpoints.clear()
@@ -0,0 +1,119 @@
+import threading
+from unittest.mock import patch
+
+import pytest
+from httpx import AsyncClient
+
+from backend.app.chat_cache import response_cache
+from backend.app.near_dup import (
+    NearDuplicateIndex,
+    find_near_duplicate,
+    index_near_duplicate,
+    jaccard,
+    minhash,
+    near_dup_index,
+    near_dup_settings,
+    normalize,
+    shingles,
+    sign_text,
+)
+from backend.app.upstream import get_http_client
+from tests.api.test_upstream import make_completion_response
+
+PROMPT = "How do I create an index on a PostgreSQL table to speed up my queries?"
+
+
+def test_normalize_ignores_case_punctuation_and_whitespace():
+    assert normalize("  Hello,   WORLD!! ") == "hello world"
+    assert normalize("你好，世界。") == "你好 世界"
+
+
+def test_minhash_estimates_jaccard():
+    a = shingles(normalize(PROMPT))
+    b = shingles(normalize(PROMPT.replace("speed up", "accelerate")))
+    signature_a, signature_b = minhash(a), minhash(b)
+    estimate = sum(x == y for x, y in zip(signature_a, signature_b)) / len(signature_a)
+    assert abs(estimate - jaccard(a, b)) < 0.2
+
+
+def test_query_finds_reworded_prompt_in_same_scope():
+    index = NearDuplicateIndex(threshold=0.8, max_entries=10)
+    index.add("scope", PROMPT, "key-1")
+
+    match = index.query(
+        "scope", "how do I create an index on a postgresql table, to speed up my queries"
+    )
+    assert match is not None
+    assert match.key == "key-1"
+    assert match.similarity >= 0.8
+
+    assert index.query("other-scope", PROMPT) is None
+    assert index.query("scope", "What is the capital of France?") is None
+
+
+def test_candidates_below_threshold_count_as_false_positives():
+    index = NearDuplicateIndex(threshold=0.99, max_entries=10)
+    index.add("scope", PROMPT, "key-1")
+
+    assert index.query("scope", PROMPT.replace("PostgreSQL", "MySQL")) is None
+    stats = index.stats()
+    assert stats["candidates"] == 1
+    assert stats["false_positives"] == 1
+    assert stats["false_positive_rate"] == 1.0
+
+
+def test_index_is_bounded():
+    index = NearDuplicateIndex(threshold=0.8, max_entries=2)
+    for i, text in enumerate(["first prompt text", "second prompt text", "third prompt text"]):
+        index.add("scope", text, f"key-{i}")
+
+    assert list(index.entries) == ["key-1", "key-2"]
+    assert all("key-0" not in bucket for bucket in index.buckets.values())
+
+
+@pytest.mark.asyncio
+async def test_long_prompt_is_signed_once_off_the_event_loop():
+    index = NearDuplicateIndex(threshold=0.8, max_entries=10)
+    long_prompt = PROMPT * 10
+    threads = []
+
+    def sign(text):
+        threads.append(threading.get_ident())
+        return sign_text(text)
+
+    with patch("backend.app.near_dup.sign_text", side_effect=sign), patch(
+        "backend.app.near_dup.near_dup_index", index
+    ):
+        assert await find_near_duplicate("scope", long_prompt) is None
+        await index_near_duplicate("scope", long_prompt, "key-1")
+
+    # The lookup's signature is reused to index the answer
+    assert len(threads) == 1
+    assert threads[0] != threading.get_ident()
+    assert list(index.entries) == ["key-1"]
+    assert index.signatures == {}
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_chat_serves_near_duplicate_from_cache(client: AsyncClient, monkeypatch):
+    """Test that a reworded prompt is answered from the cache without an upstream call"""
+    monkeypatch.setattr(near_dup_settings, "near_dup_cache_enabled", True)
+    response_cache.memory.clear()
+    near_dup_index.entries.clear()
+    near_dup_index.buckets.clear()
+
+    with patch.object(get_http_client(), "post") as mock_post:
+        mock_post.return_value = make_completion_response("CREATE INDEX ...")
+        await client.post("/api/v1/chat", json={"message": PROMPT})
+        hits, misses = dict(response_cache.hits), response_cache.misses
+        response = await client.post("/api/v1/chat", json={"message": PROMPT.upper() + "!!"})
+
+    assert response.status_code == 200
+    assert response.headers["X-Cache"] == "NEAR-HIT"
+    assert float(response.headers["X-Cache-Similarity"]) == 1.0
+    assert response.json()["message"] == "CREATE INDEX ..."
+    mock_post.assert_called_once()
+    # Only the exact lookup is counted, the near-duplicate answer is not an exact hit
+    assert (response_cache.hits, response_cache.misses) == (hits, misses + 1)
+    response_cache.memory.clear()
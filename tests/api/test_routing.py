@@ -0,0 +1,162 @@
+import uuid
+from unittest.mock import patch
+
+import pytest
+from httpx import AsyncClient
+
+from backend.app.config import get_settings
+from backend.app.hedging import hedging_settings
+from backend.app.routers.ai import upstream_urls
+from backend.app.routing import RouteTarget, UpstreamRouter, routing_settings, upstream_router
+from backend.app.upstream import get_http_client, upstream_health
+from tests.api.test_upstream import make_completion_response
+
+FAST = "https://fast.example/api/v1/chat/completions"
+SLOW = "https://slow.example/api/v1/chat/completions"
+
+
+def test_targets_ranked_by_latency_and_speed():
+    router = UpstreamRouter(alpha=1.0)
+    router.record_success(
+        RouteTarget(SLOW, "m"), ttft_ms=900, duration_ms=1000, completion_tokens=50
+    )
+    router.record_success(
+        RouteTarget(FAST, "m"), ttft_ms=200, duration_ms=1000, completion_tokens=50
+    )
+
+    assert router.candidates([SLOW, FAST], "m", []) == [
+        RouteTarget(FAST, "m"),
+        RouteTarget(SLOW, "m"),
+    ]
+    assert [entry["url"] for entry in router.ranking()] == [FAST, SLOW]
+    # 200ms TTFT + 200 reference tokens at 50 tokens/s
+    assert router.ranking()[0]["score_ms"] == 4200.0
+
+
+def test_slow_non_streamed_answer_does_not_reorder_streaming_targets():
+    router = UpstreamRouter(alpha=1.0)
+    router.record_success(
+        RouteTarget(FAST, "m"), ttft_ms=200, duration_ms=1000, completion_tokens=50
+    )
+    router.record_success(
+        RouteTarget(SLOW, "m"), ttft_ms=900, duration_ms=1000, completion_tokens=50
+    )
+    # A long non-streamed answer has no first-token time to compare
+    router.record_success(RouteTarget(FAST, "m"), ttft_ms=None, duration_ms=30000)
+
+    assert router.candidates([SLOW, FAST], "m", [])[0] == RouteTarget(FAST, "m")
+    fast = router.ranking()[0]
+    assert (fast["ttft_ms"], fast["tokens_per_second"], fast["total_ms"]) == (200, 50, 30000)
+
+
+def test_non_streamed_answers_rank_targets_without_streamed_ones():
+    router = UpstreamRouter(alpha=1.0)
+    router.record_success(RouteTarget(SLOW, "m"), ttft_ms=None, duration_ms=9000)
+    router.record_success(RouteTarget(FAST, "m"), ttft_ms=None, duration_ms=3000)
+
+    assert router.candidates([SLOW, FAST], "m", [])[0] == RouteTarget(FAST, "m")
+    assert router.ranking()[0]["score_ms"] == 3000.0
+
+
+def test_errors_demote_a_fast_target():
+    router = UpstreamRouter(alpha=0.5)
+    router.record_success(RouteTarget(SLOW, "m"), ttft_ms=900)
+    router.record_success(RouteTarget(FAST, "m"), ttft_ms=200)
+    for _ in range(3):
+        router.record_failure(RouteTarget(FAST, "m"), "HTTP 502")
+
+    assert router.candidates([FAST, SLOW], "m", [])[0] == RouteTarget(SLOW, "m")
+    assert router.ranking()[-1]["failures"] == 3
+
+
+def test_failing_target_ranks_after_unmeasured_ones():
+    router = UpstreamRouter()
+    router.record_failure(RouteTarget(FAST, "m"), "ConnectError")
+
+    assert router.candidates([FAST, SLOW], "m", [])[0] == RouteTarget(SLOW, "m")
+
+
+def test_requested_model_comes_before_fallback_models():
+    router = UpstreamRouter()
+    router.record_success(RouteTarget(FAST, "fallback"), ttft_ms=1)
+    router.record_success(RouteTarget(FAST, "requested"), ttft_ms=5000)
+
+    assert [target.model for target in router.candidates([FAST], "requested", ["fallback"])] == [
+        "requested",
+        "fallback",
+    ]
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_chat_fails_over_to_fallback_model(client: AsyncClient):
+    """Test that a model error skips the model on every endpoint and tries the fallback"""
+    upstream_router.targets.clear()
+    not_found = make_completion_response("model not found")
+    not_found.status_code = 404
+
+    model_name = get_settings().model_name
+    models = []
+
+    def post(url, json, **kwargs):
+        models.append(json["model"])
+        return not_found if json["model"] == model_name else make_completion_response("fallback")
+
+    with patch.object(routing_settings, "upstream_fallback_models", "test/fallback"), patch.object(
+        get_http_client(), "post", side_effect=post
+    ):
+        response = await client.post(
+            "/api/v1/chat",
+            json={"message": "Route me", "session_id": str(uuid.uuid4()), "use_cache": False},
+        )
+
+    assert response.json()["message"] == "fallback"
+    assert models == [model_name, "test/fallback"]
+
+    ranking = (await client.get("/api/v1/admin/upstream/routing")).json()["targets"]
+    assert {(entry["model"], entry["failures"]) for entry in ranking} == {
+        (model_name, 1),
+        ("test/fallback", 0),
+    }
+    assert len(upstream_urls()) > 1
+    upstream_router.targets.clear()
+    upstream_health.endpoints.clear()
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_hedged_chat_fails_over_to_fallback_model(client: AsyncClient):
+    """Test that hedging still moves on to the fallback model after a model error"""
+    upstream_router.targets.clear()
+    not_found = make_completion_response("model not found")
+    not_found.status_code = 404
+    calls = []
+
+    def post(url, json, **kwargs):
+        calls.append((url, json["model"]))
+        if json["model"] == "qwen/nonexistent":
+            return not_found
+        return make_completion_response("fallback")
+
+    with patch.object(hedging_settings, "upstream_hedging_enabled", True), patch.object(
+        routing_settings, "upstream_fallback_models", "anthropic/claude-3-haiku"
+    ), patch("backend.app.routers.ai.record_fallback") as record_fallback, patch.object(
+        get_http_client(), "post", side_effect=post
+    ):
+        response = await client.post(
+            "/api/v1/chat",
+            json={
+                "message": "Hedge and route me",
+                "session_id": str(uuid.uuid4()),
+                "model": "qwen/nonexistent",
+                "use_cache": False,
+            },
+        )
+
+    assert response.status_code == 200
+    assert response.json()["message"] == "fallback"
+    # The model error is not retried on the other endpoints
+    assert [model for _, model in calls] == ["qwen/nonexistent", "anthropic/claude-3-haiku"]
+    record_fallback.assert_called_once_with("fallback_model")
+    upstream_router.targets.clear()
+    upstream_health.endpoints.clear()
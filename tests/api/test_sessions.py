@@ -0,0 +1,128 @@
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.app.conversations import SUMMARY_FLAG
+from backend.app.models import ChatMessage
+from backend.app.write_behind import chat_write_behind, turn_rows
+
+
+async def add_conversation(db_session: AsyncSession, session_id: uuid.UUID, turns: int):
+    start = datetime(2026, 1, 1)
+    db_session.add_all(
+        [
+            ChatMessage(
+                session_id=session_id,
+                is_user="Y" if i % 2 == 0 else "N",
+                content=f"message {i}",
+                # Pairs of messages share a timestamp, so the id has to break ties
+                timestamp=start + timedelta(seconds=i // 2),
+            )
+            for i in range(turns * 2)
+        ]
+    )
+    await db_session.commit()
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_session_messages_are_paged_newest_first(client: AsyncClient, db_session):
+    """Test that following next_cursor visits every message exactly once"""
+    session_id = uuid.uuid4()
+    await add_conversation(db_session, session_id, turns=6)
+
+    pages = []
+    cursor = None
+    while True:
+        params = {"limit": 5, **({"before": cursor} if cursor else {})}
+        response = await client.get(f"/api/v1/sessions/{session_id}/messages", params=params)
+        assert response.status_code == 200
+        page = response.json()
+        pages.append(page["messages"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert [len(page) for page in pages] == [5, 5, 2]
+    # Each page is in chronological order, pages go back in time
+    history = [m for page in reversed(pages) for m in page]
+    keys = [(m["timestamp"], uuid.UUID(m["id"])) for m in history]
+    assert keys == sorted(keys)
+    assert len(set(keys)) == 12
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_session_messages_include_unflushed_turns(client: AsyncClient, db_session):
+    session_id = uuid.uuid4()
+    await add_conversation(db_session, session_id, turns=1)
+    chat_write_behind.enqueue(turn_rows(session_id, "just asked", "just answered"))
+
+    response = await client.get(f"/api/v1/sessions/{session_id}/messages", params={"limit": 3})
+
+    contents = [m["content"] for m in response.json()["messages"]]
+    assert len(contents) == 3
+    assert contents[1:] == ["just asked", "just answered"]
+    await chat_write_behind.flush_all()
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_summaries_are_left_out_of_history_and_search(client: AsyncClient, db_session):
+    session_id = uuid.uuid4()
+    await add_conversation(db_session, session_id, turns=1)
+    db_session.add(
+        ChatMessage(
+            session_id=session_id,
+            is_user=SUMMARY_FLAG,
+            content="They discussed message summaries",
+            timestamp=datetime(2026, 1, 1),
+        )
+    )
+    await db_session.commit()
+
+    history = await client.get(f"/api/v1/sessions/{session_id}/messages")
+    search = await client.get(
+        "/api/v1/sessions/messages/search",
+        params={"q": "summaries", "session_id": str(session_id)},
+    )
+
+    # Both turns share a timestamp, so their order depends on the ids
+    assert sorted(m["role"] for m in history.json()["messages"]) == ["assistant", "user"]
+    assert search.json()["messages"] == []
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_invalid_cursor_is_rejected(client: AsyncClient):
+    response = await client.get(
+        f"/api/v1/sessions/{uuid.uuid4()}/messages", params={"before": "not-a-cursor"}
+    )
+    assert response.status_code == 400
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_search_messages(client: AsyncClient, db_session):
+    session_id, other_session_id = uuid.uuid4(), uuid.uuid4()
+    db_session.add_all(
+        [
+            ChatMessage(session_id=session_id, is_user="Y", content="How do I tune PostgreSQL?"),
+            ChatMessage(session_id=session_id, is_user="N", content="Start with shared_buffers"),
+            ChatMessage(session_id=other_session_id, is_user="Y", content="postgresql vacuum"),
+        ]
+    )
+    await db_session.commit()
+
+    response = await client.get("/api/v1/sessions/messages/search", params={"q": "postgresql"})
+    found = {m["content"] for m in response.json()["messages"]}
+    assert {"How do I tune PostgreSQL?", "postgresql vacuum"} <= found
+
+    response = await client.get(
+        "/api/v1/sessions/messages/search",
+        params={"q": "postgresql -vacuum", "session_id": str(session_id)},
+    )
+    assert [m["content"] for m in response.json()["messages"]] == ["How do I tune PostgreSQL?"]
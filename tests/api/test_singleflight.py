@@ -0,0 +1,158 @@
+import asyncio
+from unittest.mock import patch
+
+import pytest
+from httpx import AsyncClient
+
+from backend.app.chat_cache import response_cache
+from backend.app.singleflight import SingleFlight, StreamBroadcast, StreamSingleFlight
+from backend.app.upstream import get_http_client
+from tests.api.test_upstream import make_completion_response
+
+
+async def collect(chunks):
+    return [chunk async for chunk in chunks]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_execution():
+    flights = SingleFlight()
+    release = asyncio.Event()
+    calls = 0
+
+    async def work():
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return "answer"
+
+    waiters = [asyncio.create_task(flights.do("key", work)) for _ in range(5)]
+    await asyncio.sleep(0)
+    release.set()
+    results = await asyncio.gather(*waiters)
+
+    assert calls == 1
+    assert [result for result, _ in results] == ["answer"] * 5
+    assert [shared for _, shared in results].count(False) == 1
+    assert flights.stats() == {"in_flight": 0, "started": 1, "coalesced": 4}
+
+
+@pytest.mark.asyncio
+async def test_call_is_cancelled_only_when_every_waiter_left():
+    flights = SingleFlight()
+    started = asyncio.Event()
+
+    async def work():
+        started.set()
+        await asyncio.sleep(10)
+
+    first = asyncio.create_task(flights.do("key", work))
+    second = asyncio.create_task(flights.do("key", work))
+    await started.wait()
+    call = flights.calls["key"]
+
+    first.cancel()
+    await asyncio.sleep(0)
+    assert not call.task.cancelled()
+
+    second.cancel()
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    assert call.task.cancelled()
+    assert "key" not in flights.calls
+
+
+@pytest.mark.asyncio
+async def test_late_subscriber_replays_stream():
+    flights = StreamSingleFlight()
+    produced = asyncio.Event()
+    release = asyncio.Event()
+
+    async def source():
+        yield "Hello"
+        produced.set()
+        await release.wait()
+        yield " world"
+
+    first, shared_first = flights.subscribe("key", source)
+    first_task = asyncio.create_task(collect(first))
+    await produced.wait()
+
+    second, shared_second = flights.subscribe("key", source)
+    second_task = asyncio.create_task(collect(second))
+    release.set()
+
+    assert await first_task == ["Hello", " world"]
+    assert await second_task == ["Hello", " world"]
+    assert (shared_first, shared_second) == (False, True)
+    assert flights.stats()["started"] == 1
+
+
+@pytest.mark.asyncio
+async def test_source_cancelled_when_last_subscriber_disconnects():
+    flights = StreamSingleFlight()
+    cancelled = asyncio.Event()
+
+    async def source():
+        try:
+            yield "first"
+            await asyncio.sleep(10)
+        finally:
+            cancelled.set()
+
+    chunks, _ = flights.subscribe("key", source)
+    assert await chunks.__anext__() == "first"
+    await chunks.aclose()
+
+    await asyncio.wait_for(cancelled.wait(), 1)
+    await asyncio.sleep(0)
+    assert flights.streams == {}
+
+
+@pytest.mark.asyncio
+async def test_stalled_subscriber_limits_upstream_reads():
+    read = []
+
+    async def source():
+        for i in range(100):
+            read.append(i)
+            yield i
+
+    broadcast = StreamBroadcast(source(), max_lag=4, max_chunks=8)
+    chunks = broadcast.subscribe()
+    assert await chunks.__anext__() == 0
+    # The subscriber stalls on the first chunk
+    await asyncio.sleep(0.05)
+    assert len(read) == 4
+
+    assert await collect(chunks) == list(range(1, 100))
+    # Chunks every subscriber has read are dropped once the log is full
+    assert len(broadcast.chunks) <= 8
+    assert not broadcast.joinable
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_identical_concurrent_chats_call_upstream_once(client: AsyncClient):
+    """Test that a burst of identical /chat requests issues a single upstream call"""
+    response_cache.memory.clear()
+    release = asyncio.Event()
+
+    async def slow_post(*args, **kwargs):
+        await release.wait()
+        return make_completion_response("Shared answer")
+
+    with patch.object(get_http_client(), "post", side_effect=slow_post) as mock_post:
+        requests = [
+            asyncio.create_task(client.post("/api/v1/chat", json={"message": "Retry storm"}))
+            for _ in range(3)
+        ]
+        await asyncio.sleep(0.05)
+        release.set()
+        responses = await asyncio.gather(*requests)
+
+    assert [r.json()["message"] for r in responses] == ["Shared answer"] * 3
+    assert sum(r.headers.get("X-Coalesced") == "true" for r in responses) == 2
+    assert len({r.json()["session_id"] for r in responses}) == 3
+    mock_post.assert_called_once()
+    response_cache.memory.clear()
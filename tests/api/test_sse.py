@@ -0,0 +1,91 @@
+import json
+
+import pytest
+
+from backend.app.sse import SSEDecoder, iter_content_deltas, iter_sse_events
+
+
+def completion_chunk(content) -> bytes:
+    payload = {"choices": [{"delta": {"content": content}}]}
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+async def from_chunks(*chunks: bytes):
+    for chunk in chunks:
+        yield chunk
+
+
+def decode_all(raw: bytes, chunk_size: int):
+    decoder = SSEDecoder()
+    events = []
+    for i in range(0, len(raw), chunk_size):
+        events.extend(decoder.feed(raw[i : i + chunk_size]))
+    events.extend(decoder.flush())
+    return [(event.event, bytes(event.data)) for event in events]
+
+
+RAW = (
+    b"\xef\xbb\xbf: OPENROUTER PROCESSING\r\n\r\n"
+    b'data: {"a": 1}\r\n\r\n'
+    b"event: note\rdata: line one\rdata: line two\r\r\n"
+    b"id: 7\ndata:no-space\n\n" + "data: 你好\n\n".encode("utf-8") + b"data: [DONE]\n\n"
+)
+EXPECTED = [
+    ("message", b'{"a": 1}'),
+    ("note", b"line one\nline two"),
+    ("message", b"no-space"),
+    ("message", "你好".encode("utf-8")),
+    ("message", b"[DONE]"),
+]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64, len(RAW)])
+def test_decoder_is_independent_of_chunk_boundaries(chunk_size):
+    """Test comments, multi-line data, CR/LF/CRLF and split UTF-8 at every chunk size"""
+    assert decode_all(RAW, chunk_size) == EXPECTED
+
+
+def test_decoder_tracks_last_event_id_and_flushes_unterminated_event():
+    decoder = SSEDecoder()
+    assert decoder.feed(b"id: 42\ndata: tail") == []
+    events = decoder.flush()
+    assert [bytes(event.data) for event in events] == [b"tail"]
+    assert events[0].id == "42"
+
+
+def test_decoder_keeps_only_unfinished_line_buffered():
+    decoder = SSEDecoder()
+    decoder.feed(completion_chunk("x") * 100 + b"data: partial")
+    assert bytes(decoder._buffer) == b"data: partial"
+
+
+@pytest.mark.asyncio
+async def test_iter_sse_events():
+    events = [event async for event in iter_sse_events(from_chunks(RAW[:10], RAW[10:]))]
+    assert [bytes(event.data) for event in events] == [data for _, data in EXPECTED]
+
+
+@pytest.mark.asyncio
+async def test_content_deltas_stop_at_done_and_skip_invalid_json():
+    stream = from_chunks(
+        completion_chunk("Hel"),
+        b"data: {not json}\n\n",
+        completion_chunk(""),
+        b'data: {"choices": [{"delta": {"role": "assistant"}}]}\n\n',
+        completion_chunk("lo"),
+        b"data: [DONE]\n\n",
+        completion_chunk("after done"),
+    )
+    assert [content async for content in iter_content_deltas(stream)] == ["Hel", "", "lo"]
+
+
+@pytest.mark.asyncio
+async def test_content_deltas_capture_usage_of_the_last_chunk():
+    usage = {}
+    stream = from_chunks(
+        completion_chunk("Hi"),
+        b'data: {"choices": [], "usage": {"prompt_tokens": 12, "completion_tokens": 1}}\n\n',
+        b"data: [DONE]\n\n",
+    )
+    assert [content async for content in iter_content_deltas(stream, usage)] == ["Hi"]
+    assert usage == {"prompt_tokens": 12, "completion_tokens": 1}
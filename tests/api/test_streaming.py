@@ -0,0 +1,297 @@
+import asyncio
+import time
+import uuid
+from unittest.mock import MagicMock, patch
+
+import pytest
+from httpx import AsyncClient
+
+from backend.app.chat_cache import response_cache
+from backend.app.sse import SSEDecoder
+from backend.app.streaming import (
+    ClosingStreamingResponse,
+    StreamError,
+    event_stream,
+    relay,
+    wants_event_stream,
+    with_heartbeats,
+)
+from backend.app.upstream import get_http_client
+from tests.api.test_sse import completion_chunk
+
+
+class FakeUpstreamStream:
+    """Stands in for the context manager returned by httpx.AsyncClient.stream"""
+
+    def __init__(self, status_code: int, chunks=()):
+        self.response = MagicMock()
+        self.response.status_code = status_code
+        self.chunks = list(chunks)
+        self.response.aiter_bytes = self.aiter_bytes
+
+    async def aiter_bytes(self):
+        for chunk in self.chunks:
+            yield chunk
+
+    async def __aenter__(self):
+        return self.response
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+def parse_events(body: bytes):
+    decoder = SSEDecoder()
+    events = decoder.feed(body) + decoder.flush()
+    return [(event.event, event.json()) for event in events]
+
+
+async def items(*values, delay: float = 0):
+    for value in values:
+        await asyncio.sleep(delay)
+        yield value
+
+
+def test_wants_event_stream():
+    assert wants_event_stream("text/event-stream", None)
+    assert not wants_event_stream("*/*", None)
+    assert wants_event_stream(None, "sse")
+    assert not wants_event_stream("text/event-stream", "text")
+
+
+@pytest.mark.asyncio
+async def test_event_stream_frames_typed_events():
+    body = b"".join(
+        [
+            frame
+            async for frame in event_stream(
+                items("Hel", "lo", StreamError("upstream failed")),
+                started=time.perf_counter(),
+                prompt_tokens=12,
+                metadata={"model": "test-model"},
+            )
+        ]
+    )
+    events = parse_events(body)
+
+    assert [name for name, _ in events] == ["delta", "delta", "error", "usage", "done"]
+    assert events[0][1] == {"content": "Hel"}
+    assert events[2][1] == {"message": "upstream failed"}
+    assert events[3][1]["prompt_tokens"] == 12
+    assert events[3][1]["completion_tokens"] == 2
+    done = events[4][1]
+    assert done["status"] == "error"
+    assert done["chunks"] == 2
+    assert done["model"] == "test-model"
+    assert done["ttft_ms"] <= done["total_ms"]
+
+
+@pytest.mark.asyncio
+async def test_heartbeats_are_sent_while_upstream_is_idle():
+    frames = [
+        frame
+        async for frame in event_stream(
+            items("slow", delay=0.05),
+            started=time.perf_counter(),
+            prompt_tokens=0,
+            heartbeat_interval=0.01,
+        )
+    ]
+    assert frames.count(b": heartbeat\n\n") >= 2
+    assert parse_events(b"".join(frames))[0] == ("delta", {"content": "slow"})
+
+
+@pytest.mark.asyncio
+async def test_with_heartbeats_closes_source_when_consumer_stops():
+    closed = asyncio.Event()
+
+    async def source():
+        try:
+            yield "first"
+            await asyncio.sleep(10)
+            yield "never"
+        finally:
+            closed.set()
+
+    stream = with_heartbeats(source(), interval=10)
+    assert await stream.__anext__() == "first"
+    await stream.aclose()
+    assert closed.is_set()
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_chat_stream_sse_mode(client: AsyncClient):
+    """Test that /chat/stream emits typed events when asked for text/event-stream"""
+    response_cache.memory.clear()
+    upstream = FakeUpstreamStream(200, [completion_chunk("Hi"), completion_chunk(" there")])
+
+    with patch.object(get_http_client(), "stream", return_value=upstream):
+        response = await client.post(
+            "/api/v1/chat/stream",
+            json={"message": "Greet me", "session_id": str(uuid.uuid4())},
+            headers={"Accept": "text/event-stream"},
+        )
+
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = parse_events(response.content)
+    assert [name for name, _ in events] == ["delta", "delta", "usage", "done"]
+    assert "".join(data["content"] for name, data in events if name == "delta") == "Hi there"
+    assert events[-1][1]["status"] == "ok"
+    assert events[-1][1]["cache"] == "MISS"
+    response_cache.memory.clear()
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_chat_stream_usage_event_carries_upstream_counts(client: AsyncClient):
+    usage = b'data: {"choices": [], "usage": {"prompt_tokens": 321, "completion_tokens": 7}}\n\n'
+    upstream = FakeUpstreamStream(200, [completion_chunk("Exact"), usage, b"data: [DONE]\n\n"])
+
+    with patch.object(get_http_client(), "stream", return_value=upstream):
+        response = await client.post(
+            "/api/v1/chat/stream?format=sse", json={"message": "Count me", "use_cache": False}
+        )
+
+    events = dict(parse_events(response.content))
+    assert events["usage"] == {
+        "prompt_tokens": 321,
+        "completion_tokens": 7,
+        "total_tokens": 328,
+        "estimated": False,
+    }
+    assert events["done"]["chunks"] == 1
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_chat_stream_reports_upstream_failure_as_error_event(client: AsyncClient):
+    with patch.object(
+        get_http_client(), "stream", side_effect=lambda *a, **k: FakeUpstreamStream(503)
+    ):
+        sse = await client.post(
+            "/api/v1/chat/stream?format=sse", json={"message": "Fail please", "use_cache": False}
+        )
+        plain = await client.post(
+            "/api/v1/chat/stream", json={"message": "Fail please", "use_cache": False}
+        )
+
+    events = parse_events(sse.content)
+    assert [name for name, _ in events] == ["error", "usage", "done"]
+    assert events[-1][1]["status"] == "error"
+    # The plain-text mode keeps returning the fallback message as text
+    assert plain.headers["content-type"].startswith("text/plain")
+    assert plain.text == events[0][1]["message"]
+
+
+class BrokenUpstreamStream(FakeUpstreamStream):
+    """A 200 stream whose connection drops before the first chunk"""
+
+    async def aiter_bytes(self):
+        raise ConnectionResetError("connection lost")
+        yield
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_chat_stream_without_any_content_is_an_error(client: AsyncClient):
+    """Test that targets failing before their first token end in an error, not an empty answer"""
+    response_cache.memory.clear()
+    attempts = iter([BrokenUpstreamStream(200), FakeUpstreamStream(200, [b"data: [DONE]\n\n"])])
+
+    with patch.object(
+        get_http_client(),
+        "stream",
+        side_effect=lambda *a, **k: next(attempts, FakeUpstreamStream(503)),
+    ):
+        response = await client.post(
+            "/api/v1/chat/stream?format=sse", json={"message": "Say nothing"}
+        )
+
+    events = parse_events(response.content)
+    assert [name for name, _ in events] == ["error", "usage", "done"]
+    assert events[-1][1]["status"] == "error"
+    # The empty answer is not cached
+    assert len(response_cache.memory) == 0
+
+
+@pytest.mark.asyncio
+async def test_relay_applies_backpressure_to_slow_consumer():
+    produced = 0
+
+    async def source():
+        nonlocal produced
+        for i in range(100):
+            produced += 1
+            yield i
+
+    stream = relay(source(), maxsize=4)
+    assert await stream.__anext__() == 0
+    await asyncio.sleep(0.05)
+    # The reader stops once the buffer is full instead of draining the source
+    assert produced <= 4 + 2
+    assert [item async for item in stream] == list(range(1, 100))
+
+
+@pytest.mark.asyncio
+async def test_relay_cancels_reader_when_consumer_aborts():
+    cancelled = asyncio.Event()
+
+    async def source():
+        yield "first"
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+        yield "never"
+
+    stream = relay(source())
+    assert await stream.__anext__() == "first"
+    await asyncio.sleep(0)
+    await stream.aclose()
+    assert cancelled.is_set()
+
+
+@pytest.mark.asyncio
+async def test_relay_reraises_source_errors():
+    async def source():
+        yield "partial"
+        raise RuntimeError("upstream broke")
+
+    stream = relay(source())
+    assert await stream.__anext__() == "partial"
+    with pytest.raises(RuntimeError, match="upstream broke"):
+        await stream.__anext__()
+
+
+@pytest.mark.asyncio
+async def test_client_disconnect_cancels_upstream_read():
+    """Test that a response abandoned mid-generation stops reading the upstream"""
+    upstream_closed = asyncio.Event()
+
+    async def upstream():
+        try:
+            yield "token"
+            await asyncio.sleep(10)
+            yield "never sent"
+        finally:
+            upstream_closed.set()
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+        if message["type"] == "http.response.body":
+            # A slow client: the disconnect arrives while a write is still pending
+            await asyncio.sleep(1)
+
+    async def receive():
+        await asyncio.sleep(0.05)
+        return {"type": "http.disconnect"}
+
+    response = ClosingStreamingResponse(relay(upstream()), media_type="text/plain")
+    await asyncio.wait_for(response({"type": "http"}, receive, send), timeout=2)
+
+    assert upstream_closed.is_set()
+    assert [m.get("body") for m in sent if m["type"] == "http.response.body"] == [b"token"]
@@ -0,0 +1,147 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.app.conversations import SUMMARY_PREFIX, conversation_store
+from backend.app.models import ChatMessage
+from backend.app.routing import upstream_router
+from backend.app.summarizer import SUMMARY_INSTRUCTIONS, ConversationSummarizer
+from backend.app.upstream import get_http_client
+from tests.api.test_upstream import make_completion_response
+from tests.conftest import test_async_session as db_sessions
+
+
+async def add_turns(db_session: AsyncSession, session_id: uuid.UUID, start: int, count: int):
+    base = datetime(2026, 1, 1)
+    for i in range(start, start + count):
+        db_session.add_all(
+            [
+                ChatMessage(
+                    session_id=session_id,
+                    is_user="Y",
+                    content=f"Question {i}",
+                    timestamp=base + timedelta(minutes=i),
+                ),
+                ChatMessage(
+                    session_id=session_id,
+                    is_user="N",
+                    content=f"Answer {i}",
+                    timestamp=base + timedelta(minutes=i, seconds=1),
+                ),
+            ]
+        )
+    await db_session.commit()
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_older_turns_are_folded_into_one_summary(db_session: AsyncSession):
+    summarizer = ConversationSummarizer(
+        trigger_tokens=10, keep_recent=2, session_factory=db_sessions
+    )
+    session_id = uuid.uuid4()
+    prompts = []
+
+    async def summarize(messages):
+        prompts.append(messages[-1]["content"])
+        return f"summary {len(prompts)}"
+
+    await add_turns(db_session, session_id, 0, 4)
+    conversation_store.forget(session_id)
+    await conversation_store.history(db_session, session_id)
+    assert summarizer.schedule(session_id, summarize)
+    await summarizer.stop()
+
+    assert await summarizer.compact(session_id, summarize)
+    assert "Question 2" in prompts[0] and "Question 3" not in prompts[0]
+    # Context now starts from the summary
+    assert await conversation_store.history(db_session, session_id) == [
+        {"role": "system", "content": SUMMARY_PREFIX + "summary 1"},
+        {"role": "user", "content": "Question 3"},
+        {"role": "assistant", "content": "Answer 3"},
+    ]
+
+    # The next compaction folds the previous summary in, not the original turns
+    await add_turns(db_session, session_id, 4, 2)
+    assert await summarizer.compact(session_id, summarize)
+    assert prompts[1].startswith(SUMMARY_PREFIX + "summary 1")
+    assert "Question 0" not in prompts[1] and "Question 4" in prompts[1]
+
+    stats = summarizer.stats(session_id)
+    assert (stats["compactions"], stats["messages_summarized"]) == (2, 10)
+    assert summarizer.stats()["compactions"] == 2
+
+    summaries = await db_session.scalars(
+        select(ChatMessage.content).where(
+            ChatMessage.session_id == session_id, ChatMessage.is_user == "S"
+        )
+    )
+    assert sorted(summaries) == ["summary 1", "summary 2"]
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_short_sessions_are_not_compacted(db_session: AsyncSession):
+    summarizer = ConversationSummarizer(
+        trigger_tokens=10_000, keep_recent=2, session_factory=db_sessions
+    )
+    session_id = uuid.uuid4()
+    await add_turns(db_session, session_id, 0, 1)
+    conversation_store.forget(session_id)
+    await conversation_store.history(db_session, session_id)
+
+    assert not summarizer.schedule(session_id, None)
+    # Nothing older than the recent messages to summarize
+    summarizer.keep_recent = 6
+    assert not await summarizer.compact(session_id, None)
+    assert summarizer.skipped == 1
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_chat_sends_summary_plus_recent_turns(client: AsyncClient):
+    """Test that a long session is compacted in the background and the summary is used"""
+    # Each turn estimates at ~13 tokens, so only the third one crosses the threshold
+    summarizer = ConversationSummarizer(
+        trigger_tokens=35, keep_recent=2, session_factory=db_sessions
+    )
+    session_id = str(uuid.uuid4())
+    sent = []
+
+    async def post(url, json, **kwargs):
+        if json["messages"][0]["content"] == SUMMARY_INSTRUCTIONS:
+            return make_completion_response("They talked about questions")
+        sent.append(json["messages"])
+        return make_completion_response(f"Answer {len(sent)}")
+
+    with patch("backend.app.routers.ai.conversation_summarizer", summarizer), patch.object(
+        get_http_client(), "post", side_effect=post
+    ):
+        for i in range(3):
+            await client.post(
+                "/api/v1/chat",
+                json={"message": f"Question {i}", "session_id": session_id, "use_cache": False},
+            )
+        for _ in range(100):
+            if summarizer.compactions:
+                break
+            await asyncio.sleep(0.01)
+        await client.post(
+            "/api/v1/chat",
+            json={"message": "Question 3", "session_id": session_id, "use_cache": False},
+        )
+    await summarizer.stop()
+
+    assert sent[-1] == [
+        {"role": "system", "content": SUMMARY_PREFIX + "They talked about questions"},
+        {"role": "user", "content": "Question 2"},
+        {"role": "assistant", "content": "Answer 3"},
+        {"role": "user", "content": "Question 3"},
+    ]
+    upstream_router.targets.clear()
@@ -0,0 +1,87 @@
+import uuid
+from unittest.mock import MagicMock, patch
+
+import pytest
+from httpx import AsyncClient
+
+from backend.app.routers.ai import upstream_urls
+from backend.app.routing import upstream_router
+from backend.app.upstream import UpstreamHealth, get_http_client, models_url, upstream_health
+
+
+def make_completion_response(content: str) -> MagicMock:
+    response = MagicMock()
+    response.status_code = 200
+    response.text = content
+    response.json.return_value = {"choices": [{"message": {"content": content}}]}
+    return response
+
+
+def test_circuit_opens_after_consecutive_failures():
+    """Test that the circuit opens after the failure threshold and resets on success"""
+    health = UpstreamHealth(failure_threshold=2, reset_seconds=60)
+    url = "https://a.example/api/v1/chat/completions"
+
+    health.record_failure(url, "timeout")
+    assert health.is_available(url)
+    health.record_failure(url, "timeout")
+    assert not health.is_available(url)
+
+    health.record_success(url)
+    assert health.is_available(url)
+    assert health.snapshot()[0]["state"] == "closed"
+
+
+def test_half_open_after_reset_timeout():
+    """Test that an open circuit lets traffic through again after the reset timeout"""
+    health = UpstreamHealth(failure_threshold=1, reset_seconds=0)
+    url = "https://a.example/api/v1/chat/completions"
+
+    health.record_failure(url, "HTTP 503")
+    assert health.snapshot()[0]["state"] == "half_open"
+    assert health.is_available(url)
+
+
+def test_ordered_prefers_healthy_and_fast_endpoints():
+    """Test that URLs are ordered by availability, then probe latency"""
+    health = UpstreamHealth(failure_threshold=1, reset_seconds=60)
+    slow, fast, broken, unknown = (f"https://{name}.example" for name in "abcd")
+
+    health.record_success(slow, latency_ms=300)
+    health.record_success(fast, latency_ms=50)
+    health.record_failure(broken, "ConnectError")
+
+    assert health.ordered([broken, unknown, slow, fast]) == [fast, slow, unknown, broken]
+
+
+def test_models_url():
+    assert (
+        models_url("https://openrouter.ai/api/v1/chat/completions")
+        == "https://openrouter.ai/api/v1/models"
+    )
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_chat_skips_preflight_and_uses_healthiest_url(client: AsyncClient):
+    """Test that /chat issues a single upstream call to the healthiest endpoint"""
+    # Without latency measured by the router, endpoints are ranked by their health
+    upstream_router.targets.clear()
+    urls = upstream_urls()
+    for url in urls:
+        upstream_health.record_success(url, latency_ms=500)
+    upstream_health.record_success(urls[-1], latency_ms=1)
+
+    with patch.object(get_http_client(), "post") as mock_post:
+        mock_post.return_value = make_completion_response("Hi there")
+        response = await client.post(
+            "/api/v1/chat", json={"message": "Hello", "session_id": str(uuid.uuid4())}
+        )
+
+    assert response.status_code == 200
+    assert response.json()["message"] == "Hi there"
+    mock_post.assert_called_once()
+    assert mock_post.call_args[0][0] == urls[-1]
+    assert mock_post.call_args[1]["json"]["messages"][-1]["content"] == "Hello"
+    upstream_health.endpoints.clear()
+    upstream_router.targets.clear()
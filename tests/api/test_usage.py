@@ -0,0 +1,94 @@
+import uuid
+from datetime import datetime
+from unittest.mock import patch
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.app.models import UsageDaily
+from backend.app.routing import upstream_router
+from backend.app.upstream import get_http_client, upstream_health
+from backend.app.usage import UsageAccumulator, resolve_usage, top_usage, usage_accumulator
+from tests.api.test_upstream import make_completion_response
+from tests.conftest import test_async_session as db_sessions
+
+
+def test_missing_usage_is_estimated():
+    reported = resolve_usage({"prompt_tokens": 30, "completion_tokens": 7, "cost": 0.002}, 99, "x")
+    assert reported == {
+        "prompt_tokens": 30,
+        "completion_tokens": 7,
+        "cost": 0.002,
+        "estimated": False,
+    }
+
+    estimated = resolve_usage(None, 42, "four words of answer")
+    assert estimated["prompt_tokens"] == 42
+    assert estimated["completion_tokens"] > 0
+    assert estimated["estimated"] is True
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_totals_are_added_to_the_stored_row(db_session: AsyncSession):
+    accumulator = UsageAccumulator(flush_interval=60, session_factory=db_sessions)
+    session_id = uuid.uuid4()
+    model = "test/usage-model"
+
+    accumulator.record(session_id, model, resolve_usage({"prompt_tokens": 10}, 0, "ok"), 100)
+    accumulator.record(session_id, model, resolve_usage({"prompt_tokens": 20}, 0, "ok"), 300)
+    assert accumulator.stats()["pending_keys"] == 1
+    assert await accumulator.flush() == 1
+    accumulator.record(
+        session_id,
+        model,
+        resolve_usage({"prompt_tokens": 30, "completion_tokens": 5, "cost": 0.5}, 0, "ok"),
+        200,
+    )
+    await accumulator.drain()
+
+    row = await db_session.scalar(select(UsageDaily).where(UsageDaily.session_id == session_id))
+    assert (row.requests, row.estimated_requests) == (3, 2)
+    assert (row.prompt_tokens, row.latency_ms, row.cost) == (60, 600, 0.5)
+
+    since = datetime.utcnow().date()
+    [entry] = [
+        e for e in await top_usage(db_session, "session", since, 500) if e["session"] == session_id
+    ]
+    assert entry["avg_prompt_tokens"] == 20.0
+    assert entry["avg_latency_ms"] == 200.0
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_chat_records_reported_usage(client: AsyncClient, db_session: AsyncSession):
+    upstream_router.targets.clear()
+    response = make_completion_response("Hello there")
+    response.json.return_value["usage"] = {"prompt_tokens": 17, "completion_tokens": 3}
+    session_id = uuid.uuid4()
+    model = "test/usage-chat-model"
+
+    with patch.object(get_http_client(), "post", return_value=response):
+        await client.post(
+            "/api/v1/chat",
+            json={
+                "message": "Hi",
+                "model": model,
+                "session_id": str(session_id),
+                "use_cache": False,
+            },
+        )
+    await usage_accumulator.flush()
+
+    row = await db_session.scalar(select(UsageDaily).where(UsageDaily.session_id == session_id))
+    assert (row.model, row.requests, row.estimated_requests) == (model, 1, 0)
+    assert (row.prompt_tokens, row.completion_tokens) == (17, 3)
+
+    top = await client.get("/api/v1/admin/usage/top", params={"group_by": "model", "days": 1})
+    assert top.status_code == 200
+    assert model in [entry["model"] for entry in top.json()["entries"]]
+
+    upstream_router.targets.clear()
+    upstream_health.endpoints.clear()
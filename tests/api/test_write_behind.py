@@ -0,0 +1,97 @@
+import asyncio
+import uuid
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.app.conversations import ConversationStore
+from backend.app.models import ChatMessage
+from backend.app.write_behind import ChatWriteBehind, turn_rows
+from tests.conftest import test_async_session as db_sessions
+
+
+async def count_messages(db_session: AsyncSession, session_id: uuid.UUID) -> int:
+    return await db_session.scalar(
+        select(func.count(ChatMessage.id)).where(ChatMessage.session_id == session_id)
+    )
+
+
+class FailingSession:
+    async def __aenter__(self):
+        raise ConnectionError("database down")
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_turns_are_flushed_in_batches(db_session: AsyncSession):
+    writer = ChatWriteBehind(batch_size=4, flush_interval=60, session_factory=db_sessions)
+    session_id = uuid.uuid4()
+
+    for i in range(3):
+        writer.enqueue(turn_rows(session_id, f"Question {i}", f"Answer {i}"))
+    assert writer.stats()["pending"] == 6
+    assert writer.lag_seconds() >= 0
+
+    # A full batch wakes the flusher without waiting for the interval
+    for _ in range(50):
+        if writer.batches:
+            break
+        await asyncio.sleep(0.01)
+    await writer.drain()
+
+    assert await count_messages(db_session, session_id) == 6
+    stats = writer.stats()
+    assert (stats["pending"], stats["flushed"], stats["batches"]) == (0, 6, 2)
+    assert stats["lag_ms"] == 0.0
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_failed_batch_is_kept_and_retried_without_duplicates(db_session: AsyncSession):
+    writer = ChatWriteBehind(batch_size=10, flush_interval=60, session_factory=FailingSession)
+    session_id = uuid.uuid4()
+    writer.enqueue(turn_rows(session_id, "Question", "Answer"))
+
+    assert await writer.flush() == 0
+    assert (writer.failures, writer.pending) == (1, 2)
+
+    writer.session_factory = db_sessions
+    rows = writer.pending_for(session_id)
+    assert await writer.flush() == 2
+    # Replaying the same rows (e.g. after an interrupted commit) is a no-op
+    writer.enqueue(rows)
+    await writer.drain()
+    assert await count_messages(db_session, session_id) == 2
+
+
+@pytest.mark.api
+@pytest.mark.asyncio
+async def test_history_includes_unflushed_turns(db_session: AsyncSession):
+    store = ConversationStore(max_sessions=1)
+    session_id = uuid.uuid4()
+    await store.append_turn(db_session, session_id, "Question", "Answer")
+
+    # Evicted from memory before the flusher ran
+    store.forget(session_id)
+    assert await store.history(db_session, session_id) == [
+        {"role": "user", "content": "Question"},
+        {"role": "assistant", "content": "Answer"},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_oldest_rows_are_dropped_beyond_max_pending():
+    writer = ChatWriteBehind(
+        batch_size=100, flush_interval=60, max_pending=3, session_factory=FailingSession
+    )
+    session_id = uuid.uuid4()
+    writer.enqueue(turn_rows(session_id, "Old", "Older"))
+    writer.enqueue(turn_rows(session_id, "New", "Newer"))
+
+    assert [row["content"] for row in writer.pending_for(session_id)] == ["Older", "New", "Newer"]
+    assert writer.stats()["dropped"] == 1
+    await writer.drain()
@@ -9,9 +9,13 @@ from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import NullPool
 
+from backend.app.admission import client_rate_limiter
 from backend.app.db import get_session
 from backend.app.main import app
 from backend.app.models import Base
+from backend.app.summarizer import conversation_summarizer
+from backend.app.usage import usage_accumulator
+from backend.app.write_behind import chat_write_behind
 
 # 从环境变量获取测试数据库配置
 DB_USER = os.environ.get("DB_USER", "postgres")
@@ -19,6 +23,8 @@ DB_PASSWORD = os.environ.get("DB_PASSWORD", "postgres")
 DB_HOST = os.environ.get("DB_HOST", "db")  # 在Docker环境中使用服务名称
 DB_PORT = os.environ.get("DB_PORT", "5432")
 DB_NAME = os.environ.get("DB_NAME", "ai_crud_test")
+# The upstream is mocked in the tests, but the endpoints refuse to run without a key
+os.environ.setdefault("OPENROUTER_API_KEY", "sk-or-v1-test")
 
 # 构建测试数据库URL
 TEST_DATABASE_URL = os.environ.get(
@@ -58,6 +64,10 @@ async def override_get_session() -> AsyncGenerator[AsyncSession, None]:
 
 # Apply the override
 app.dependency_overrides[get_session] = override_get_session
+# Buffered chat history, summaries and usage are written into the test database too
+chat_write_behind.session_factory = test_async_session
+conversation_summarizer.session_factory = test_async_session
+usage_accumulator.session_factory = test_async_session
 
 
 @pytest_asyncio.fixture(scope="session")
@@ -100,5 +110,7 @@ async def db_session(setup_database) -> AsyncGenerator[AsyncSession, None]:
 @pytest_asyncio.fixture
 async def client() -> AsyncGenerator[AsyncClient, None]:
     """Get a test client for FastAPI"""
+    # Every test starts with full rate-limit buckets
+    client_rate_limiter.buckets.clear()
     async with AsyncClient(app=app, base_url="http://test") as client:
         yield client
\ No newline at end of file
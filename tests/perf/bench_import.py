@@ -0,0 +1,80 @@
+"""
+Backend import benchmark: cold ``import backend.app.main`` in fresh interpreters
+
+Each run starts a new Python process, so nothing is cached between runs
+except the bytecode and the OS page cache. Reports the wall time of the
+import, what it printed, and the slowest backend modules by self time
+(from ``-X importtime``).
+
+    python -m tests.perf.bench_import
+    python -m tests.perf.bench_import --runs 20 --module backend.app.routers.ai
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+TIMER = (
+    "import time; started = time.perf_counter(); import {module}; "
+    "import sys; sys.stderr.write('IMPORT_MS %.3f\\n' % ((time.perf_counter() - started) * 1000))"
+)
+
+
+def run_once(module: str) -> Tuple[float, int, Dict[str, int]]:
+    """Import time in ms, bytes written to stdout and per-module self time in us"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", TIMER.format(module=module)],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    elapsed_ms = 0.0
+    self_us: Dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("IMPORT_MS "):
+            elapsed_ms = float(line.split()[1])
+        elif line.startswith("import time:") and "|" in line:
+            # import time: self [us] | cumulative | imported package
+            fields = line[len("import time:") :].split("|")
+            if fields[0].strip().isdigit():
+                self_us[fields[2].strip()] = int(fields[0])
+    return elapsed_ms, len(result.stdout.encode("utf-8")), self_us
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--module", default="backend.app.main")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--top", type=int, default=8, help="backend modules to list")
+    args = parser.parse_args()
+
+    # Warm-up run writes the bytecode caches
+    run_once(args.module)
+    times, stdout_bytes, totals = [], 0, {}
+    for _ in range(args.runs):
+        elapsed_ms, stdout_bytes, self_us = run_once(args.module)
+        times.append(elapsed_ms)
+        for name, us in self_us.items():
+            totals[name] = totals.get(name, 0) + us
+
+    print(
+        f"import {args.module}: median {statistics.median(times):.1f}ms  "
+        f"p95 {percentile(times, 0.95):.1f}ms  min {min(times):.1f}ms  "
+        f"stdout {stdout_bytes} bytes  ({args.runs} runs)"
+    )
+    backend = sorted(
+        ((us / args.runs, name) for name, us in totals.items() if name.startswith("backend.")),
+        reverse=True,
+    )
+    for us, name in backend[: args.top]:
+        print(f"  {us / 1000:7.2f}ms self  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Logging overhead benchmark: event-loop time spent in logging under concurrent load
+
+"direct" reproduces the old AI router (print() banners plus a StreamHandler
+writing to stdout on every call); "queued" and "queued-debug" go through
+backend.app.logging_config, at INFO and with the sampled per-request and
+per-chunk DEBUG records enabled. Every mode replays the same simulated chat
+requests concurrently and reports the time the loop spent inside logging
+calls and how late a 1 ms ticker woke up meanwhile.
+
+    python -m tests.perf.bench_logging --requests 2000 --concurrency 100
+    python -m tests.perf.bench_logging --sink /dev/null
+"""
+import argparse
+import asyncio
+import contextlib
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+from backend.app import logging_config
+from backend.app.logging_config import SampledLogger, start_logging, stop_logging
+
+logger = logging.getLogger("bench.ai")
+sampled_log = SampledLogger(logger)
+
+# Messages the old router printed for one chat request
+REQUEST_EVENTS = [
+    "使用请求指定的模型: anthropic/claude-3-haiku",
+    "Attempting OpenRouter request with API Key: sk-or-v1...cdef",
+    "Using model: 'anthropic/claude-3-haiku'",
+    "Attempt 1/2: Trying anthropic/claude-3-haiku at https://openrouter.ai/api/v1/chat/completions",
+    "Response status: 200 from https://openrouter.ai/api/v1/chat/completions",
+    "Successful response from anthropic/claude-3-haiku",
+    'Final response content: {"id":"gen-1","choices":[{"message":{"content":"' + "x" * 400,
+    "Got AI response: " + "y" * 100 + "...",
+]
+
+
+def direct_log(message: str) -> None:
+    """The removed console_log(): banner prints plus a synchronous handler"""
+    print(f"\n{'=' * 50}")
+    print(f"AI MODULE: {message}")
+    print(f"{'=' * 50}\n")
+    logger.info(message)
+
+
+def queued_log(message: str) -> None:
+    sampled_log.debug("%s", message)
+
+
+async def ticker(lateness: List[float], stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        expected = time.perf_counter() + 0.001
+        await asyncio.sleep(0.001)
+        lateness.append(max(time.perf_counter() - expected, 0.0))
+
+
+async def simulate(
+    log: Callable[[str], None], requests: int, concurrency: int, chunks: int
+) -> Dict[str, float]:
+    spent = 0.0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    def timed(message: str) -> None:
+        nonlocal spent
+        started = time.perf_counter()
+        log(message)
+        spent += time.perf_counter() - started
+
+    async def request(i: int) -> None:
+        nonlocal spent
+        async with semaphore:
+            for message in REQUEST_EVENTS:
+                timed(message)
+                await asyncio.sleep(0)
+            for chunk in range(chunks):
+                if log is queued_log:
+                    # Per-chunk records only exist in the new router
+                    started = time.perf_counter()
+                    sampled_log.debug("Stream chunk of %d chars from %s", 4, "bench")
+                    spent += time.perf_counter() - started
+                await asyncio.sleep(0)
+
+    lateness: List[float] = []
+    stop = asyncio.Event()
+    tick = asyncio.create_task(ticker(lateness, stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(request(i) for i in range(requests)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await tick
+    lateness.sort()
+    return {
+        "elapsed_ms": elapsed * 1000,
+        "logging_ms": spent * 1000,
+        "lag_p99_ms": lateness[int(len(lateness) * 0.99)] * 1000 if lateness else 0.0,
+        "lag_max_ms": lateness[-1] * 1000 if lateness else 0.0,
+    }
+
+
+@contextlib.contextmanager
+def redirected_stdout(path: str):
+    with open(path, "w", encoding="utf-8") as sink:
+        original, sys.stdout = sys.stdout, sink
+        try:
+            yield sink
+        finally:
+            sys.stdout = original
+
+
+def run_mode(mode: str, args) -> Dict[str, float]:
+    root = logging.getLogger()
+    with redirected_stdout(args.sink) as sink:
+        if mode == "direct":
+            handler = logging.StreamHandler(sink)
+            handler.setFormatter(logging.Formatter(logging_config.TEXT_FORMAT))
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+            try:
+                return asyncio.run(
+                    simulate(direct_log, args.requests, args.concurrency, args.chunks)
+                )
+            finally:
+                logger.removeHandler(handler)
+        start_logging(sink)
+        root.setLevel(logging.DEBUG if mode == "queued-debug" else logging.INFO)
+        logger.setLevel(logging.NOTSET)
+        log = queued_log if mode == "queued-debug" else (lambda message: logger.info(message))
+        try:
+            return asyncio.run(simulate(log, args.requests, args.concurrency, args.chunks))
+        finally:
+            stop_logging()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--chunks", type=int, default=50, help="stream chunks per request")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--sink", help="file standing in for stdout (default: a temp file)")
+    args = parser.parse_args()
+    if args.sink is None:
+        args.sink = os.path.join(tempfile.mkdtemp(), "bench-logging.log")
+
+    print(
+        f"{args.requests} requests x {len(REQUEST_EVENTS)} events + {args.chunks} chunks, "
+        f"concurrency {args.concurrency}, sink {args.sink}"
+    )
+    # queued-debug shows the cost of the sampled records, not of handlers at INFO
+    for mode in ["direct", "queued", "queued-debug"]:
+        runs = [run_mode(mode, args) for _ in range(args.repeat)]
+        median = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+        print(
+            f"{mode:<13} loop time in logging {median['logging_ms']:8.1f}ms  "
+            f"total {median['elapsed_ms']:8.1f}ms  "
+            f"ticker lag p99 {median['lag_p99_ms']:6.2f}ms  max {median['lag_max_ms']:6.2f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Metrics overhead benchmark: cost of recording on the request path
+
+Times histogram observations and counter increments in a tight loop, then
+the MetricsMiddleware around a no-op ASGI app against the bare app, and
+finally one scrape with a realistic number of series.
+
+    python -m tests.perf.bench_metrics
+    python -m tests.perf.bench_metrics --calls 1000000 --routes 40
+"""
+import argparse
+import asyncio
+import time
+from typing import Callable
+
+from backend.app.metrics import HTTP_BUCKETS, MetricsMiddleware, MetricsRegistry
+
+
+class FakeRoute:
+    path = "/api/v1/items/{item_id}"
+
+
+async def noop_app(scope, receive, send):
+    scope["route"] = FakeRoute
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def receive():
+    return {"type": "http.request", "body": b""}
+
+
+async def send(message):
+    pass
+
+
+def per_call_ns(fn: Callable[[], None], calls: int) -> float:
+    started = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - started) * 1e9 / calls
+
+
+async def per_request_ns(app, calls: int) -> float:
+    scope = {"type": "http", "method": "GET", "path": "/api/v1/items/1"}
+    started = time.perf_counter()
+    for _ in range(calls):
+        await app(dict(scope), receive, send)
+    return (time.perf_counter() - started) * 1e9 / calls
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=200_000)
+    parser.add_argument("--routes", type=int, default=20, help="routes in the scrape")
+    args = parser.parse_args()
+
+    registry = MetricsRegistry()
+    histogram = registry.histogram("bench_seconds", "", ["method", "route", "status"], HTTP_BUCKETS)
+    counter = registry.counter("bench_total", "", ["reason"])
+    observe = per_call_ns(lambda: histogram.observe(0.042, "GET", "/items", "200"), args.calls)
+    increment = per_call_ns(lambda: counter.inc("http_503"), args.calls)
+    print(f"histogram observe   {observe:8.0f} ns/call")
+    print(f"counter inc         {increment:8.0f} ns/call")
+
+    bare = asyncio.run(per_request_ns(noop_app, args.calls))
+    wrapped = asyncio.run(per_request_ns(MetricsMiddleware(noop_app), args.calls))
+    print(f"middleware overhead {wrapped - bare:8.0f} ns/request  (bare app {bare:.0f} ns)")
+
+    for route in range(args.routes):
+        for status in ("200", "404", "500"):
+            histogram.observe(0.01, "GET", f"/route/{route}", status)
+    started = time.perf_counter()
+    text = registry.render()
+    print(
+        f"scrape              {(time.perf_counter() - started) * 1000:8.2f} ms "
+        f"for {args.routes * 3} series, {len(text) / 1024:.0f} KiB"
+    )
+
+
+if __name__ == "__main__":
+    main()
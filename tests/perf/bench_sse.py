@@ -0,0 +1,124 @@
+"""
+SSE decoding microbenchmark: old string-splitting loop vs incremental decoder
+
+Replays a completion stream (synthetic by default, or a raw capture saved
+with e.g. ``curl -N ... > stream.txt``) split into network-sized chunks and
+reports the time to extract every content delta.
+
+    python -m tests.perf.bench_sse --events 20000
+    python -m tests.perf.bench_sse --events 20000 --max-chunk 262144
+    python -m tests.perf.bench_sse --file stream.txt --repeat 5
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import List
+
+from backend.app.sse import iter_content_deltas
+
+WORDS = "the model streams one token at a time 模型 逐个 输出 token 并 返回 结果".split()
+
+
+def synthetic_stream(events: int, rng: random.Random) -> bytes:
+    parts = [b": OPENROUTER PROCESSING\n\n"]
+    for i in range(events):
+        payload = {
+            "id": "gen-bench",
+            "model": "bench/model",
+            "choices": [{"index": 0, "delta": {"content": rng.choice(WORDS) + " "}}],
+        }
+        parts.append(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8"))
+    parts.append(b"data: [DONE]\n\n")
+    return b"".join(parts)
+
+
+def split_chunks(raw: bytes, rng: random.Random, max_chunk: int) -> List[bytes]:
+    """Cut the stream at arbitrary byte offsets like TCP reads do"""
+    chunks, position = [], 0
+    while position < len(raw):
+        size = rng.randint(1, max_chunk)
+        chunks.append(raw[position : position + size])
+        position += size
+    return chunks
+
+
+def legacy_deltas(chunks: List[bytes]) -> List[str]:
+    """The parsing loop chat_stream used before the incremental decoder"""
+    contents = []
+    buffer = ""
+    for raw in chunks:
+        buffer += raw.decode("utf-8", "ignore")
+        while "data:" in buffer:
+            parts = buffer.split("data:", 1)
+            if len(parts) < 2:
+                break
+            data_parts = parts[1].split("\n\n", 1)
+            if len(data_parts) < 2:
+                break
+            data = data_parts[0].strip()
+            buffer = data_parts[1]
+            if data == "[DONE]":
+                continue
+            try:
+                choices = json.loads(data).get("choices", [])
+                if choices:
+                    content = choices[0].get("delta", {}).get("content")
+                    if content is not None:
+                        contents.append(content)
+            except json.JSONDecodeError:
+                continue
+    return contents
+
+
+async def incremental_deltas(chunks: List[bytes]) -> List[str]:
+    async def source():
+        for chunk in chunks:
+            yield chunk
+
+    return [content async for content in iter_content_deltas(source())]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--events", type=int, default=20_000)
+    parser.add_argument("--file", help="raw SSE capture to replay instead of synthetic events")
+    parser.add_argument(
+        "--max-chunk",
+        type=int,
+        default=1500,
+        help="largest read size in bytes; bursts after a stall arrive as big reads",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    if args.file:
+        with open(args.file, "rb") as f:
+            raw = f.read()
+    else:
+        raw = synthetic_stream(args.events, rng)
+    chunks = split_chunks(raw, rng, args.max_chunk)
+    print(f"{len(raw) / 1024:.0f} KiB in {len(chunks)} chunks")
+
+    # The legacy loop decodes each chunk on its own (split UTF-8 is lost), so compare counts only
+    expected = asyncio.run(incremental_deltas(chunks))
+    for name, run in [
+        ("legacy split loop", lambda: legacy_deltas(chunks)),
+        ("incremental decoder", lambda: asyncio.run(incremental_deltas(chunks))),
+    ]:
+        best = float("inf")
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            deltas = run()
+            best = min(best, time.perf_counter() - started)
+        print(
+            f"{name:<20} {best * 1000:8.1f}ms  {len(deltas) / best:12,.0f} events/s  "
+            f"{'ok' if len(deltas) == len(expected) else 'MISMATCH'}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Time-to-first-token benchmark: fresh client per request vs shared pooled client
+
+"fresh" reproduces the old router behaviour (a new httpx.AsyncClient, and so a
+new DNS/TCP/TLS handshake, for every chat call); "pooled" reuses the client
+built by backend.app.upstream. Both stream the same completion.
+
+    python -m tests.perf.bench_ttft --requests 20
+    python -m tests.perf.bench_ttft --url http://127.0.0.1:9000/api/v1/chat/completions
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+from typing import Dict, List
+
+import httpx
+
+from backend.app.upstream import create_http_client
+
+DEFAULT_URL = os.environ.get("OPENROUTER_API_URL", "https://openrouter.ai/api/v1/chat/completions")
+
+
+async def measure_ttft(client: httpx.AsyncClient, url: str, headers: dict, payload: dict) -> float:
+    """Seconds from sending the request until the first content delta arrives"""
+    started = time.perf_counter()
+    async with client.stream("POST", url, json=payload, headers=headers) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                break
+            choices = json.loads(data).get("choices") or [{}]
+            if choices[0].get("delta", {}).get("content"):
+                return time.perf_counter() - started
+    return time.perf_counter() - started
+
+
+async def run_fresh(url: str, headers: dict, payload: dict, requests: int) -> List[float]:
+    samples = []
+    for _ in range(requests):
+        async with httpx.AsyncClient(timeout=60.0) as client:
+            samples.append(await measure_ttft(client, url, headers, payload))
+    return samples
+
+
+async def run_pooled(url: str, headers: dict, payload: dict, requests: int) -> List[float]:
+    samples = []
+    async with create_http_client() as client:
+        for _ in range(requests):
+            samples.append(await measure_ttft(client, url, headers, payload))
+    return samples
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    return {
+        "mean_ms": statistics.mean(ordered) * 1000,
+        "p50_ms": ordered[len(ordered) // 2] * 1000,
+        "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default=DEFAULT_URL)
+    parser.add_argument("--model", default=os.environ.get("MODEL_NAME", "anthropic/claude-3-haiku"))
+    parser.add_argument("--requests", type=int, default=10)
+    parser.add_argument("--api-key", default=os.environ.get("OPENROUTER_API_KEY", "local"))
+    args = parser.parse_args()
+
+    headers = {"Authorization": f"Bearer {args.api_key}", "Content-Type": "application/json"}
+    payload = {
+        "model": args.model,
+        "messages": [{"role": "user", "content": "Say hello"}],
+        "max_tokens": 20,
+        "stream": True,
+    }
+
+    results = {
+        "fresh client (before)": await run_fresh(args.url, headers, payload, args.requests),
+        "pooled client (after)": await run_pooled(args.url, headers, payload, args.requests),
+    }
+    for name, samples in results.items():
+        stats = summarize(samples)
+        print(
+            f"{name:<24} mean={stats['mean_ms']:8.1f}ms  "
+            f"p50={stats['p50_ms']:8.1f}ms  p95={stats['p95_ms']:8.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
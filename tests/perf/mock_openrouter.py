@@ -0,0 +1,374 @@
+"""
+Local OpenRouter stand-in: a chat completions API for offline load tests
+
+Serves POST /api/v1/chat/completions, streaming and non-streaming, with a
+configurable time to first token, generation speed and injected failures
+(5xx errors, 429 rate limits with Retry-After, streams cut off mid-answer),
+so routers/ai.py can be benchmarked through its real HTTP client and
+connection pool without spending credits. With --record it proxies every
+request to the real upstream and appends the response, with the arrival time
+of each stream chunk, to a JSON lines file; --replay serves those recordings
+round-robin with their original timing. GET /stats returns request counters.
+
+    python -m tests.perf.mock_openrouter --port 9000 --ttft 0.4 --tokens-per-second 60
+    python -m tests.perf.mock_openrouter --error-rate 0.05 --rate-limit-rate 0.1
+    python -m tests.perf.mock_openrouter --record streams.jsonl
+    python -m tests.perf.mock_openrouter --replay streams.jsonl --replay-speed 2
+
+Point the backend at it, without the real alternates:
+
+    OPENROUTER_API_URL=http://127.0.0.1:9000/api/v1/chat/completions \\
+    ALTERNATE_API_URLS='[]' uvicorn backend.app.main:app
+"""
+import argparse
+import asyncio
+import base64
+import itertools
+import json
+import os
+import random
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+import httpx
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from backend.app.context_builder import estimate_message_tokens
+
+DEFAULT_UPSTREAM_URL = "https://openrouter.ai/api/v1/chat/completions"
+COMPLETIONS_PATH = "/api/v1/chat/completions"
+
+WORDS = "the model streams one token at a time 模型 逐个 输出 token 并 返回 结果".split()
+
+
+@dataclass
+class MockConfig:
+    # Seconds until the first token, and generation speed (0 = as fast as possible)
+    ttft: float = 0.3
+    tokens_per_second: float = 50.0
+    # Tokens per answer, capped by the request's max_tokens
+    completion_tokens: int = 200
+    # Each delay is scaled by a random factor in [1 - jitter, 1 + jitter]
+    jitter: float = 0.0
+    # Shares of requests answered with error_status, with 429, or cut off mid-stream
+    error_rate: float = 0.0
+    error_status: int = 503
+    rate_limit_rate: float = 0.0
+    retry_after: int = 1
+    disconnect_rate: float = 0.0
+    seed: Optional[int] = None
+    # Proxy to upstream_url and append what it sends to record_path
+    record_path: Optional[str] = None
+    upstream_url: str = DEFAULT_UPSTREAM_URL
+    # Replaces the Authorization header of proxied requests when set
+    api_key: str = ""
+    # Serve the responses in replay_path, replay_speed times faster than recorded
+    replay_path: Optional[str] = None
+    replay_speed: float = 1.0
+
+
+@dataclass
+class Recording:
+    stream: bool
+    status: int
+    content_type: str
+    # (seconds since the request was sent, raw bytes) per chunk; one chunk if not streamed
+    chunks: List[Any] = field(default_factory=list)
+
+    def to_json(self) -> str:
+        chunks = [
+            [round(offset, 4), base64.b64encode(data).decode()] for offset, data in self.chunks
+        ]
+        return json.dumps(
+            {
+                "stream": self.stream,
+                "status": self.status,
+                "content_type": self.content_type,
+                "chunks": chunks,
+            }
+        )
+
+    @classmethod
+    def from_json(cls, line: str) -> "Recording":
+        entry = json.loads(line)
+        return cls(
+            stream=entry["stream"],
+            status=entry["status"],
+            content_type=entry["content_type"],
+            chunks=[(offset, base64.b64decode(data)) for offset, data in entry["chunks"]],
+        )
+
+
+def load_recordings(path: str) -> Dict[bool, Iterator[Recording]]:
+    """Streamed and non-streamed recordings of a file, each cycled round-robin"""
+    with open(path, encoding="utf-8") as f:
+        recordings = [Recording.from_json(line) for line in f if line.strip()]
+    return {
+        stream: itertools.cycle([r for r in recordings if r.stream == stream])
+        for stream in (True, False)
+        if any(r.stream == stream for r in recordings)
+    }
+
+
+def sse_data(payload: Any) -> bytes:
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+def error_body(status: int, message: str) -> Dict[str, Any]:
+    """Error payload in the shape OpenRouter uses"""
+    return {"error": {"code": status, "message": message}}
+
+
+class MockOpenRouter:
+    """Request handlers plus the counters reported by GET /stats"""
+
+    def __init__(self, config: MockConfig):
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.recordings = load_recordings(config.replay_path) if config.replay_path else None
+        self._proxy: Optional[httpx.AsyncClient] = None
+        self.stats = {
+            "requests": 0,
+            "streams": 0,
+            "errors": 0,
+            "rate_limited": 0,
+            "disconnects": 0,
+            "recorded": 0,
+            "replayed": 0,
+        }
+
+    def delay(self, seconds: float) -> float:
+        jitter = self.config.jitter
+        return seconds * self.rng.uniform(1 - jitter, 1 + jitter) if jitter else seconds
+
+    def answer_tokens(self, payload: Dict[str, Any]) -> List[str]:
+        count = self.config.completion_tokens
+        if isinstance(payload.get("max_tokens"), int):
+            count = min(count, payload["max_tokens"])
+        return [self.rng.choice(WORDS) + " " for _ in range(count)]
+
+    async def completions(self, request: Request) -> Response:
+        self.stats["requests"] += 1
+        payload = await request.json()
+        stream = bool(payload.get("stream"))
+        self.stats["streams"] += stream
+
+        if self.config.record_path:
+            return await self.proxy(request, payload, stream)
+        if self.recordings is not None:
+            return self.replay(stream)
+
+        if self.rng.random() < self.config.rate_limit_rate:
+            self.stats["rate_limited"] += 1
+            return JSONResponse(
+                error_body(429, "Rate limit exceeded"),
+                status_code=429,
+                headers={"Retry-After": str(self.config.retry_after)},
+            )
+        if self.rng.random() < self.config.error_rate:
+            self.stats["errors"] += 1
+            status = self.config.error_status
+            return JSONResponse(error_body(status, "Injected upstream error"), status_code=status)
+
+        tokens = self.answer_tokens(payload)
+        usage = {
+            "prompt_tokens": sum(estimate_message_tokens(m) for m in payload.get("messages", [])),
+            "completion_tokens": len(tokens),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        model = payload.get("model", "mock/model")
+        if stream:
+            include_usage = bool((payload.get("stream_options") or {}).get("include_usage"))
+            return StreamingResponse(
+                self.stream_answer(model, tokens, usage if include_usage else None),
+                media_type="text/event-stream",
+            )
+
+        await asyncio.sleep(self.delay(self.config.ttft))
+        if self.config.tokens_per_second:
+            await asyncio.sleep(self.delay(len(tokens) / self.config.tokens_per_second))
+        return JSONResponse(
+            {
+                "id": f"gen-mock-{uuid.uuid4().hex[:12]}",
+                "object": "chat.completion",
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": "".join(tokens)},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": usage,
+            }
+        )
+
+    async def stream_answer(
+        self, model: str, tokens: List[str], usage: Optional[Dict[str, int]]
+    ) -> AsyncIterator[bytes]:
+        """Completion chunks paced to the configured TTFT and tokens per second"""
+        generation_id = f"gen-mock-{uuid.uuid4().hex[:12]}"
+        cut_at = None
+        if self.rng.random() < self.config.disconnect_rate:
+            cut_at = self.rng.randrange(len(tokens)) if tokens else 0
+        # OpenRouter sends keep-alive comments while the model is still queued
+        yield b": OPENROUTER PROCESSING\n\n"
+        await asyncio.sleep(self.delay(self.config.ttft))
+        started = time.perf_counter()
+        for i, token in enumerate(tokens):
+            if i == cut_at:
+                self.stats["disconnects"] += 1
+                raise ConnectionResetError("Injected disconnect")
+            if self.config.tokens_per_second:
+                # Sleep until the token is due, so slow sleeps do not add up
+                due = started + self.delay(i / self.config.tokens_per_second)
+                if due > time.perf_counter():
+                    await asyncio.sleep(due - time.perf_counter())
+            yield sse_data(
+                {
+                    "id": generation_id,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+                }
+            )
+        yield sse_data(
+            {
+                "id": generation_id,
+                "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            }
+        )
+        if usage is not None:
+            yield sse_data({"id": generation_id, "model": model, "choices": [], "usage": usage})
+        yield b"data: [DONE]\n\n"
+
+    def replay(self, stream: bool) -> Response:
+        recordings = self.recordings.get(stream)
+        if recordings is None:
+            kind = "streamed" if stream else "non-streamed"
+            return JSONResponse(error_body(501, f"No {kind} responses recorded"), status_code=501)
+        recording = next(recordings)
+        self.stats["replayed"] += 1
+        return StreamingResponse(
+            self.replay_chunks(recording),
+            status_code=recording.status,
+            media_type=recording.content_type,
+        )
+
+    async def replay_chunks(self, recording: Recording) -> AsyncIterator[bytes]:
+        started = time.perf_counter()
+        for offset, data in recording.chunks:
+            due = started + offset / self.config.replay_speed
+            if due > time.perf_counter():
+                await asyncio.sleep(due - time.perf_counter())
+            yield data
+
+    async def proxy(self, request: Request, payload: Dict[str, Any], stream: bool) -> Response:
+        """Forward to the real upstream and record the response with its timing"""
+        if self._proxy is None:
+            self._proxy = httpx.AsyncClient(timeout=httpx.Timeout(120.0, connect=10.0))
+        authorization = (
+            f"Bearer {self.config.api_key}"
+            if self.config.api_key
+            else request.headers.get("authorization", "")
+        )
+        upstream_request = self._proxy.build_request(
+            "POST",
+            self.config.upstream_url,
+            json=payload,
+            headers={"Authorization": authorization, "Content-Type": "application/json"},
+        )
+        started = time.perf_counter()
+        response = await self._proxy.send(upstream_request, stream=True)
+        content_type = response.headers.get("content-type", "application/json").split(";")[0]
+        recording = Recording(stream, response.status_code, content_type)
+
+        async def relay() -> AsyncIterator[bytes]:
+            try:
+                async for data in response.aiter_raw():
+                    recording.chunks.append((time.perf_counter() - started, data))
+                    yield data
+            finally:
+                await response.aclose()
+                self.save(recording)
+
+        return StreamingResponse(relay(), status_code=response.status_code, media_type=content_type)
+
+    def save(self, recording: Recording) -> None:
+        with open(self.config.record_path, "a", encoding="utf-8") as f:
+            f.write(recording.to_json() + "\n")
+        self.stats["recorded"] += 1
+
+    async def read_stats(self, request: Request) -> Response:
+        return JSONResponse(self.stats)
+
+    async def close(self) -> None:
+        if self._proxy is not None:
+            await self._proxy.aclose()
+
+
+def create_app(config: Optional[MockConfig] = None) -> Starlette:
+    mock = MockOpenRouter(config or MockConfig())
+    app = Starlette(
+        routes=[
+            Route(COMPLETIONS_PATH, mock.completions, methods=["POST"]),
+            Route("/stats", mock.read_stats, methods=["GET"]),
+        ],
+        on_shutdown=[mock.close],
+    )
+    app.state.mock = mock
+    return app
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--ttft", type=float, default=0.3, help="seconds to the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="0 = unlimited")
+    parser.add_argument("--completion-tokens", type=int, default=200)
+    parser.add_argument("--jitter", type=float, default=0.0, help="e.g. 0.2 for +/-20%%")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of 429s")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--disconnect-rate", type=float, default=0.0, help="streams cut off")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--record", metavar="FILE", help="proxy to --upstream and record")
+    parser.add_argument("--upstream", default=DEFAULT_UPSTREAM_URL)
+    parser.add_argument("--api-key", default=os.environ.get("OPENROUTER_API_KEY", ""))
+    parser.add_argument("--replay", metavar="FILE", help="serve recorded responses")
+    parser.add_argument("--replay-speed", type=float, default=1.0)
+    args = parser.parse_args()
+    if args.record and args.replay:
+        parser.error("--record and --replay are mutually exclusive")
+
+    config = MockConfig(
+        ttft=args.ttft,
+        tokens_per_second=args.tokens_per_second,
+        completion_tokens=args.completion_tokens,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        disconnect_rate=args.disconnect_rate,
+        seed=args.seed,
+        record_path=args.record,
+        upstream_url=args.upstream,
+        api_key=args.api_key,
+        replay_path=args.replay,
+        replay_speed=args.replay_speed,
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()